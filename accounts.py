@@ -0,0 +1,89 @@
+import re
+import asyncio
+import zlib
+
+MAX_CAS_ATTEMPTS = 100
+
+# Разделитель в строке файла начислений: запятая, точка с запятой, табуляция или пробелы
+_ROW_SEPARATOR = re.compile(r'\s*[,;\t]\s*|\s+')
+
+
+# Фиксированный набор замков: пользователь попадает в замок по номеру.
+# Память не растет с числом пользователей, а изменения разных пользователей
+# почти всегда идут параллельно (совпадение полосы лишь ненадолго их упорядочит)
+class StripedLocks:
+    def __init__(self, stripes=256):
+        self._locks = [asyncio.Lock() for _ in range(stripes)]
+
+    def __call__(self, key):
+        return self._locks[zlib.crc32(str(key).encode()) % len(self._locks)]
+
+
+# Изменения данных одного пользователя. transaction(user_id) упорядочивает
+# многошаговые операции (прочитать состояние, проверить, записать) внутри
+# процесса; баланс меняется через compare-and-set, поэтому не теряет
+# изменений и от других процессов (BOT_WORKERS > 1), и от кода вне замка.
+#
+# Хранилище вызывается в потоке (asyncio.to_thread): между чтением баланса и
+# записью цикл событий обслуживает другие задачи. cas_conflicts — сколько раз
+# баланс успел измениться в этом окне и запись пришлось повторить.
+class Accounts:
+    def __init__(self, store, stripes=256):
+        self.store = store
+        self.locks = StripedLocks(stripes)
+        self.cas_conflicts = 0
+
+    def transaction(self, user_id):
+        # async with accounts.transaction(user_id): ...
+        # Замок не реентерабельный: внутри не берите transaction() еще раз
+        return self.locks(user_id)
+
+    async def change_balance(self, user_id, amount):
+        # Возвращает (старый баланс, новый баланс) или None, если пользователя нет;
+        # ValueError, если баланс ушел бы в минус. Замок не нужен — можно
+        # вызывать и внутри transaction()
+        for _ in range(MAX_CAS_ATTEMPTS):
+            current_balance = await asyncio.to_thread(self.store.get_balance, user_id)
+            if current_balance is None:
+                return None
+            new_balance = current_balance + amount
+            if new_balance < 0:
+                raise ValueError("negative balance")
+            if await asyncio.to_thread(self.store.compare_and_set_balance, user_id, current_balance, new_balance):
+                return current_balance, new_balance
+            self.cas_conflicts += 1
+        raise RuntimeError(f"Balance of user {user_id} keeps changing, giving up")
+
+    async def change_balances(self, changes):
+        # Пакет {user_id: сумма} одной транзакцией хранилища (см. add_balances)
+        return await asyncio.to_thread(self.store.add_balances, changes)
+
+
+def parse_balance_rows(text):
+    # Строки "user_id,amount" из CSV/TXT. Пустые строки, комментарии (#) и
+    # заголовок пропускаются. Возвращает ([(строка, user_id, сумма)], [(строка, причина)])
+    rows, errors = [], []
+    for line_number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = _ROW_SEPARATOR.split(line)
+        if len(parts) != 2:
+            errors.append((line_number, "нужно два поля: user_id и сумма"))
+            continue
+        user_id, amount = parts
+        if not user_id.isdigit():
+            if not rows and not errors:
+                continue  # заголовок
+            errors.append((line_number, f"неверный user_id: {user_id}"))
+            continue
+        try:
+            amount = int(amount)
+        except ValueError:
+            errors.append((line_number, f"неверная сумма: {amount}"))
+            continue
+        if amount == 0:
+            errors.append((line_number, "нулевая сумма"))
+            continue
+        rows.append((line_number, int(user_id), amount))
+    return rows, errors
@@ -0,0 +1,56 @@
+import os
+import logging
+
+from aiogram.types import FSInputFile
+from aiogram.exceptions import TelegramBadRequest
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_KEY = 'assets'
+
+
+# Картинки меню по логическому имени (welcome, order, ...). Первый раз фото
+# отправляется по ссылке или загружается из файла, а полученный file_id
+# запоминается в settings хранилища, дальше отправляется уже он. Если источник
+# картинки в настройках поменялся, старый file_id не используется.
+class AssetRegistry:
+    def __init__(self, store, sources):
+        self.store = store
+        self.sources = sources
+        self._cache = dict(store.get_setting(SETTINGS_KEY, {}))
+
+    def file_id(self, name):
+        cached = self._cache.get(name)
+        if cached and cached['source'] == self.sources[name]:
+            return cached['file_id']
+        return None
+
+    def _input(self, name):
+        source = self.sources[name]
+        return FSInputFile(source) if os.path.isfile(source) else source
+
+    def remember(self, name, message):
+        if not message or not message.photo:
+            return
+        file_id = message.photo[-1].file_id
+        if self.file_id(name) == file_id:
+            return
+        self._cache[name] = {'source': self.sources[name], 'file_id': file_id}
+        self.store.set_setting(SETTINGS_KEY, dict(self._cache))
+
+    def invalidate(self, name):
+        if self._cache.pop(name, None) is not None:
+            self.store.set_setting(SETTINGS_KEY, dict(self._cache))
+
+    async def answer_photo(self, message, name, **kwargs):
+        file_id = self.file_id(name)
+        if file_id is not None:
+            try:
+                return await message.answer_photo(photo=file_id, **kwargs)
+            except TelegramBadRequest as e:
+                # file_id устарел — отправляем заново из источника
+                logger.warning(f"Cached photo '{name}' rejected: {e}")
+                self.invalidate(name)
+        sent = await message.answer_photo(photo=self._input(name), **kwargs)
+        self.remember(name, sent)
+        return sent
@@ -0,0 +1,80 @@
+"""Сравнение форматов файла базы: размер, время записи и чтения.
+
+Форматы:
+  indent — json.dump(db, f, indent=4), как писал прежний save_db
+  json   — компактный JSON, как пишет JsonStore
+  binary — двоичный формат storage/binary_format.py (DB_BACKEND=binary)
+
+База генерируется так же, как в bench_storage.py. Запись — сериализация и
+сохранение с fsync, чтение — чтение файла и разбор; берется лучший из
+--repeat замеров. Перед замерами проверяется, что двоичный файл читается
+обратно без потерь.
+
+    python benchmarks/bench_format.py --sizes 10000 100000 1000000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_storage import generate  # noqa: E402
+from storage.binary_format import dumps, loads  # noqa: E402
+
+FORMATS = {
+    'indent': (lambda data: json.dumps(data, ensure_ascii=False, indent=4).encode('utf-8'), json.loads),
+    'json': (lambda data: json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'), json.loads),
+    'binary': (dumps, loads)
+}
+
+
+def save(path, data, encode):
+    started = time.perf_counter()
+    payload = encode(data)
+    with open(path, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    return time.perf_counter() - started
+
+
+def load(path, decode):
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        decode(f.read())
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--orders-per-user', type=float, default=2.0)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'users':>9} {'format':>8} {'size, MB':>9} {'save, s':>9} {'load, s':>9}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            source = os.path.join(workdir, 'source.json')
+            orders = generate(source, size, orders_per_user=args.orders_per_user)
+            with open(source, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if loads(dumps(data)) != data:
+                raise SystemExit("Binary round trip mismatch")
+            print(f"# {size} пользователей, {orders} заказов")
+            for name in args.formats:
+                encode, decode = FORMATS[name]
+                path = os.path.join(workdir, f"database.{name}")
+                save_seconds = min(save(path, data, encode) for _ in range(args.repeat))
+                load_seconds = min(load(path, decode) for _ in range(args.repeat))
+                print(f"{size:>9} {name:>8} {os.path.getsize(path) / 2 ** 20:>9.1f} "
+                      f"{save_seconds:>9.3f} {load_seconds:>9.3f}", flush=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+"""Микробенчмарки хранилища на синтетических базах разного размера.
+
+Для каждого размера генерируется database.json в текущей схеме (заказы со
+смесью статусов, как в жизни), переносится в каждый бэкенд, и в отдельном
+процессе на каждую операцию меряются время и пиковый RSS:
+  load   — открытие хранилища (бывший load_db)
+  save   — 100 изменений баланса и сброс на диск (бывший save_db)
+  lookup — поиск неоплаченного заказа пользователя, как в pay_with_cryptobot
+  stats  — полный пересчет статистики для «📊 Статистика бота»
+
+    python benchmarks/bench_storage.py --sizes 10000 100000 1000000
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BACKENDS = ('json', 'journal', 'binary', 'sqlite')
+PHASES = ('load', 'save', 'lookup', 'stats')
+
+# Доли статусов заказов: большинство завершено, часть так и не оплачена
+STATUS_MIX = (('completed', 0.45), ('pending_payment', 0.25), ('paid', 0.12),
+              ('processing', 0.08), ('rejected', 0.10))
+PLATFORMS = ("🎮 Kick", "📺 YouTube", "🟣 Twitch")
+SERVICES = (("Подписчики", 20, 10, 500), ("Живой чат RU", 319, 1, 5),
+            ("Живой чат ENG", 419, 1, 5), ("Зрители", 1, 10, 1000))
+SAVE_CHANGES = 100
+LOOKUPS = 2000
+
+
+def generate(path, users, seed=1, orders_per_user=2.0):
+    rng = random.Random(seed)
+    statuses = [status for status, _ in STATUS_MIX]
+    weights = [weight for _, weight in STATUS_MIX]
+    start = datetime.now() - timedelta(days=365)
+    data = {'users': {}, 'orders': {}, 'admins': [1], 'settings': {}}
+    order_id = 0
+    for index in range(users):
+        user_id = 100000 + index
+        registered = start + timedelta(seconds=rng.randrange(365 * 86400))
+        user_orders = []
+        for _ in range(min(20, int(rng.expovariate(1 / orders_per_user)))):
+            order_id += 1
+            service, price, low, high = rng.choice(SERVICES)
+            created = registered + timedelta(seconds=rng.randrange(86400 * 30))
+            status = rng.choices(statuses, weights)[0]
+            order = {
+                'user_id': user_id,
+                'platform': rng.choice(PLATFORMS),
+                'service': service,
+                'channel': f"channel{rng.randrange(users)}",
+                'date': created.strftime("%d.%m"),
+                'time': f"{rng.randrange(24):02d}:00",
+                'amount': price * rng.randint(low, high),
+                'status': status,
+                'created_at': created.strftime("%Y-%m-%d %H:%M:%S")
+            }
+            if status != 'pending_payment':
+                order['invoice_id'] = order_id
+                order['paid_at'] = (created + timedelta(minutes=5)).strftime("%Y-%m-%d %H:%M:%S")
+            data['orders'][str(order_id)] = order
+            user_orders.append(order_id)
+        data['users'][str(user_id)] = {
+            'balance': rng.choice((0, 0, 0, 100, 500)),
+            'orders': user_orders,
+            'registration_date': registered.strftime("%Y-%m-%d %H:%M:%S"),
+            'username': f"user{index}"
+        }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    return order_id
+
+
+def paths(workdir):
+    return {
+        'json_path': os.path.join(workdir, 'database.json'),
+        'sqlite_path': os.path.join(workdir, 'database.sqlite3'),
+        'binary_path': os.path.join(workdir, 'database.bin'),
+        'journal_path': os.path.join(workdir, 'database.journal')
+    }
+
+
+def prepare(backend, source, workdir):
+    # Копия исходной базы в формате бэкенда в отдельном каталоге
+    from storage import migrate_json_to_sqlite
+    from storage.binary_format import convert
+
+    target = paths(workdir)
+    if backend in ('json', 'journal'):
+        os.link(source, target['json_path'])
+    elif backend == 'binary':
+        convert(source, target['binary_path'])
+    elif backend == 'sqlite':
+        migrate_json_to_sqlite(source, target['sqlite_path'])
+
+
+def open_store(backend, workdir):
+    from storage import create_store
+
+    target = paths(workdir)
+    # Фоновый сброс отключен, чтобы он не попадал в замеры
+    return create_store(backend, target['json_path'], target['sqlite_path'], flush_interval=3600,
+                        flush_threshold=10 ** 9, journal_path=target['journal_path'],
+                        binary_path=target['binary_path'])
+
+
+def peak_rss():
+    # VmHWM сбрасывается при exec, а ru_maxrss в Linux наследуется от
+    # родителя, который держал в памяти сгенерированную базу
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def run_phase(backend, workdir, phase):
+    # Выполняется в отдельном процессе: пиковый RSS относится только к этой операции
+    from stats import StatsAggregator
+
+    started = time.perf_counter()
+    store = open_store(backend, workdir)
+    elapsed = time.perf_counter() - started
+    rng = random.Random(2)
+    user_ids = [100000 + rng.randrange(store.count_users()) for _ in range(max(LOOKUPS, SAVE_CHANGES))]
+
+    if phase == 'save':
+        started = time.perf_counter()
+        for user_id in user_ids[:SAVE_CHANGES]:
+            store.add_balance(user_id, 1)
+        store.flush()
+        elapsed = time.perf_counter() - started
+    elif phase == 'lookup':
+        started = time.perf_counter()
+        for user_id in user_ids[:LOOKUPS]:
+            store.find_user_orders(user_id, status='pending_payment')
+        elapsed = (time.perf_counter() - started) / LOOKUPS
+    elif phase == 'stats':
+        started = time.perf_counter()
+        stats = StatsAggregator()
+        stats.rebuild(store)
+        stats.last_days(7)
+        elapsed = time.perf_counter() - started
+    peak = peak_rss()
+    store.close()
+    return {'seconds': elapsed, 'peak_rss': peak}
+
+
+def measure(backend, workdir, phase):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--child', backend, workdir, phase],
+        check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def format_row(size, backend, results):
+    load, save, lookup, stats = (results[phase] for phase in PHASES)
+    peak = max(result['peak_rss'] for result in results.values())
+    return (f"{size:>9} {backend:>8} {load['seconds']:>9.3f} {load['peak_rss'] / 2 ** 20:>9.0f} "
+            f"{save['seconds'] * 1000:>9.1f} {lookup['seconds'] * 1e6:>10.1f} "
+            f"{stats['seconds']:>9.3f} {peak / 2 ** 20:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument('--orders-per-user', type=float, default=2.0)
+    parser.add_argument('--child', nargs=3, metavar=('BACKEND', 'DIR', 'PHASE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_phase(*args.child)))
+        return
+
+    print(f"{'users':>9} {'backend':>8} {'load, s':>9} {'RSS, MB':>9} {'save, ms':>9} "
+          f"{'lookup, us':>10} {'stats, s':>9} {'peak, MB':>10}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as workdir:
+            source = os.path.join(workdir, 'source.json')
+            orders = generate(source, size, orders_per_user=args.orders_per_user)
+            print(f"# {size} пользователей, {orders} заказов, database.json {os.path.getsize(source) / 2 ** 20:.0f} МБ")
+            for backend in args.backends:
+                backend_dir = os.path.join(workdir, backend)
+                os.mkdir(backend_dir)
+                prepare(backend, source, backend_dir)
+                results = {phase: measure(backend, backend_dir, phase) for phase in PHASES}
+                print(format_row(size, backend, results), flush=True)
+
+
+if __name__ == '__main__':
+    main()
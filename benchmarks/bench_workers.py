@@ -0,0 +1,112 @@
+"""Пропускная способность обработки обновлений: 1 процесс против N.
+
+Каждый синтетический пользователь проходит оформление заказа целиком
+(/start → услуга → дата → время → канал → подтверждение → профиль), поэтому
+порядок его обновлений важен. Бот работает против заглушки Bot API,
+база и FSM — SQLite во временном каталоге.
+
+    python benchmarks/bench_workers.py --users 300 --rounds 2 --workers 1 2 4
+"""
+import os
+import sys
+import time
+import sqlite3
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram, message_update
+
+ORDER_FLOW = ["/start", "🛍️ Заказать услугу", "🎮 Kick", "Подписчики", "15.06", "14:00",
+              "BenchChannel", "✅ Подтвердить", "👤 Профиль"]
+
+
+def make_updates(users, rounds):
+    # Обновления перемешаны между пользователями, но у каждого идут по порядку
+    updates = []
+    update_id = 0
+    for _ in range(rounds):
+        for text in ORDER_FLOW:
+            for index in range(users):
+                user_id = 100000 + index
+                update_id += 1
+                updates.append(message_update(update_id, user_id, text, f"bench{index}"))
+    return updates
+
+
+async def run(workers, updates, latency):
+    from workers import WorkerPool
+
+    telegram = FakeTelegram(latency=latency)
+    os.environ['TELEGRAM_API_URL'] = await telegram.start()
+    done = multiprocessing.get_context('spawn').Queue()
+    pool = WorkerPool('main', workers, max_in_flight=100, global_rate=1000, done_queue=done)
+    pool.start()
+    loop = asyncio.get_running_loop()
+    try:
+        # Прогрев: процессы импортируют бота и открывают базу
+        await loop.run_in_executor(None, _wait_ready, pool, done, workers)
+        started = time.perf_counter()
+        for update in updates:
+            pool.route(update)
+        await loop.run_in_executor(None, _wait_done, done, len(updates))
+        elapsed = time.perf_counter() - started
+    finally:
+        await loop.run_in_executor(None, pool.stop)
+        await telegram.stop()
+    return elapsed, sum(telegram.calls.values())
+
+
+def _wait_ready(pool, done, workers):
+    # Пользователь с номером index попадает в процесс index % workers
+    for index in range(workers):
+        pool.route(message_update(0, index, 'ping'))
+    for _ in range(workers):
+        done.get()
+
+
+def _wait_done(done, count):
+    for _ in range(count):
+        done.get()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=300)
+    parser.add_argument('--rounds', type=int, default=2)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, os.cpu_count() or 2])
+    parser.add_argument('--latency', type=float, default=0.005, help="задержка ответа Bot API, с")
+    args = parser.parse_args()
+
+    updates = make_updates(args.users, args.rounds)
+    print(f"{len(updates)} обновлений, {args.users} пользователей, задержка API {args.latency * 1000:.0f} мс")
+    print(f"{'процессов':>10} {'время, с':>10} {'обн/с':>10} {'вызовов API':>12} {'заказов':>9}")
+    baseline = None
+    for workers in args.workers:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            os.environ.update({
+                'TELEGRAM_BOT_TOKEN': '123456:BENCH',
+                'DB_BACKEND': 'sqlite',
+                'SQLITE_DB_FILE': os.path.join(workdir, 'database.sqlite3'),
+                'FSM_STORAGE': 'sqlite',
+                'FSM_SQLITE_FILE': os.path.join(workdir, 'fsm.sqlite3'),
+                'INVOICE_POLL_INTERVAL': '3600'
+            })
+            elapsed, api_calls = asyncio.run(run(workers, updates, args.latency))
+            with sqlite3.connect(os.environ['SQLITE_DB_FILE']) as conn:
+                orders = conn.execute("SELECT COUNT(*) FROM orders").fetchone()[0]
+            os.chdir(ROOT)
+        rate = len(updates) / elapsed
+        baseline = baseline or rate
+        print(f"{workers:>10} {elapsed:>10.2f} {rate:>10.0f} {api_calls:>12} {orders:>9}  x{rate / baseline:.2f}")
+    print(f"Ожидается заказов: {args.users * args.rounds}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import asyncio
+import itertools
+from collections import Counter
+from datetime import datetime, timezone
+
+from aiohttp import web
+
+
+def _now_iso():
+    return datetime.now(timezone.utc).isoformat()
+
+
+# Заглушка Crypto Pay API (pay.crypt.bot): createInvoice, getInvoices,
+# getExchangeRates. Счета хранятся в памяти, pay() помечает счет оплаченным —
+# бот узнает об этом при следующем опросе getInvoices.
+# Бот направляется на нее через CRYPTO_BOT_API_URL=http://127.0.0.1:<port>/api
+class FakeCryptoPay:
+    def __init__(self, token='bench', latency=0.0, usdt_rub=90.0):
+        self.token = token
+        self.latency = latency
+        self.usdt_rub = usdt_rub
+        self.calls = Counter()
+        self.invoices = {}
+        self.by_payload = {}
+        self._invoice_ids = itertools.count(1)
+        self._runner = None
+        self.url = None
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/api/{method}', self.handle)
+        app.router.add_get('/api/{method}', self.handle)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}/api"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def pay(self, invoice_id):
+        invoice = self.invoices[invoice_id]
+        invoice['status'] = 'paid'
+        invoice['paid_at'] = _now_iso()
+        return invoice
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] += 1
+        if request.headers.get('Crypto-Pay-API-Token') != self.token:
+            return web.json_response({'ok': False, 'error': {'code': 401, 'name': 'UNAUTHORIZED'}}, status=401)
+        params = await request.json() if request.can_read_body else {}
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        handler = getattr(self, f"_{method}", None)
+        if handler is None:
+            return web.json_response({'ok': False, 'error': {'code': 405, 'name': 'METHOD_NOT_FOUND'}}, status=405)
+        return web.json_response({'ok': True, 'result': handler(params)})
+
+    def _createInvoice(self, params):
+        invoice_id = next(self._invoice_ids)
+        invoice = {
+            'invoice_id': invoice_id,
+            'hash': f"IV{invoice_id}",
+            'status': 'active',
+            'asset': params.get('asset', 'USDT'),
+            'amount': str(params['amount']),
+            'description': params.get('description'),
+            'payload': params.get('payload'),
+            'pay_url': f"https://t.me/CryptoBot?start=IV{invoice_id}",
+            'created_at': _now_iso()
+        }
+        self.invoices[invoice_id] = invoice
+        self.by_payload[invoice['payload']] = invoice_id
+        return invoice
+
+    def _getInvoices(self, params):
+        ids = [int(invoice_id) for invoice_id in str(params.get('invoice_ids') or '').split(',') if invoice_id]
+        items = [self.invoices[invoice_id] for invoice_id in ids if invoice_id in self.invoices]
+        return {'items': items}
+
+    def _getExchangeRates(self, params):
+        return [
+            {'is_valid': True, 'is_crypto': True, 'is_fiat': False, 'source': 'USDT', 'target': 'RUB',
+             'rate': str(self.usdt_rub)},
+            {'is_valid': True, 'is_crypto': True, 'is_fiat': False, 'source': 'USDT', 'target': 'USD',
+             'rate': '1.0'}
+        ]
+
+    def _getMe(self, params):
+        return {'app_id': 1, 'name': 'Bench', 'payment_processing_bot_username': 'CryptoBot'}
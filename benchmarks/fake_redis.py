@@ -0,0 +1,191 @@
+import time
+import asyncio
+from collections import Counter
+
+
+class _CommandError(Exception):
+    pass
+
+
+# Заглушка Redis-совместимого сервера (протокол RESP) для проверки
+# RedisStorage без настоящего Redis: GET/SET с EX/PX, MGET, DEL,
+# EXPIRE/PEXPIRE, PERSIST, TTL/PTTL. Ключи хранятся в памяти, истекшие
+# удаляются при обращении — как в Redis, EXPIRE с нулевым сроком удаляет ключ,
+# а SET с нулевым EX/PX возвращает ошибку.
+# Бот направляется на нее через FSM_STORAGE=redis и FSM_REDIS_URL=redis://127.0.0.1:<port>/0
+class FakeRedis:
+    def __init__(self, password=None):
+        self.password = password
+        self.calls = Counter()
+        self.data = {}
+        self._expires = {}
+        self._server = None
+        self._writers = set()
+        self.url = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._server = await asyncio.start_server(self._serve, host, port)
+        port = self._server.sockets[0].getsockname()[1]
+        auth = f":{self.password}@" if self.password else ''
+        self.url = f"redis://{auth}{host}:{port}/0"
+        return self.url
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in list(self._writers):
+                writer.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    # Протокол
+
+    async def _serve(self, reader, writer):
+        authorized = not self.password
+        self._writers.add(writer)
+        try:
+            while True:
+                command = await self._read_command(reader)
+                if command is None:
+                    break
+                name = command[0].decode().upper()
+                self.calls[name] += 1
+                try:
+                    if name == 'AUTH':
+                        if command[-1].decode() != self.password:
+                            raise _CommandError("WRONGPASS invalid password")
+                        authorized = True
+                        reply = 'OK'
+                    elif not authorized:
+                        raise _CommandError("NOAUTH Authentication required.")
+                    else:
+                        handler = getattr(self, f"_{name.lower()}", None)
+                        if handler is None:
+                            raise _CommandError(f"ERR unknown command '{name}'")
+                        reply = handler(*command[1:])
+                except _CommandError as e:
+                    reply = e
+                writer.write(self._encode(reply))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+
+    @staticmethod
+    async def _read_command(reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        if line[:1] != b"*":
+            raise ConnectionError(f"unexpected request: {line!r}")
+        command = []
+        for _ in range(int(line[1:-2])):
+            header = await reader.readline()
+            value = await reader.readexactly(int(header[1:-2]) + 2)
+            command.append(value[:-2])
+        return command
+
+    @classmethod
+    def _encode(cls, reply):
+        if isinstance(reply, _CommandError):
+            return f"-{reply}\r\n".encode()
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, str):
+            return f"+{reply}\r\n".encode()
+        if isinstance(reply, int):
+            return f":{reply}\r\n".encode()
+        if isinstance(reply, bytes):
+            return f"${len(reply)}\r\n".encode() + reply + b"\r\n"
+        return f"*{len(reply)}\r\n".encode() + b"".join(cls._encode(item) for item in reply)
+
+    # Ключи
+
+    def _alive(self, key):
+        expires_at = self._expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self.data
+
+    def _set_expiry(self, key, ms):
+        if ms <= 0:
+            self.data.pop(key, None)
+            self._expires.pop(key, None)
+        else:
+            self._expires[key] = time.monotonic() + ms / 1000
+
+    @staticmethod
+    def _int(value):
+        try:
+            return int(value)
+        except ValueError:
+            raise _CommandError("ERR value is not an integer or out of range")
+
+    # Команды
+
+    def _ping(self, *args):
+        return args[0] if args else 'PONG'
+
+    def _select(self, db):
+        return 'OK'
+
+    def _get(self, key):
+        return self.data[key] if self._alive(key) else None
+
+    def _mget(self, *keys):
+        return [self._get(key) for key in keys]
+
+    def _set(self, key, value, *options):
+        ms = None
+        options = list(options)
+        while options:
+            option = options.pop(0).decode().upper()
+            if option not in ('EX', 'PX') or not options:
+                raise _CommandError("ERR syntax error")
+            amount = self._int(options.pop(0))
+            if amount <= 0:
+                raise _CommandError("ERR invalid expire time in 'set' command")
+            ms = amount * 1000 if option == 'EX' else amount
+        self.data[key] = value
+        self._expires.pop(key, None)
+        if ms is not None:
+            self._set_expiry(key, ms)
+        return 'OK'
+
+    def _del(self, *keys):
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                del self.data[key]
+                self._expires.pop(key, None)
+                removed += 1
+        return removed
+
+    def _pexpire(self, key, ms):
+        if not self._alive(key):
+            return 0
+        self._set_expiry(key, self._int(ms))
+        return 1
+
+    def _expire(self, key, seconds):
+        return self._pexpire(key, self._int(seconds) * 1000)
+
+    def _persist(self, key):
+        if not self._alive(key):
+            return 0
+        return 1 if self._expires.pop(key, None) is not None else 0
+
+    def _pttl(self, key):
+        if not self._alive(key):
+            return -2
+        expires_at = self._expires.get(key)
+        if expires_at is None:
+            return -1
+        return max(0, int((expires_at - time.monotonic()) * 1000))
+
+    def _ttl(self, key):
+        ms = self._pttl(key)
+        return ms if ms < 0 else (ms + 500) // 1000
@@ -0,0 +1,108 @@
+import time
+import asyncio
+import itertools
+from collections import Counter
+
+from aiohttp import web
+
+
+def message_update(update_id, user_id, text, username=None):
+    # Обновление с текстовым сообщением пользователя в личном чате
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Bench', 'username': username or f"user{user_id}"},
+            'text': text
+        }
+    }
+
+
+# Заглушка Telegram Bot API для бенчмарков: отвечает на любой метод
+# правдоподобным результатом, считает вызовы и может добавлять задержку сети.
+# Чаты из blocked отвечают 403, как пользователь, заблокировавший бота.
+# Бот направляется на нее через TELEGRAM_API_URL=http://127.0.0.1:<port>
+class FakeTelegram:
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.blocked = set()
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._updates = asyncio.Queue()
+        self._runner = None
+        self.url = None
+
+    def push_update(self, update):
+        # Обновление, которое бот получит через getUpdates
+        self._updates.put_nowait(update)
+
+    def app(self):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._runner = web.AppRunner(self.app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        self.calls[method] += 1
+        params = await request.post()
+        if method == 'getUpdates':
+            return web.json_response({'ok': True, 'result': await self._get_updates(params)})
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if int(params.get('chat_id') or 0) in self.blocked:
+            return web.json_response({'ok': False, 'error_code': 403,
+                                      'description': "Forbidden: bot was blocked by the user"}, status=403)
+        return web.json_response({'ok': True, 'result': self._result(method, params)})
+
+    async def _get_updates(self, params):
+        timeout = float(params.get('timeout') or 0)
+        updates = []
+        try:
+            updates.append(await asyncio.wait_for(self._updates.get(), timeout))
+        except asyncio.TimeoutError:
+            return updates
+        while not self._updates.empty() and len(updates) < 100:
+            updates.append(self._updates.get_nowait())
+        return updates
+
+    def _result(self, method, params):
+        if method == 'getMe':
+            return {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        if method == 'copyMessage':
+            return {'message_id': next(self._message_ids)}
+        if not method.startswith(('send', 'edit')):
+            return True
+        chat_id = int(params.get('chat_id') or 0)
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'}
+        }
+        if method == 'sendPhoto':
+            file_id = f"photo{next(self._file_ids)}"
+            message['photo'] = [{'file_id': file_id, 'file_unique_id': file_id, 'width': 640, 'height': 480}]
+            if params.get('caption'):
+                message['caption'] = params['caption']
+        elif method == 'sendDocument':
+            file_id = f"document{next(self._file_ids)}"
+            message['document'] = {'file_id': file_id, 'file_unique_id': file_id}
+        else:
+            message['text'] = params.get('text') or ''
+        return message
@@ -0,0 +1,163 @@
+"""Сквозной нагрузочный тест бота на заглушках Telegram Bot API и Crypto Pay.
+
+Каждый пользователь проходит весь путь: /start → «Заказать услугу» →
+платформа → услуга → дата → время → канал → «Подтвердить» → «Оплатить
+CryptoBot» → оплата счета. Оплату бот подтверждает сам, опрашивая
+getInvoices. Отчет: обновлений в секунду, p50/p95/p99 времени обработки
+обновления (в целом и по шагам), время подтверждения оплат и число
+исходящих вызовов по методам API.
+
+    python benchmarks/load_test.py --users 2000 --concurrency 200 --backend json
+"""
+import os
+import sys
+import math
+import time
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_telegram import FakeTelegram, message_update
+from fake_cryptopay import FakeCryptoPay
+
+ADMIN_ID = 1
+FIRST_USER_ID = 100000
+
+
+def order_flow(index):
+    return ["/start", "🛍️ Заказать услугу", "🎮 Kick", "Подписчики", "15.06", "14:00",
+            f"Channel{index}", "✅ Подтвердить", "💰 Оплатить CryptoBot"]
+
+
+def percentile(samples, share):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+
+class LoadTest:
+    def __init__(self, app, telegram, crypto, users, concurrency):
+        self.app = app
+        self.telegram = telegram
+        self.crypto = crypto
+        self.users = users
+        self.concurrency = concurrency
+        self.latency = defaultdict(list)
+        self.errors = 0
+        self._update_ids = iter(range(1, 10 ** 9))
+
+    async def feed(self, user_id, text):
+        from aiogram import types
+
+        update = types.Update.model_validate(message_update(next(self._update_ids), user_id, text),
+                                             context={'bot': self.app.bot})
+        started = time.perf_counter()
+        try:
+            await self.app.dp.feed_update(self.app.bot, update)
+        except Exception:
+            self.errors += 1
+        self.latency[text if not text.startswith('Channel') else 'канал'].append(time.perf_counter() - started)
+
+    async def user(self, index, semaphore):
+        user_id = FIRST_USER_ID + index
+        async with semaphore:
+            for text in order_flow(index):
+                await self.feed(user_id, text)
+        # Пользователь оплачивает счет в CryptoBot
+        invoice_id = self.crypto.by_payload.get(str(user_id))
+        if invoice_id is not None:
+            self.crypto.pay(invoice_id)
+
+    def paid_orders(self):
+        return self.app.stats.by_status['paid']
+
+    async def run(self, confirm_timeout):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        started = time.perf_counter()
+        await asyncio.gather(*(self.user(index, semaphore) for index in range(self.users)))
+        interactive = time.perf_counter() - started
+
+        # Ждем, пока опрос счетов подтвердит все оплаты
+        paid_started = time.perf_counter()
+        while self.paid_orders() < self.users and time.perf_counter() - paid_started < confirm_timeout:
+            await asyncio.sleep(0.05)
+        confirm = time.perf_counter() - paid_started
+        return interactive, confirm
+
+    def report(self, interactive, confirm):
+        samples = [value for values in self.latency.values() for value in values]
+        print(f"\nПользователей: {self.users}, одновременно: {self.concurrency}")
+        print(f"Обновлений: {len(samples)} за {interactive:.2f} с — {len(samples) / interactive:.0f} обн/с, "
+              f"ошибок {self.errors}")
+        print(f"Задержка обработки, мс: p50 {percentile(samples, 0.5) * 1000:.1f}  "
+              f"p95 {percentile(samples, 0.95) * 1000:.1f}  p99 {percentile(samples, 0.99) * 1000:.1f}")
+        print(f"\n{'шаг':<24} {'p50':>8} {'p95':>8} {'p99':>8}")
+        for step, values in self.latency.items():
+            print(f"{step:<24} {percentile(values, 0.5) * 1000:>8.1f} {percentile(values, 0.95) * 1000:>8.1f} "
+                  f"{percentile(values, 0.99) * 1000:>8.1f}")
+        print(f"\nОплачено заказов: {self.paid_orders()} из {self.users}, подтверждение заняло {confirm:.2f} с")
+        print("\nИсходящие вызовы:")
+        for api, calls in (('Bot API', self.telegram.calls), ('Crypto Pay', self.crypto.calls)):
+            for method, count in calls.most_common():
+                print(f"  {api:<11} {method:<20} {count:>8}")
+
+
+async def main_async(args):
+    telegram = FakeTelegram(latency=args.telegram_latency)
+    crypto = FakeCryptoPay(latency=args.cryptopay_latency)
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:BENCH',
+        'TELEGRAM_API_URL': await telegram.start(),
+        'CRYPTO_BOT_TOKEN': crypto.token,
+        'CRYPTO_BOT_API_URL': await crypto.start(),
+        'DB_BACKEND': args.backend,
+        'ADMIN_IDS': str(ADMIN_ID),
+        'INVOICE_POLL_INTERVAL': str(args.poll_interval),
+        # Уведомления об оплате уходят одному админу: лимит на чат снят, чтобы
+        # очередь не растягивала тест на тысячи секунд
+        'OUTBOX_PER_CHAT_RATE': '1000',
+        'OUTBOX_GLOBAL_RATE': '1000'
+    })
+    import main as app
+
+    await app.dp.emit_startup(bot=app.bot)
+    test = LoadTest(app, telegram, crypto, args.users, args.concurrency)
+    try:
+        interactive, confirm = await test.run(args.confirm_timeout)
+    finally:
+        # Остановка дожидается отправки уведомлений из очереди
+        await app.dp.emit_shutdown(bot=app.bot)
+        await telegram.stop()
+        await crypto.stop()
+    test.report(interactive, confirm)
+    return test.errors == 0 and test.paid_orders() == args.users
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--backend', choices=('json', 'journal', 'sqlite'), default='json')
+    parser.add_argument('--telegram-latency', type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument('--cryptopay-latency', type=float, default=0.0, help="задержка ответа Crypto Pay, с")
+    parser.add_argument('--poll-interval', type=float, default=0.5, help="INVOICE_POLL_INTERVAL, с")
+    parser.add_argument('--confirm-timeout', type=float, default=60.0)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        try:
+            ok = asyncio.run(main_async(args))
+        finally:
+            os.chdir(ROOT)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Нагрузочная проверка изменений баланса: тысячи одновременных операций.
+
+Часть операций идет через accounts.transaction(), часть — напрямую через
+compare-and-set. Хранилище вызывается в потоке, так что между чтением
+баланса и записью задачи переключаются; "конфликтов" — сколько записей
+CAS отклонил и повторил (ноль значил бы, что окна гонки нет). В конце
+баланс каждого пользователя должен совпасть с суммой принятых изменений,
+а отклоненных (ушел бы в минус) — не появиться. Для sqlite то же
+повторяется из нескольких процессов над одной базой.
+
+    python benchmarks/stress_balance.py --users 50 --ops 20000 --processes 4
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import multiprocessing
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage import create_store
+from accounts import Accounts
+
+
+def make_ops(users, count, seed):
+    rng = random.Random(seed)
+    return [(rng.randrange(users), rng.randint(-60, 100), rng.random() < 0.5) for _ in range(count)]
+
+
+async def apply_ops(accounts, ops):
+    accepted = defaultdict(int)
+    rejected = 0
+
+    async def one(user_id, amount, in_transaction):
+        nonlocal rejected
+        try:
+            if in_transaction:
+                async with accounts.transaction(user_id):
+                    result = await accounts.change_balance(user_id, amount)
+            else:
+                result = await accounts.change_balance(user_id, amount)
+        except ValueError:
+            rejected += 1
+            return
+        old_balance, new_balance = result
+        accepted[user_id] += new_balance - old_balance
+
+    await asyncio.gather(*(one(user_id, amount, flag) for user_id, amount, flag in ops))
+    return dict(accepted), rejected, accounts.cas_conflicts
+
+
+def open_store(backend, workdir):
+    return create_store(backend, os.path.join(workdir, 'database.json'), os.path.join(workdir, 'database.sqlite3'),
+                        journal_path=os.path.join(workdir, 'database.journal'))
+
+
+def run_process(args):
+    backend, workdir, ops = args
+    store = open_store(backend, workdir)
+    try:
+        return asyncio.run(apply_ops(Accounts(store), ops))
+    finally:
+        store.close()
+
+
+def check(store, users, accepted):
+    errors = 0
+    for user_id in range(users):
+        balance = store.get_balance(user_id)
+        if balance != accepted.get(user_id, 0) or balance < 0:
+            errors += 1
+            print(f"  пользователь {user_id}: баланс {balance}, ожидалось {accepted.get(user_id, 0)}")
+    return errors
+
+
+def stress(backend, users, ops_count, processes, seed):
+    with tempfile.TemporaryDirectory() as workdir:
+        store = open_store(backend, workdir)
+        for user_id in range(users):
+            store.create_user(user_id, f"user{user_id}")
+        started = time.perf_counter()
+        if processes == 1:
+            accepted, rejected, conflicts = asyncio.run(apply_ops(Accounts(store), make_ops(users, ops_count, seed)))
+        else:
+            store.close()
+            chunks = [(backend, workdir, make_ops(users, ops_count // processes, seed + index))
+                      for index in range(processes)]
+            with multiprocessing.get_context('spawn').Pool(processes) as pool:
+                results = pool.map(run_process, chunks)
+            accepted, rejected, conflicts = defaultdict(int), 0, 0
+            for part, part_rejected, part_conflicts in results:
+                for user_id, amount in part.items():
+                    accepted[user_id] += amount
+                rejected += part_rejected
+                conflicts += part_conflicts
+            store = open_store(backend, workdir)
+        elapsed = time.perf_counter() - started
+        errors = check(store, users, accepted)
+        store.close()
+        if backend != 'sqlite':
+            # Перечитываем с диска: сброс и журнал не потеряли изменений
+            reopened = open_store(backend, workdir)
+            errors += check(reopened, users, accepted)
+            reopened.close()
+    total = ops_count if processes == 1 else ops_count // processes * processes
+    print(f"{backend:>8} x{processes}: {total} операций за {elapsed:.2f} с ({total / elapsed:.0f}/с), "
+          f"отклонено {rejected}, конфликтов {conflicts}, ошибок {errors}")
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--ops', type=int, default=20000)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    errors = 0
+    for backend in ('json', 'journal', 'sqlite'):
+        errors += stress(backend, args.users, args.ops, 1, args.seed)
+    if args.processes > 1:
+        errors += stress('sqlite', args.users, args.ops, args.processes, args.seed)
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+from itertools import islice
+
+from aiogram.exceptions import TelegramForbiddenError, TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from outbox import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Ключи settings: состояние текущей рассылки и пользователи, заблокировавшие бота
+STATE_KEY = 'broadcast'
+BLOCKED_KEY = 'broadcast_blocked'
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+    if seconds >= 60:
+        return f"{seconds // 60} мин {seconds % 60} с"
+    return f"{seconds} с"
+
+
+def format_progress(state, rate=None):
+    processed = state['sent'] + state['blocked'] + state['failed'] + state['skipped']
+    total = max(state['total'], processed)
+    title = {
+        'running': "📣 Рассылка идет",
+        'done': "✅ Рассылка завершена",
+        'cancelled': "⏹ Рассылка остановлена"
+    }.get(state['status'], "📣 Рассылка")
+    text = (
+        f"{title}\n\n"
+        f"Обработано: {processed} из {total} ({processed * 100 // max(total, 1)}%)\n"
+        f"Доставлено: {state['sent']}\n"
+        f"Заблокировали бота: {state['blocked']}\n"
+        f"Пропущено (заблокировали раньше): {state['skipped']}\n"
+        f"Ошибок: {state['failed']}")
+    if state['status'] == 'running' and rate:
+        text += f"\n\nСкорость: {rate:.1f} сообщ/с, осталось ~{format_duration((total - processed) / rate)}"
+    elif state['status'] != 'running' and state.get('finished_at'):
+        text += f"\n\nЗаняло: {format_duration(state['finished_at'] - state['started_at'])}"
+    return text
+
+
+def stop_markup():
+    return InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(text="⏹ Остановить", callback_data="broadcast_stop")]])
+
+
+# Рассылка сообщения админа всем пользователям. Получатели читаются из
+# хранилища пачками по chunk_size по возрастанию user_id и уходят через
+# очередь уведомлений (outbox) не быстрее rate сообщений в секунду, чтобы
+# уведомлениям о заказах оставался запас до лимита Telegram. После каждой
+# пачки в settings сохраняется курсор — последний обработанный user_id,
+# поэтому после перезапуска рассылка продолжается с него (повторно может
+# уйти только пачка, прерванная аварийным падением). Кто заблокировал бота,
+# попадает в BLOCKED_KEY и в следующих рассылках пропускается до нового /start.
+# BLOCKED_KEY меняют все процессы, поэтому он не кэшируется, а правится через
+# store.update_setting_set — добавление и снятие поверх текущего значения в базе.
+#
+# Рассылку ведет один процесс: он раз в пачку обновляет heartbeat, а
+# брошенную рассылку (heartbeat старше lease секунд) подхватывает любой процесс.
+# Состояние меняется только через store.compare_and_set_setting поверх
+# прочитанной копии: права на рассылку получает ровно один процесс, а остановка
+# админом и сохранение пачки владельцем не затирают друг друга
+class Broadcaster:
+    def __init__(self, bot, store, outbox, rate=20.0, chunk_size=100, report_interval=5.0, lease=60.0):
+        self.bot = bot
+        self.store = store
+        self.outbox = outbox
+        self.rate = rate
+        self.chunk_size = chunk_size
+        self.report_interval = report_interval
+        self.lease = lease
+        self._owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._bucket = TokenBucket(rate, capacity=1)
+        self._task = None
+        self._watcher = None
+        self._stopping = False
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    def state(self):
+        # Копия: JsonStore отдает сам объект из памяти, который пишется на диск в другом потоке
+        state = self.store.get_setting(STATE_KEY)
+        return dict(state) if state else None
+
+    def _save(self, expected, state):
+        # Записанная копия или None, если состояние в базе уже не expected
+        state = dict(state)
+        return state if self.store.compare_and_set_setting(STATE_KEY, expected, state) else None
+
+    def blocked(self):
+        # Читается заново (рассылка — раз в пачку): другие процессы тоже меняют список
+        return set(self.store.get_setting(BLOCKED_KEY, []))
+
+    def unblock(self, user_id):
+        # Пользователь снова написал боту — следующие рассылки до него дойдут
+        if user_id in self.blocked():
+            self.store.update_setting_set(BLOCKED_KEY, remove=(user_id,))
+
+    def begin(self, admin_id, from_chat_id, message_id, progress_message_id):
+        # False, если рассылка уже идет (в этом или другом процессе)
+        current = self.state()
+        if current and current['status'] == 'running':
+            return False
+        now = time.time()
+        state = {
+            'status': 'running',
+            'admin_id': admin_id,
+            'from_chat_id': from_chat_id,
+            'message_id': message_id,
+            'progress_message_id': progress_message_id,
+            'cursor': 0,
+            'total': self.store.count_users(),
+            'sent': 0, 'blocked': 0, 'failed': 0, 'skipped': 0,
+            'started_at': now,
+            'owner': self._owner,
+            'heartbeat': now
+        }
+        state = self._save(current, state)
+        if state is None:
+            # Другой процесс успел начать свою рассылку
+            return False
+        self._task = asyncio.create_task(self._run(state))
+        return True
+
+    def cancel(self):
+        # Процесс, который ведет рассылку, увидит это после текущей пачки
+        while True:
+            state = self.state()
+            if not state or state['status'] != 'running':
+                return None
+            cancelled = self._save(state, dict(state, status='cancelled', finished_at=time.time()))
+            if cancelled is not None:
+                return cancelled
+
+    def start(self):
+        if self._watcher is None:
+            self._stopping = False
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        # Текущая пачка досылается, курсор сохраняется, а heartbeat
+        # обнуляется: после перезапуска рассылка продолжится сразу
+        self._stopping = True
+        if self._watcher is not None:
+            self._watcher.cancel()
+            try:
+                await self._watcher
+            except asyncio.CancelledError:
+                pass
+            self._watcher = None
+        if self._task is not None:
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            try:
+                await self._resume_abandoned()
+            except Exception as e:
+                logger.error(f"Broadcast watcher error: {e}")
+            await asyncio.sleep(self.lease / 2)
+
+    async def _resume_abandoned(self):
+        state = self.state()
+        if self.running or not state or state['status'] != 'running':
+            return
+        if time.time() - state['heartbeat'] < self.lease or self._stopping:
+            return
+        # Из процессов, одновременно заметивших брошенную рассылку, запишет только первый
+        state = self._save(state, dict(state, owner=self._owner, heartbeat=time.time()))
+        if state is not None:
+            logger.info(f"Resuming broadcast after user {state['cursor']}")
+            self._task = asyncio.create_task(self._run(state))
+
+    async def _run(self, state):
+        # state уже записан в базу; saved — последняя записанная копия, поверх
+        # которой идет следующая запись
+        saved = dict(state)
+        started = time.monotonic()
+        processed_before = state['sent'] + state['blocked'] + state['failed'] + state['skipped']
+        last_report = 0.0
+        user_ids = self.store.iter_user_ids(state['cursor'])
+        try:
+            while not self._stopping:
+                chunk = list(islice(user_ids, self.chunk_size))
+                if not chunk:
+                    state['status'] = 'done'
+                    state['finished_at'] = time.time()
+                    break
+                newly_blocked = await self._send_chunk(chunk, state)
+                if newly_blocked:
+                    self.store.update_setting_set(BLOCKED_KEY, add=newly_blocked)
+
+                state['cursor'] = chunk[-1]
+                state['heartbeat'] = time.time()
+                written = self._save(saved, state)
+                if written is None:
+                    # Рассылку остановили или ее подхватил другой процесс
+                    current = self.state()
+                    if current and current['owner'] == self._owner:
+                        await self._report(current)
+                    return
+                saved = written
+
+                now = time.monotonic()
+                if now - last_report >= self.report_interval:
+                    last_report = now
+                    processed = state['sent'] + state['blocked'] + state['failed'] + state['skipped']
+                    await self._report(state, (processed - processed_before) / max(now - started, 1e-9))
+            else:
+                state['heartbeat'] = 0
+        except Exception as e:
+            logger.error(f"Broadcast failed after user {saved['cursor']}: {e}")
+            # Остается курсор последней записанной пачки, а нулевой heartbeat дает
+            # подхватить рассылку сразу, не дожидаясь истечения lease
+            state = dict(saved, heartbeat=0)
+        try:
+            if self._save(saved, state) is None:
+                return
+        except Exception as e:
+            logger.error(f"Broadcast state not saved: {e}")
+            return
+        if state['status'] != 'running':
+            await self._report(state)
+
+    async def _send_chunk(self, chunk, state):
+        blocked = self.blocked()
+        newly_blocked = set()
+        # Единица сверху держит пачку незавершенной, пока в очередь ставятся остальные
+        waiting = 1
+        done = asyncio.get_running_loop().create_future()
+
+        def release():
+            nonlocal waiting
+            waiting -= 1
+            if not waiting:
+                done.set_result(None)
+
+        def on_result(chat_id, error):
+            if error is None:
+                state['sent'] += 1
+            elif isinstance(error, TelegramForbiddenError):
+                state['blocked'] += 1
+                newly_blocked.add(chat_id)
+            else:
+                state['failed'] += 1
+            release()
+
+        for user_id in chunk:
+            if user_id in blocked:
+                state['skipped'] += 1
+                continue
+            delay = self._bucket.reserve()
+            if delay:
+                await asyncio.sleep(delay)
+            waiting += 1
+            self.outbox.send('copy_message', user_id, callback=on_result,
+                             from_chat_id=state['from_chat_id'], message_id=state['message_id'])
+        release()
+        await done
+        return newly_blocked
+
+    async def _report(self, state, rate=None):
+        try:
+            await self.bot.edit_message_text(
+                format_progress(state, rate),
+                chat_id=state['admin_id'],
+                message_id=state['progress_message_id'],
+                reply_markup=stop_markup() if state['status'] == 'running' else None
+            )
+        except TelegramBadRequest as e:
+            logger.debug(f"Broadcast progress not updated: {e}")
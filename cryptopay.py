@@ -0,0 +1,127 @@
+import json
+import hmac
+import time
+import hashlib
+import asyncio
+import logging
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+CRYPTO_PAY_API_URL = "https://pay.crypt.bot/api"
+
+
+class CryptoPayError(Exception):
+    pass
+
+
+# Асинхронный клиент Crypto Pay API: одна общая сессия aiohttp с пулом
+# keep-alive соединений, чтобы вызовы не блокировали диспетчер и не
+# открывали новое TLS-соединение на каждый запрос
+class CryptoPayClient:
+    def __init__(self, token, api_url=CRYPTO_PAY_API_URL, timeout=10.0, connection_limit=20, on_request=None):
+        self.token = token
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.connection_limit = connection_limit
+        # on_request(method, status, seconds) — после каждого запроса, для метрик
+        self.on_request = on_request
+        self._session = None
+        self._session_lock = asyncio.Lock()
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            async with self._session_lock:
+                if self._session is None or self._session.closed:
+                    connector = aiohttp.TCPConnector(limit=self.connection_limit, keepalive_timeout=60)
+                    self._session = aiohttp.ClientSession(
+                        connector=connector,
+                        headers={"Crypto-Pay-API-Token": self.token or ""},
+                        timeout=aiohttp.ClientTimeout(total=self.timeout)
+                    )
+        return self._session
+
+    async def _call(self, method, params=None, timeout=None):
+        if self.on_request is None:
+            return await self._request(method, params, timeout)
+        status = 'ok'
+        started = time.perf_counter()
+        try:
+            return await self._request(method, params, timeout)
+        except CryptoPayError:
+            status = 'api_error'
+            raise
+        except asyncio.TimeoutError:
+            status = 'timeout'
+            raise
+        except Exception:
+            status = 'http_error'
+            raise
+        finally:
+            self.on_request(method, status, time.perf_counter() - started)
+
+    async def _request(self, method, params=None, timeout=None):
+        session = await self._get_session()
+        request_timeout = aiohttp.ClientTimeout(total=timeout) if timeout else None
+        async with session.post(f"{self.api_url}/{method}", json=params or {}, timeout=request_timeout) as response:
+            try:
+                data = await response.json(content_type=None)
+            except ValueError:
+                response.raise_for_status()
+                raise CryptoPayError(f"{method}: invalid response")
+        if not data.get('ok'):
+            raise CryptoPayError(f"{method}: {data.get('error')}")
+        return data['result']
+
+    async def create_invoice(self, amount, asset="USDT", timeout=None, **params):
+        return await self._call("createInvoice", dict(params, amount=str(amount), asset=asset), timeout=timeout)
+
+    async def get_invoices(self, invoice_ids, timeout=None, **params):
+        # Несколько счетов одним запросом: invoice_ids=1,2,3
+        ids = ','.join(str(invoice_id) for invoice_id in invoice_ids)
+        result = await self._call("getInvoices", dict(params, invoice_ids=ids), timeout=timeout)
+        return result['items']
+
+    async def get_exchange_rates(self, timeout=None):
+        return await self._call("getExchangeRates", timeout=timeout)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+# Подпись вебхука: HMAC-SHA256 тела запроса, ключ — SHA256 от токена приложения
+def sign_webhook_body(token, body):
+    secret = hashlib.sha256(token.encode()).digest()
+    return hmac.new(secret, body, hashlib.sha256).hexdigest()
+
+
+def verify_webhook_signature(token, body, signature):
+    if not token or not signature:
+        return False
+    return hmac.compare_digest(sign_webhook_body(token, body), signature)
+
+
+# Обработчик aiohttp для вебхука Crypto Pay: проверяет заголовок
+# crypto-pay-api-signature и передает оплаченные счета в on_paid(invoice)
+def create_webhook_handler(token, on_paid):
+    async def handle(request):
+        body = await request.read()
+        if not verify_webhook_signature(token, body, request.headers.get('crypto-pay-api-signature')):
+            return web.Response(status=401)
+        try:
+            update = json.loads(body)
+        except ValueError:
+            return web.Response(status=400)
+
+        if update.get('update_type') == 'invoice_paid':
+            try:
+                await on_paid(update['payload'])
+            except Exception as e:
+                logger.error(f"CryptoBot webhook error: {e}")
+                return web.Response(status=500)
+        return web.json_response({'ok': True})
+
+    return handle
@@ -0,0 +1,131 @@
+import io
+import csv
+import gzip
+import json
+import itertools
+import asyncio
+import tempfile
+from datetime import datetime
+
+from aiogram.types import InputFile
+
+ORDER_FIELDS = ('order_id', 'user_id', 'platform', 'service', 'channel', 'date', 'time',
+                'amount', 'status', 'created_at', 'paid_at', 'invoice_id')
+USER_FIELDS = ('user_id', 'username', 'balance', 'registration_date')
+FORMATS = ('csv', 'jsonl')
+
+# До этого размера файл выгрузки живет в памяти, дальше — во временном файле на диске
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+
+def parse_date(text):
+    # 2024-06-15 или 15.06.2024 → '2024-06-15' (строки дат в базе сравниваются как текст)
+    for pattern in ('%Y-%m-%d', '%d.%m.%Y'):
+        try:
+            return datetime.strptime(text, pattern).strftime('%Y-%m-%d')
+        except ValueError:
+            pass
+    return None
+
+
+def _in_range(timestamp, date_from, date_to):
+    # Границы включительно; у записи без даты фильтр по датам не проходит
+    if date_from is None and date_to is None:
+        return True
+    if not timestamp:
+        return False
+    day = timestamp[:10]
+    return (date_from is None or day >= date_from) and (date_to is None or day <= date_to)
+
+
+def order_rows(store, status=None, date_from=None, date_to=None, archive=None):
+    orders = store.iter_orders()
+    if archive is not None:
+        orders = itertools.chain(orders, archive.iter_orders())
+    for order_id, order in orders:
+        if status is not None and order.get('status') != status:
+            continue
+        if not _in_range(order.get('created_at'), date_from, date_to):
+            continue
+        row = {field: order.get(field) for field in ORDER_FIELDS}
+        row['order_id'] = int(order_id)
+        yield row
+
+
+def user_rows(store, date_from=None, date_to=None):
+    for user_id, user in store.iter_users():
+        if not _in_range(user.get('registration_date'), date_from, date_to):
+            continue
+        row = {field: user.get(field) for field in USER_FIELDS}
+        row['user_id'] = int(user_id)
+        yield row
+
+
+def write_csv(rows, fields, file):
+    # Строки копятся в небольшом текстовом буфере и пишутся в файл байтами:
+    # SpooledTemporaryFile до Python 3.11 нельзя обернуть в TextIOWrapper.
+    # BOM — чтобы Excel открыл кириллицу без выбора кодировки
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fields)
+    writer.writeheader()
+    file.write(b'\xef\xbb\xbf')
+    count = 0
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if buffer.tell() > 64 * 1024:
+            file.write(buffer.getvalue().encode('utf-8'))
+            buffer.seek(0)
+            buffer.truncate()
+    file.write(buffer.getvalue().encode('utf-8'))
+    return count
+
+
+def write_jsonl_gz(rows, file):
+    count = 0
+    with gzip.GzipFile(fileobj=file, mode='wb', compresslevel=6) as archive:
+        for row in rows:
+            archive.write(json.dumps(row, ensure_ascii=False).encode('utf-8') + b'\n')
+            count += 1
+    return count
+
+
+def export(store, kind, fmt='csv', status=None, date_from=None, date_to=None, archive=None):
+    # Синхронная выгрузка для asyncio.to_thread: строки идут из хранилища
+    # (и архива заказов, если он передан) генератором прямо в файл, поэтому
+    # память не зависит от размера базы. Возвращает (файл, число строк, имя файла)
+    if kind == 'orders':
+        rows, fields = order_rows(store, status, date_from, date_to, archive), ORDER_FIELDS
+    elif kind == 'users':
+        rows, fields = user_rows(store, date_from, date_to), USER_FIELDS
+    else:
+        raise ValueError(f"Unknown export kind: {kind}")
+
+    file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    try:
+        if fmt == 'csv':
+            count = write_csv(rows, fields, file)
+        elif fmt == 'jsonl':
+            count = write_jsonl_gz(rows, file)
+        else:
+            raise ValueError(f"Unknown export format: {fmt}")
+    except BaseException:
+        file.close()
+        raise
+    suffix = '.csv' if fmt == 'csv' else '.jsonl.gz'
+    parts = [kind, status, date_from and f"from{date_from}", date_to and f"to{date_to}",
+             datetime.now().strftime('%Y%m%d-%H%M%S')]
+    return file, count, '_'.join(part for part in parts if part) + suffix
+
+
+# Отправка файла выгрузки документом: читается кусками в потоке,
+# не загружая весь файл в память и не блокируя цикл событий
+class SpooledInputFile(InputFile):
+    def __init__(self, file, filename, chunk_size=64 * 1024):
+        super().__init__(filename=filename, chunk_size=chunk_size)
+        self.file = file
+
+    async def read(self, bot):
+        await asyncio.to_thread(self.file.seek, 0)
+        while chunk := await asyncio.to_thread(self.file.read, self.chunk_size):
+            yield chunk
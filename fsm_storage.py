@@ -0,0 +1,271 @@
+import json
+import time
+import sqlite3
+import asyncio
+import threading
+import logging
+from urllib.parse import urlparse
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+
+logger = logging.getLogger(__name__)
+
+
+def _state_name(state):
+    return state.state if isinstance(state, State) else state
+
+
+def _key_name(key):
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+def _ttl_ms(ttl):
+    # Срок в миллисекундах для PX/PEXPIRE: int(ttl) для TTL меньше секунды дал бы
+    # EX 0 — ошибку SET или немедленное удаление ключа у EXPIRE
+    return max(1, int(ttl * 1000))
+
+
+# Срок жизни ключа зависит от состояния: например, брошенное оформление
+# заказа в OrderStates:confirmation удаляется через state_ttls[...] секунд
+class _TtlPolicy:
+    def __init__(self, default_ttl=None, state_ttls=None):
+        self.default_ttl = default_ttl
+        self.state_ttls = dict(state_ttls or {})
+
+    def ttl(self, state):
+        return self.state_ttls.get(_state_name(state), self.default_ttl)
+
+
+# Хранилище FSM в локальном файле SQLite: переживает перезапуск и
+# разделяется между несколькими процессами бота на одной машине.
+# Запросы sqlite3 блокирующие (в том числе ожидание чужой записи), поэтому
+# async-методы выполняют их в потоке через asyncio.to_thread
+class SQLiteStorage(BaseStorage):
+    def __init__(self, path, default_ttl=None, state_ttls=None, purge_interval=300):
+        self.path = path
+        self.policy = _TtlPolicy(default_ttl, state_ttls)
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT, expires_at REAL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS fsm_expires ON fsm (expires_at)")
+
+    def _expires_at(self, state):
+        ttl = self.policy.ttl(state)
+        return time.time() + ttl if ttl else None
+
+    def _row(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT state, data, expires_at FROM fsm WHERE key = ?", (_key_name(key),)).fetchone()
+        if row is None or (row[2] is not None and row[2] < time.time()):
+            return None, {}
+        return row[0], json.loads(row[1]) if row[1] else {}
+
+    def _write(self, key, state, data):
+        with self._lock:
+            if state is None and not data:
+                self._conn.execute("DELETE FROM fsm WHERE key = ?", (_key_name(key),))
+            else:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO fsm (key, state, data, expires_at) VALUES (?, ?, ?, ?)",
+                    (_key_name(key), state, json.dumps(data, ensure_ascii=False), self._expires_at(state)))
+            now = time.time()
+            if now - self._last_purge > self.purge_interval:
+                self._last_purge = now
+                self._conn.execute("DELETE FROM fsm WHERE expires_at < ?", (now,))
+
+    def _replace_state(self, key, state):
+        _, data = self._row(key)
+        self._write(key, state, data)
+
+    def _replace_data(self, key, data):
+        state, _ = self._row(key)
+        self._write(key, state, data)
+
+    def _close(self):
+        with self._lock:
+            self._conn.close()
+
+    # Интерфейс BaseStorage
+
+    async def set_state(self, key, state=None):
+        await asyncio.to_thread(self._replace_state, key, _state_name(state))
+
+    async def get_state(self, key):
+        return (await asyncio.to_thread(self._row, key))[0]
+
+    async def set_data(self, key, data):
+        await asyncio.to_thread(self._replace_data, key, dict(data))
+
+    async def get_data(self, key):
+        return (await asyncio.to_thread(self._row, key))[1]
+
+    async def close(self):
+        await asyncio.to_thread(self._close)
+
+
+class RespError(Exception):
+    pass
+
+
+# Минимальный клиент протокола Redis (RESP) поверх asyncio: GET/SET/MGET/DEL
+# с конвейером, без внешних зависимостей. Подходит и для Redis, и для
+# совместимых серверов (KeyDB, Dragonfly, локальная замена для проверки).
+class RespClient:
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.password = parsed.password
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        if self.password:
+            await self._roundtrip([("AUTH", self.password)])
+        if self.db:
+            await self._roundtrip([("SELECT", self.db)])
+
+    @staticmethod
+    def _encode(command):
+        parts = [f"*{len(command)}\r\n".encode()]
+        for arg in command:
+            value = arg if isinstance(arg, bytes) else str(arg).encode()
+            parts.append(f"${len(value)}\r\n".encode() + value + b"\r\n")
+        return b"".join(parts)
+
+    async def _read_reply(self):
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("connection closed")
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode()
+        if prefix == b"-":
+            return RespError(payload.decode())
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2]
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise RespError(f"unexpected reply: {line!r}")
+
+    async def _roundtrip(self, commands):
+        self._writer.write(b"".join(self._encode(command) for command in commands))
+        await self._writer.drain()
+        return [await self._read_reply() for _ in commands]
+
+    async def pipeline(self, commands):
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    replies = await self._roundtrip(commands)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    await self._reset()
+                    if attempt:
+                        raise
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    async def execute(self, *command):
+        return (await self.pipeline([command]))[0]
+
+    async def _reset(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+    async def close(self):
+        async with self._lock:
+            await self._reset()
+
+
+# Хранилище FSM на Redis-совместимом сервере: общее для любого числа
+# процессов и машин. Состояние и данные — два ключа с одним TTL.
+class RedisStorage(BaseStorage):
+    def __init__(self, url, prefix='fsm', default_ttl=None, state_ttls=None):
+        self.client = RespClient(url)
+        self.prefix = prefix
+        self.policy = _TtlPolicy(default_ttl, state_ttls)
+
+    def _keys(self, key):
+        name = f"{self.prefix}:{_key_name(key)}"
+        return f"{name}:state", f"{name}:data"
+
+    def _set_commands(self, key, state, data, ttl):
+        state_key, data_key = self._keys(key)
+        commands = []
+        for redis_key, value in ((state_key, state), (data_key, json.dumps(data, ensure_ascii=False) if data else None)):
+            if value is None:
+                commands.append(("DEL", redis_key))
+            elif ttl:
+                commands.append(("SET", redis_key, value, "PX", _ttl_ms(ttl)))
+            else:
+                commands.append(("SET", redis_key, value))
+        return commands
+
+    # Интерфейс BaseStorage
+
+    async def set_state(self, key, state=None):
+        # Данные не перечитываем: только продлеваем их срок вместе с состоянием
+        state = _state_name(state)
+        state_key, data_key = self._keys(key)
+        ttl = self.policy.ttl(state)
+        commands = [self._set_commands(key, state, None, ttl)[0]]
+        commands.append(("PEXPIRE", data_key, _ttl_ms(ttl)) if ttl else ("PERSIST", data_key))
+        await self.client.pipeline(commands)
+
+    async def get_state(self, key):
+        value = await self.client.execute("GET", self._keys(key)[0])
+        return value.decode() if value else None
+
+    async def set_data(self, key, data):
+        # Срок данных зависит от состояния: оба ключа пишутся одним конвейером
+        state = await self.get_state(key)
+        await self.client.pipeline(self._set_commands(key, state, dict(data), self.policy.ttl(state)))
+
+    async def get_data(self, key):
+        value = await self.client.execute("GET", self._keys(key)[1])
+        return json.loads(value) if value else {}
+
+    async def close(self):
+        await self.client.close()
+
+
+def create_fsm_storage(backend, sqlite_path='fsm.sqlite3', redis_url='redis://localhost:6379/0',
+                       default_ttl=None, state_ttls=None):
+    if backend == 'memory':
+        if default_ttl or any((state_ttls or {}).values()):
+            # MemoryStorage сроков не знает: брошенные шаги не сбрасываются до перезапуска
+            logger.warning("FSM_STORAGE=memory ignores FSM state TTLs (FSM_CHECKOUT_TTL, FSM_STATE_TTL); "
+                           "use FSM_STORAGE=sqlite or redis to expire abandoned steps")
+        return MemoryStorage()
+    if backend == 'sqlite':
+        return SQLiteStorage(sqlite_path, default_ttl=default_ttl, state_ttls=state_ttls)
+    if backend == 'redis':
+        return RedisStorage(redis_url, default_ttl=default_ttl, state_ttls=state_ttls)
+    raise ValueError(f"Unknown FSM storage: {backend}")
@@ -0,0 +1,161 @@
+import time
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+def _age(timestamp):
+    return None if timestamp is None else round(time.monotonic() - timestamp, 3)
+
+
+# Проверки для платформы (Render и т.п.) вместо периодических пингов:
+#   /healthz — процесс жив и цикл событий не завис (liveness)
+#   /readyz  — бот принимает обновления и очереди не копятся (readiness)
+# Все значения берутся из памяти процесса — база на диске не читается.
+#
+# Задержка цикла событий — насколько позже срока просыпается задача,
+# которая спит по interval секунд. Живость получения обновлений: в режиме
+# polling — возраст последнего успешного getUpdates (пустой ответ тоже
+# считается), в режиме webhook — возраст последнего принятого обновления
+# (тихий бот без обновлений при этом остается готовым)
+class HealthMonitor:
+    def __init__(self, mode='polling', interval=0.5, max_loop_lag=2.0, max_poll_age=120.0,
+                 max_pending_writes=10000, max_outbox_depth=10000):
+        self.mode = mode
+        self.interval = interval
+        self.max_loop_lag = max_loop_lag
+        self.max_poll_age = max_poll_age
+        self.max_pending_writes = max_pending_writes
+        self.max_outbox_depth = max_outbox_depth
+        self.loop_lag = 0.0
+        self.last_poll = None
+        self.last_update = None
+        self.ready = False
+        self._started = time.monotonic()
+        self._expected = None
+        self._task = None
+        # name → функция без аргументов; None — значение в этом процессе неизвестно
+        self._gauges = {}
+
+    def gauge(self, name, read):
+        self._gauges[name] = read
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch_loop(self):
+        while True:
+            self._expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.loop_lag = max(0.0, time.monotonic() - self._expected)
+
+    def current_loop_lag(self):
+        # Если задача еще не проснулась после долгой блокировки, задержка уже видна по сроку
+        if self._expected is None:
+            return self.loop_lag
+        return max(self.loop_lag, time.monotonic() - self._expected)
+
+    def mark_poll(self, updates=0):
+        self.last_poll = time.monotonic()
+        if updates:
+            self.last_update = self.last_poll
+
+    def mark_update(self):
+        self.last_update = time.monotonic()
+
+    # Отчеты
+
+    def _values(self):
+        values = {}
+        for name, read in self._gauges.items():
+            try:
+                values[name] = read()
+            except Exception as e:
+                logger.error(f"Health gauge {name} failed: {e}")
+                values[name] = None
+        return values
+
+    def liveness(self):
+        lag = self.current_loop_lag()
+        problems = []
+        if lag > self.max_loop_lag:
+            problems.append(f"event loop lag {lag:.2f}s > {self.max_loop_lag}s")
+        return problems, {'uptime_seconds': _age(self._started), 'loop_lag_seconds': round(lag, 3)}
+
+    def readiness(self):
+        problems, report = self.liveness()
+        values = self._values()
+        report.update({
+            'mode': self.mode,
+            'last_poll_age_seconds': _age(self.last_poll),
+            'last_update_age_seconds': _age(self.last_update),
+            **values
+        })
+        if not self.ready:
+            problems.append("bot is not started")
+        elif self.mode == 'polling':
+            poll_age = _age(self.last_poll)
+            if poll_age is None or poll_age > self.max_poll_age:
+                problems.append(f"no successful getUpdates for {poll_age}s" if poll_age is not None
+                                else "no successful getUpdates yet")
+        if (values.get('store_pending_writes') or 0) > self.max_pending_writes:
+            problems.append(f"store flush backlog {values['store_pending_writes']} > {self.max_pending_writes}")
+        if (values.get('outbox_depth') or 0) > self.max_outbox_depth:
+            problems.append(f"outbox depth {values['outbox_depth']} > {self.max_outbox_depth}")
+        if values.get('workers_alive') is not None and values['workers_alive'] < values.get('workers', 0):
+            problems.append(f"only {values['workers_alive']} of {values['workers']} workers alive")
+        return problems, report
+
+    # aiohttp
+
+    @staticmethod
+    def _respond(problems, report):
+        report = {'status': 'fail' if problems else 'ok', 'problems': problems, **report}
+        return web.json_response(report, status=503 if problems else 200)
+
+    async def healthz_handler(self, request):
+        return self._respond(*self.liveness())
+
+    async def readyz_handler(self, request):
+        return self._respond(*self.readiness())
+
+    def webhook_middleware(self, path):
+        # Принятое обновление на пути вебхука Telegram — признак живого webhook
+        @web.middleware
+        async def middleware(request, handler):
+            response = await handler(request)
+            if request.path == path and response.status == 200:
+                self.mark_update()
+            return response
+        return middleware
+
+    def setup(self, app):
+        app.router.add_get('/healthz', self.healthz_handler)
+        app.router.add_get('/readyz', self.readyz_handler)
+
+
+# Middleware сессии бота: успешный getUpdates (и dp.start_polling, и
+# WorkerPool.run_polling) отмечает живость polling без лишних запросов
+class PollingLiveness(BaseRequestMiddleware):
+    def __init__(self, monitor):
+        self.monitor = monitor
+
+    async def __call__(self, make_request, bot, method):
+        result = await make_request(bot, method)
+        if method.__api_method__ == 'getUpdates':
+            self.monitor.mark_poll(len(result))
+        return result
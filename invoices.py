@@ -0,0 +1,93 @@
+import time
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Открытый счет: только несколько небольших полей
+class PendingInvoice:
+    __slots__ = ('invoice_id', 'kind', 'user_id', 'ref', 'deadline')
+
+    def __init__(self, invoice_id, kind, user_id, ref, deadline):
+        self.invoice_id = invoice_id
+        self.kind = kind          # 'order' или 'deposit'
+        self.user_id = user_id
+        self.ref = ref            # номер заказа или сумма пополнения
+        self.deadline = deadline
+
+
+# Один общий опрос всех открытых счетов вместо отдельной задачи на каждый счет.
+# Раз в interval секунд счета запрашиваются пачками через
+# getInvoices?invoice_ids=a,b,c, поэтому число запросов не растет вместе
+# с числом одновременных оплат.
+class InvoicePoller:
+    def __init__(self, client, on_paid, on_expired, interval=30.0, ttl=15 * 60, batch_size=100):
+        self.client = client
+        self.on_paid = on_paid
+        self.on_expired = on_expired
+        self.interval = interval
+        self.ttl = ttl
+        self.batch_size = batch_size
+        self._pending = {}
+        self._task = None
+
+    @property
+    def pending_count(self):
+        return len(self._pending)
+
+    def register(self, invoice_id, kind, user_id, ref):
+        self._pending[invoice_id] = PendingInvoice(invoice_id, kind, user_id, ref, time.monotonic() + self.ttl)
+
+    def resolve(self, invoice_id):
+        # Снимает счет с учета; None, если он уже обработан или не известен
+        return self._pending.pop(invoice_id, None)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.poll_once()
+            except Exception as e:
+                logger.error(f"Invoice poll error: {e}")
+
+    async def poll_once(self):
+        invoice_ids = list(self._pending)
+        for start in range(0, len(invoice_ids), self.batch_size):
+            batch = invoice_ids[start:start + self.batch_size]
+            try:
+                items = await self.client.get_invoices(batch, count=len(batch))
+            except Exception as e:
+                logger.error(f"Payment check error: {e}")
+                continue
+            for item in items:
+                if item['status'] == 'paid':
+                    await self._dispatch(self.on_paid, item['invoice_id'])
+                elif item['status'] == 'expired':
+                    await self._dispatch(self.on_expired, item['invoice_id'])
+
+        now = time.monotonic()
+        for invoice_id in [i for i, invoice in self._pending.items() if invoice.deadline <= now]:
+            await self._dispatch(self.on_expired, invoice_id)
+
+    async def _dispatch(self, handler, invoice_id):
+        invoice = self.resolve(invoice_id)
+        if invoice is None:
+            return
+        try:
+            await handler(invoice)
+        except Exception as e:
+            logger.error(f"Invoice {invoice_id} handler error: {e}")
@@ -1,50 +1,190 @@
 import os
-import json
+import re
 import asyncio
 from datetime import datetime, timedelta
 from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command, StateFilter
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.filters import Command, CommandObject, StateFilter
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.utils.keyboard import ReplyKeyboardBuilder, InlineKeyboardBuilder
-import requests
 from aiohttp import web
 import logging
+from storage import create_store, now_str, OrderArchive, ArchiveJob
+from cryptopay import CryptoPayClient, create_webhook_handler
+from invoices import InvoicePoller
+from telegram_webhook import TelegramWebhook
+from outbox import MessageQueue
+from assets import AssetRegistry
+from fsm_storage import create_fsm_storage
+from stats import StatsAggregator
+from workers import WorkerPool
+from accounts import Accounts, parse_balance_rows
+from metrics import registry, setup_metrics, observe_cryptopay, InstrumentedStore, metrics_handler, pooled_metrics_handler
+from tracing import Tracer
+from rates import ExchangeRates
+from broadcast import Broadcaster, format_progress, stop_markup
+from health import HealthMonitor, PollingLiveness
+import export
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Инициализация бота и диспетчера
-bot = Bot(token=os.getenv('TELEGRAM_BOT_TOKEN'))
-dp = Dispatcher()
+# TELEGRAM_API_URL — свой сервер Bot API (локальный telegram-bot-api или заглушка для нагрузочных тестов)
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+bot = Bot(
+    token=os.getenv('TELEGRAM_BOT_TOKEN'),
+    session=AiohttpSession(api=TelegramAPIServer.from_base(TELEGRAM_API_URL)) if TELEGRAM_API_URL else None
+)
+
+# Хранилище состояний FSM: memory (по умолчанию), sqlite или redis.
+# Брошенное подтверждение заказа или пополнения сбрасывается через FSM_CHECKOUT_TTL секунд
+FSM_CHECKOUT_TTL = int(os.getenv('FSM_CHECKOUT_TTL', '1800'))
+fsm_storage = create_fsm_storage(
+    os.getenv('FSM_STORAGE', 'memory'),
+    sqlite_path=os.getenv('FSM_SQLITE_FILE', 'fsm.sqlite3'),
+    redis_url=os.getenv('FSM_REDIS_URL', 'redis://localhost:6379/0'),
+    default_ttl=int(os.getenv('FSM_STATE_TTL', '0')) or None,
+    state_ttls={
+        'OrderStates:confirmation': FSM_CHECKOUT_TTL,
+        'PaymentStates:confirmation': FSM_CHECKOUT_TTL
+    }
+)
+dp = Dispatcher(storage=fsm_storage)
+
+# Метрики Prometheus на /metrics: обновления, хендлеры, вызовы Bot API
+setup_metrics(dp, bot)
+
+# Трассировка медленных обновлений (выключена, пока TRACE_SAMPLE_RATE = 0):
+# доля обновлений трассируется, и те, что дольше TRACE_SLOW_MS, пишутся в TRACE_FILE
+tracer = Tracer(
+    os.getenv('TRACE_FILE', 'traces.jsonl'),
+    slow_seconds=float(os.getenv('TRACE_SLOW_MS', '1000')) / 1000,
+    sample_rate=float(os.getenv('TRACE_SAMPLE_RATE', '0'))
+)
+tracer.setup(dp)
+
+# Очередь исходящих сообщений с лимитами Telegram (общим и на чат)
+outbox = MessageQueue(
+    bot,
+    global_rate=float(os.getenv('OUTBOX_GLOBAL_RATE', '25')),
+    per_chat_rate=float(os.getenv('OUTBOX_PER_CHAT_RATE', '1')),
+    workers=int(os.getenv('OUTBOX_WORKERS', '8'))
+)
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_RUN_MODE = os.getenv('BOT_RUN_MODE', 'polling')
+WEBHOOK_BASE_URL = os.getenv('WEBHOOK_BASE_URL', '')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+TELEGRAM_WEBHOOK_PATH = '/telegram/webhook'
+# Порт веб-приложения (вебхуки, /healthz, /metrics); Render передает свой в PORT
+WEB_PORT = int(os.getenv('PORT', '8080'))
+
+# /healthz и /readyz для проверок платформы: задержка цикла событий, живость
+# получения обновлений и длина очередей (без чтения базы)
+health = HealthMonitor(
+    mode=BOT_RUN_MODE,
+    max_loop_lag=float(os.getenv('HEALTH_MAX_LOOP_LAG', '2')),
+    max_poll_age=float(os.getenv('HEALTH_MAX_POLL_AGE', '120')),
+    max_pending_writes=int(os.getenv('HEALTH_MAX_PENDING_WRITES', '10000')),
+    max_outbox_depth=int(os.getenv('HEALTH_MAX_OUTBOX_DEPTH', '10000'))
+)
+bot.session.middleware(PollingLiveness(health))
+
+# Обработка обновлений из вебхука: параллельно, но не больше WEBHOOK_MAX_IN_FLIGHT
+telegram_webhook = TelegramWebhook(
+    dp,
+    bot,
+    WEBHOOK_SECRET,
+    max_in_flight=int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', '100'))
+)
 
 # Настройки CryptoBot
 CRYPTO_BOT_TOKEN = os.getenv('CRYPTO_BOT_TOKEN')
-CRYPTO_BOT_API_URL = "https://pay.crypt.bot/api"
+CRYPTO_BOT_API_URL = os.getenv('CRYPTO_BOT_API_URL', "https://pay.crypt.bot/api")
+
+# Общий асинхронный клиент CryptoBot с пулом соединений
+crypto_pay = CryptoPayClient(
+    CRYPTO_BOT_TOKEN,
+    CRYPTO_BOT_API_URL,
+    timeout=float(os.getenv('CRYPTO_BOT_TIMEOUT', '10')),
+    on_request=observe_cryptopay
+)
+
+# Курсы CryptoBot: суммы в рублях переводятся в INVOICE_ASSET перед созданием счета.
+# Курс кэшируется на EXCHANGE_RATES_TTL секунд, пока API недоступен — USDT_RUB_FALLBACK
+INVOICE_ASSET = os.getenv('INVOICE_ASSET', 'USDT')
+exchange_rates = ExchangeRates(
+    crypto_pay,
+    fiat='RUB',
+    ttl=float(os.getenv('EXCHANGE_RATES_TTL', '300')),
+    fallback={'USDT': float(os.getenv('USDT_RUB_FALLBACK', '75'))}
+)
 
 # Путь к файлу базы данных
 DB_FILE = 'database.json'
+SQLITE_DB_FILE = os.getenv('SQLITE_DB_FILE', 'database.sqlite3')
+DB_BACKEND = os.getenv('DB_BACKEND', 'json')
+ADMIN_IDS = [int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '').split(',') if admin_id]
 
-# Загрузка базы данных
-def load_db():
-    try:
-        with open(DB_FILE, 'r') as f:
-            return json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        # База данных по умолчанию
-        return {
-            'users': {},
-            'orders': {},
-            'admins': [int(admin_id) for admin_id in os.getenv('ADMIN_IDS', '').split(',') if admin_id],
-            'settings': {}
-        }
-
-# Сохранение базы данных
-def save_db(db):
-    with open(DB_FILE, 'w') as f:
-        json.dump(db, f, indent=4)
+# Хранилище: json (в памяти, сброс на диск пачками), journal (журнал изменений + снимок),
+# binary (как json, но файл в компактном двоичном формате) или sqlite.
+# Обертка замеряет время каждой операции для /metrics
+store = InstrumentedStore(create_store(
+    DB_BACKEND,
+    DB_FILE,
+    SQLITE_DB_FILE,
+    admins=ADMIN_IDS,
+    flush_interval=float(os.getenv('DB_FLUSH_INTERVAL', '2')),
+    flush_threshold=int(os.getenv('DB_FLUSH_THRESHOLD', '100')),
+    journal_path=os.getenv('DB_JOURNAL_FILE', 'database.journal'),
+    max_journal_bytes=int(os.getenv('DB_JOURNAL_MAX_BYTES', str(4 * 1024 * 1024))),
+    binary_path=os.getenv('DB_BINARY_FILE', 'database.bin'),
+    sqlite_busy_timeout=float(os.getenv('SQLITE_BUSY_TIMEOUT', '2'))
+))
+
+# Холодный архив: выполненные и отклоненные заказы старше ARCHIVE_AFTER_DAYS дней
+# переносятся из базы в сжатые сегменты и читаются оттуда по запросу (0 — не переносить)
+archive = OrderArchive(os.getenv('ARCHIVE_DIR', 'archive'), summarize=StatsAggregator.summarize)
+archive_job = ArchiveJob(
+    archive, store,
+    after_days=int(os.getenv('ARCHIVE_AFTER_DAYS', '30')),
+    interval=float(os.getenv('ARCHIVE_INTERVAL', str(6 * 3600)))
+)
+
+# Изменения одного пользователя (баланс, заказы) идут по очереди, разных — параллельно
+accounts = Accounts(store)
+
+# Рассылка всем пользователям: не быстрее BROADCAST_RATE сообщений в секунду,
+# чтобы уведомлениям о заказах в outbox оставался запас
+broadcaster = Broadcaster(
+    bot, store, outbox,
+    rate=float(os.getenv('BROADCAST_RATE', '20')),
+    chunk_size=int(os.getenv('BROADCAST_CHUNK_SIZE', '100')),
+    report_interval=float(os.getenv('BROADCAST_REPORT_INTERVAL', '5'))
+)
+
+# BOT_WORKERS > 1: входной процесс раздает обновления процессам-обработчикам
+# по номеру пользователя. Процессы пишут в одну базу, поэтому нужен sqlite.
+# Метрики процессов — на локальных портах сразу за WEB_PORT
+BOT_WORKERS = int(os.getenv('BOT_WORKERS', '1'))
+if BOT_WORKERS > 1 and DB_BACKEND != 'sqlite':
+    raise RuntimeError("BOT_WORKERS > 1 requires DB_BACKEND=sqlite")
+WORKER_METRICS_PORT = int(os.getenv('WORKER_METRICS_PORT', str(WEB_PORT + 1)))
+if BOT_WORKERS > 1 and WORKER_METRICS_PORT <= WEB_PORT < WORKER_METRICS_PORT + BOT_WORKERS:
+    raise RuntimeError(f"WORKER_METRICS_PORT range {WORKER_METRICS_PORT}-{WORKER_METRICS_PORT + BOT_WORKERS - 1} "
+                       f"overlaps the web port {WEB_PORT}")
+worker_pool = WorkerPool(
+    'main',
+    BOT_WORKERS,
+    max_in_flight=int(os.getenv('WEBHOOK_MAX_IN_FLIGHT', '100')),
+    global_rate=float(os.getenv('OUTBOX_GLOBAL_RATE', '25')),
+    metrics_port=WORKER_METRICS_PORT
+) if BOT_WORKERS > 1 else None
 
 # Классы состояний
 class OrderStates(StatesGroup):
@@ -64,43 +204,79 @@ class AdminStates(StatesGroup):
     adding_admin = State()
     removing_admin = State()
     changing_balance = State()
+    bulk_balance = State()
+    broadcast_message = State()
+
+# Статистика для админов: пересчитывается один раз, дальше обновляется по событиям хранилища.
+# При BOT_WORKERS > 1 каждый процесс раз в STATS_REFRESH_INTERVAL секунд сверяется с базой
+STATS_REFRESH_INTERVAL = float(os.getenv('STATS_REFRESH_INTERVAL', '60'))
+stats = StatsAggregator()
+stats.rebuild(store, archive)
+store.subscribe(stats.handle)
+
+# Картинки меню: file_id после первой отправки хранится в settings
+menu_photos = AssetRegistry(store, {
+    'welcome': os.getenv('WELCOME_IMAGE', "https://example.com/welcome_image.jpg"),  # Замените на реальный URL
+    'order': os.getenv('ORDER_IMAGE', "https://example.com/order_image.jpg"),
+    'profile': os.getenv('PROFILE_IMAGE', "https://example.com/profile_image.jpg"),
+    'support': os.getenv('SUPPORT_IMAGE', "https://example.com/support_image.jpg"),
+    'admin': os.getenv('ADMIN_IMAGE', "https://example.com/admin_image.jpg")
+})
 
 # Клавиатуры
 def get_main_kb(user_id):
-    db = load_db()
     kb = ReplyKeyboardBuilder()
     kb.add(KeyboardButton(text="🛍️ Заказать услугу"))
     kb.add(KeyboardButton(text="👤 Профиль"))
     kb.add(KeyboardButton(text="🆘 Поддержка"))
     
-    if user_id in db['admins']:
+    if store.is_admin(user_id):
         kb.add(KeyboardButton(text="👑 Админ"))
     
     kb.adjust(2)
     return kb.as_markup(resize_keyboard=True)
 
+# Уведомления уходят через очередь с ограничением скорости, хендлер не ждет отправки
+def notify_admins(text):
+    for admin_id in store.get_admins():
+        outbox.send_message(admin_id, text)
+
 def get_back_kb():
     kb = ReplyKeyboardBuilder()
     kb.add(KeyboardButton(text="🔙 Назад"))
     return kb.as_markup(resize_keyboard=True)
 
+# Кнопки админ-панели. Хендлеры шагов, принимающих любое сообщение (текст
+# рассылки), их пропускают, чтобы нажатие кнопки не стало ответом на шаг
+ADMIN_MENU_BUTTONS = (
+    "📊 Статистика бота",
+    "📦 Управление заказами",
+    "👥 Назначить админа",
+    "👥 Снять админа",
+    "💰 Изменить баланс",
+    "📥 Массовое начисление",
+    "📣 Рассылка",
+    "📤 Экспорт",
+    "🔙 Назад",
+)
+
+def get_admin_kb():
+    kb = ReplyKeyboardBuilder()
+    for text in ADMIN_MENU_BUTTONS:
+        kb.add(KeyboardButton(text=text))
+    kb.adjust(2)
+    return kb.as_markup(resize_keyboard=True)
+
 # Хендлеры команд
 @dp.message(Command("start"))
 async def cmd_start(message: types.Message):
-    db = load_db()
     user_id = message.from_user.id
+    store.create_user(user_id, message.from_user.username)
+    broadcaster.unblock(user_id)
     
-    if str(user_id) not in db['users']:
-        db['users'][str(user_id)] = {
-            'balance': 0,
-            'orders': [],
-            'registration_date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            'username': message.from_user.username
-        }
-        save_db(db)
-    
-    await message.answer_photo(
-        photo="https://example.com/welcome_image.jpg",  # Замените на реальный URL
+    await menu_photos.answer_photo(
+        message,
+        'welcome',
         caption="👋 Добро пожаловать в бота для продвижения стримов!",
         reply_markup=get_main_kb(user_id)
     )
@@ -115,15 +291,85 @@ async def cmd_back(message: types.Message, state: FSMContext):
 
 # Запуск бота
 async def on_startup():
+    outbox.start()
+    # Опрос счетов есть в каждом процессе: счет ждет оплаты там, где его создали,
+    # а без открытых счетов запросов к Crypto Pay нет
+    invoice_poller.start()
+    # При BOT_WORKERS > 1 on_startup выполняет каждый процесс-обработчик. Задачи в
+    # одном экземпляре — подхват брошенной рассылки и архив — ведет входной процесс
+    # (run_ingress), а курс обработчики обновляют по запросу (ExchangeRates.rate)
+    if worker_pool is None:
+        exchange_rates.start()
+        broadcaster.start()
+        archive_job.start()
+    health.ready = True
     logger.info("Бот запущен")
     # Здесь можно добавить код для отправки уведомления админам о запуске бота
 
 async def on_shutdown():
+    health.ready = False
+    await invoice_poller.stop()
+    await exchange_rates.stop()
+    # Рассылка досылает текущую пачку через outbox, поэтому останавливается раньше него
+    await broadcaster.stop()
+    await archive_job.stop()
+    await outbox.stop()
+    await crypto_pay.close()
+    await fsm_storage.close()
+    # Финальный сброс накопленных изменений на диск
+    await asyncio.to_thread(store.close)
     logger.info("Бот остановлен")
 
+dp.startup.register(on_startup)
+dp.shutdown.register(on_shutdown)
+
+async def set_telegram_webhook():
+    await bot.set_webhook(
+        WEBHOOK_BASE_URL.rstrip('/') + TELEGRAM_WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET,
+        max_connections=min(telegram_webhook.max_in_flight, 100),
+        drop_pending_updates=True
+    )
+
+async def run_ingress():
+    # Входной процесс только принимает обновления и раздает их worker_pool,
+    # хендлеры, опрос счетов и статистика работают в процессах-обработчиках.
+    # Перенос заказов в архив и подхват брошенной рассылки — здесь, в одном процессе
+    worker_pool.start()
+    outbox.start()
+    archive_job.start()
+    broadcaster.start()
+    health.ready = True
+    try:
+        if BOT_RUN_MODE == 'webhook':
+            await set_telegram_webhook()
+            await asyncio.Event().wait()
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await worker_pool.run_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        health.ready = False
+        await broadcaster.stop()
+        await archive_job.stop()
+        await asyncio.to_thread(worker_pool.stop)
+        await outbox.stop()
+        await asyncio.to_thread(store.close)
+
 async def main():
-    dp.startup.register(on_startup)
-    dp.shutdown.register(on_shutdown)
+    if worker_pool is not None:
+        await run_ingress()
+        return
+    
+    if BOT_RUN_MODE == 'webhook':
+        # Telegram сам присылает обновления на TELEGRAM_WEBHOOK_PATH веб-приложения
+        await dp.emit_startup(bot=bot)
+        try:
+            await set_telegram_webhook()
+            await asyncio.Event().wait()
+        finally:
+            await telegram_webhook.drain()
+            await dp.emit_shutdown(bot=bot)
+        return
     
     # Удаляем вебхук (если был)
     await bot.delete_webhook(drop_pending_updates=True)
@@ -131,30 +377,6 @@ async def main():
     # Запускаем поллинг
     await dp.start_polling(bot)
 
-if __name__ == "__main__":
-    # Для Render: создаем веб-приложение для поддержания бота в активном состоянии
-    app = web.Application()
-    runner = web.AppRunner(app)
-    
-    async def keep_alive():
-        while True:
-            await asyncio.sleep(15 * 60)  # Каждые 15 минут
-            try:
-                # Простое действие для поддержания активности
-                db = load_db()
-                if db['admins']:
-                    await bot.send_message(db['admins'][0], "🤖 Бот активен!")
-            except Exception as e:
-                logger.error(f"Keep alive error: {e}")
-    
-    async def start():
-        await runner.setup()
-        site = web.TCPSite(runner, '0.0.0.0', 8080)
-        await site.start()
-        asyncio.create_task(keep_alive())
-        await main()
-    
-    asyncio.run(start())
     # Часть 2: Реализация функционала заказа услуг
 
 # Цены на услуги
@@ -175,8 +397,9 @@ async def cmd_order(message: types.Message, state: FSMContext):
     kb.add(KeyboardButton(text="🔙 Назад"))
     kb.adjust(2)
     
-    await message.answer_photo(
-        photo="https://example.com/order_image.jpg",
+    await menu_photos.answer_photo(
+        message,
+        'order',
         caption="Выберите платформу:",
         reply_markup=kb.as_markup(resize_keyboard=True)
     )
@@ -223,7 +446,7 @@ async def process_date(message: types.Message, state: FSMContext):
     await state.update_data(date=message.text)
     await message.answer(
         "Введите время начала стрима в формате ЧЧ:ММ (например, 14:00):",
-        reply_markup=get_back_kb())
+        reply_markup=get_back_kb()
     )
     await state.set_state(OrderStates.choosing_time)
 
@@ -232,7 +455,7 @@ async def process_time(message: types.Message, state: FSMContext):
     await state.update_data(time=message.text)
     await message.answer(
         "Введите название вашего канала (например, 'MyCoolChannel'):",
-        reply_markup=get_back_kb())
+        reply_markup=get_back_kb()
     )
     await state.set_state(OrderStates.entering_channel)
 
@@ -260,33 +483,32 @@ async def process_channel(message: types.Message, state: FSMContext):
     
     await message.answer(
         confirmation_msg,
-        reply_markup=kb.as_markup(resize_keyboard=True))
+        reply_markup=kb.as_markup(resize_keyboard=True)
     )
     await state.set_state(OrderStates.confirmation)
 
-@dp.message(OrderStates.confirmation, F.text == "✅ Подтвердить"))
+@dp.message(OrderStates.confirmation, F.text == "✅ Подтвердить")
 async def confirm_order(message: types.Message, state: FSMContext):
     user_id = message.from_user.id
-    data = await state.get_data()
-    db = load_db()
-    
-    # Создаем заказ
-    order_id = len(db['orders']) + 1
-    db['orders'][str(order_id)] = {
-        'user_id': user_id,
-        'platform': data['platform'],
-        'service': data['service'],
-        'channel': data['channel'],
-        'date': data['date'],
-        'time': data['time'],
-        'amount': data['price_info']['price'],
-        'status': 'pending_payment',
-        'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    }
     
-    # Добавляем заказ в профиль пользователя
-    db['users'][str(user_id)]['orders'].append(order_id)
-    save_db(db)
+    async with accounts.transaction(user_id):
+        # Повторное нажатие, пока создавался заказ: состояние уже сброшено
+        if await state.get_state() != OrderStates.confirmation.state:
+            return
+        data = await state.get_data()
+        
+        # Создаем заказ (он же добавляется в профиль пользователя)
+        store.create_order(user_id, {
+            'platform': data['platform'],
+            'service': data['service'],
+            'channel': data['channel'],
+            'date': data['date'],
+            'time': data['time'],
+            'amount': data['price_info']['price'],
+            'status': 'pending_payment',
+            'created_at': now_str()
+        })
+        await state.clear()
     
     # Предлагаем оплатить
     kb = ReplyKeyboardBuilder()
@@ -297,131 +519,97 @@ async def confirm_order(message: types.Message, state: FSMContext):
     
     await message.answer(
         "Заказ создан! Выберите способ оплаты:",
-        reply_markup=kb.as_markup(resize_keyboard=True))
+        reply_markup=kb.as_markup(resize_keyboard=True)
     )
-    await state.clear()
 
 # Оплата через CryptoBot
-@dp.message(F.text == "💰 Оплатить CryptoBot"))
+@dp.message(F.text == "💰 Оплатить CryptoBot")
 async def pay_with_cryptobot(message: types.Message):
-    db = load_db()
     user_id = message.from_user.id
     
     # Находим последний неоплаченный заказ пользователя
-    user_orders = [order for order_id, order in db['orders'].items() 
-                  if order['user_id'] == user_id and order['status'] == 'pending_payment']
+    user_orders = store.find_user_orders(user_id, status='pending_payment')
     
     if not user_orders:
         await message.answer("У вас нет заказов для оплаты.")
         return
     
-    last_order = user_orders[-1]
+    order_id, last_order = user_orders[-1]
     amount = last_order['amount']
     
     # Создаем инвойс в CryptoBot
-    headers = {
-        "Crypto-Pay-API-Token": CRYPTO_BOT_TOKEN,
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "amount": amount,
-        "asset": "USDT",  # Или другая валюта
-        "description": f"Оплата заказа #{list(db['orders'].keys())[-1]}",
-        "hidden_message": f"Оплата заказа {list(db['orders'].keys())[-1]}",
-        "paid_btn_name": "viewItem",
-        "paid_btn_url": "https://t.me/your_bot",
-        "payload": str(user_id)
-    }
-    
     try:
-        response = requests.post(f"{CRYPTO_BOT_API_URL}/createInvoice", headers=headers, json=payload)
-        response.raise_for_status()
-        invoice = response.json()['result']
+        # Курс берется из кэша и не задерживает ответ
+        invoice_amount = exchange_rates.convert(amount, INVOICE_ASSET)
+        invoice = await crypto_pay.create_invoice(
+            invoice_amount,
+            asset=INVOICE_ASSET,
+            description=f"Оплата заказа #{order_id}",
+            hidden_message=f"Оплата заказа {order_id}",
+            paid_btn_name="viewItem",
+            paid_btn_url="https://t.me/your_bot",
+            payload=str(user_id)
+        )
         
         # Сохраняем invoice_id в заказе
-        db['orders'][str(list(db['orders'].keys())[-1])]['invoice_id'] = invoice['invoice_id']
-        save_db(db)
+        store.update_order(order_id, invoice_id=invoice['invoice_id'])
         
         # Отправляем пользователю ссылку на оплату
         await message.answer(
-            f"Сумма к оплате: {amount} руб (~{amount / 75:.2f} USDT)\n\n"
+            f"Сумма к оплате: {amount} руб ({invoice_amount} {INVOICE_ASSET})\n\n"
             f"Оплатите по ссылке: {invoice['pay_url']}\n\n"
             "После оплаты бот автоматически подтвердит ваш заказ.",
-            reply_markup=get_back_kb())
+            reply_markup=get_back_kb()
         )
         
-        # Запускаем проверку оплаты
-        asyncio.create_task(check_payment(invoice['invoice_id'], user_id, list(db['orders'].keys())[-1]))
+        # Ставим счет на общую проверку оплаты
+        invoice_poller.register(invoice['invoice_id'], 'order', user_id, order_id)
         
     except Exception as e:
         logger.error(f"CryptoBot error: {e}")
         await message.answer(
             "Произошла ошибка при создании счета. Попробуйте позже или выберите другой способ оплаты.",
-            reply_markup=get_back_kb())
+            reply_markup=get_back_kb()
         )
 
-async def check_payment(invoice_id, user_id, order_id):
-    db = load_db()
-    headers = {
-        "Crypto-Pay-API-Token": CRYPTO_BOT_TOKEN
-    }
-    
-    for _ in range(30):  # Проверяем в течение 15 минут (30 раз по 30 секунд)
-        await asyncio.sleep(30)
+async def complete_order_payment(user_id, order_id):
+    async with accounts.transaction(user_id):
+        order = store.get_order(order_id)
+        if not order or order['status'] != 'pending_payment':
+            return
         
-        try:
-            response = requests.get(f"{CRYPTO_BOT_API_URL}/getInvoices?invoice_ids={invoice_id}", headers=headers)
-            response.raise_for_status()
-            invoice = response.json()['result']['items'][0]
-            
-            if invoice['status'] == 'paid':
-                # Обновляем статус заказа
-                db['orders'][order_id]['status'] = 'paid'
-                db['orders'][order_id]['paid_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                save_db(db)
-                
-                # Уведомляем пользователя
-                await bot.send_message(
-                    user_id,
-                    "✅ Оплата прошла успешно! Ваш заказ принят в обработку.",
-                    reply_markup=get_main_kb(user_id))
-                
-                # Уведомляем админов
-                for admin_id in db['admins']:
-                    try:
-                        await bot.send_message(
-                            admin_id,
-                            f"Новый оплаченный заказ #{order_id} от пользователя @{db['users'][str(user_id)]['username']}")
-                    except:
-                        continue
-                
-                return
-                
-        except Exception as e:
-            logger.error(f"Payment check error: {e}")
-            continue
+        # Обновляем статус заказа
+        store.update_order(order_id, status='paid', paid_at=now_str())
+    
+    # Уведомляем пользователя
+    outbox.send_message(
+        user_id,
+        "✅ Оплата прошла успешно! Ваш заказ принят в обработку.",
+        reply_markup=get_main_kb(user_id))
     
-    # Если оплата не прошла в течение 15 минут
-    await bot.send_message(
+    # Уведомляем админов
+    user = store.get_user(user_id) or {}
+    notify_admins(f"Новый оплаченный заказ #{order_id} от пользователя @{user.get('username')}")
+
+async def notify_payment_expired(user_id):
+    outbox.send_message(
         user_id,
         "Время на оплату истекло. Если вы произвели оплату, обратитесь в поддержку.",
         reply_markup=get_main_kb(user_id))
         # Часть 3: Реализация профиля и поддержки
 
-@dp.message(F.text == "👤 Профиль"))
+@dp.message(F.text == "👤 Профиль")
 async def cmd_profile(message: types.Message):
-    db = load_db()
     user_id = message.from_user.id
-    user_data = db['users'].get(str(user_id), {})
+    user_data = store.get_user(user_id) or {}
     
     if not user_data:
         await message.answer("Профиль не найден. Начните с команды /start")
         return
     
     # Статистика заказов
-    orders_count = len(user_data['orders'])
-    paid_orders = sum(1 for order_id in user_data['orders'] 
-                     if db['orders'].get(str(order_id), {}).get('status') == 'paid')
+    orders_count = len(user_data['orders']) + archive.user_order_count(user_id)
+    paid_orders = len(store.find_user_orders(user_id, status='paid'))
     
     profile_msg = (
         f"👤 Ваш профиль:\n\n"
@@ -438,17 +626,18 @@ async def cmd_profile(message: types.Message):
     kb.add(KeyboardButton(text="🔙 Назад"))
     kb.adjust(2)
     
-    await message.answer_photo(
-        photo="https://example.com/profile_image.jpg",
+    await menu_photos.answer_photo(
+        message,
+        'profile',
         caption=profile_msg,
-        reply_markup=kb.as_markup(resize_keyboard=True))
+        reply_markup=kb.as_markup(resize_keyboard=True)
     )
 
-@dp.message(F.text == "💳 Пополнить баланс"))
+@dp.message(F.text == "💳 Пополнить баланс")
 async def cmd_deposit(message: types.Message, state: FSMContext):
     await message.answer(
         "Введите сумму пополнения в рублях (минимум 100 руб):",
-        reply_markup=get_back_kb())
+        reply_markup=get_back_kb()
     )
     await state.set_state(PaymentStates.choosing_amount)
 
@@ -470,92 +659,117 @@ async def process_deposit_amount(message: types.Message, state: FSMContext):
     
     await message.answer(
         f"Сумма пополнения: {amount} руб\n\nВыберите способ оплаты:",
-        reply_markup=kb.as_markup(resize_keyboard=True))
+        reply_markup=kb.as_markup(resize_keyboard=True)
     )
     await state.set_state(PaymentStates.confirmation)
 
-@dp.message(PaymentStates.confirmation, F.text == "💰 Оплатить CryptoBot"))
+@dp.message(PaymentStates.confirmation, F.text == "💰 Оплатить CryptoBot")
 async def deposit_with_cryptobot(message: types.Message, state: FSMContext):
     data = await state.get_data()
     amount = data['amount']
     user_id = message.from_user.id
     
     # Создаем инвойс в CryptoBot
-    headers = {
-        "Crypto-Pay-API-Token": CRYPTO_BOT_TOKEN,
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "amount": amount,
-        "asset": "USDT",
-        "description": f"Пополнение баланса на {amount} руб",
-        "hidden_message": f"Пополнение баланса пользователя {user_id}",
-        "paid_btn_name": "viewItem",
-        "paid_btn_url": "https://t.me/your_bot",
-        "payload": f"deposit_{user_id}"
-    }
-    
     try:
-        response = requests.post(f"{CRYPTO_BOT_API_URL}/createInvoice", headers=headers, json=payload)
-        response.raise_for_status()
-        invoice = response.json()['result']
+        invoice_amount = exchange_rates.convert(amount, INVOICE_ASSET)
+        invoice = await crypto_pay.create_invoice(
+            invoice_amount,
+            asset=INVOICE_ASSET,
+            description=f"Пополнение баланса на {amount} руб",
+            hidden_message=f"Пополнение баланса пользователя {user_id}",
+            paid_btn_name="viewItem",
+            paid_btn_url="https://t.me/your_bot",
+            payload=f"deposit_{user_id}"
+        )
+        # Сумму в рублях из счета потом не восстановить — запоминаем ее в базе до зачисления
+        store.set_setting(deposit_invoice_key(invoice['invoice_id']), {'user_id': user_id, 'amount': amount})
         
         # Отправляем пользователю ссылку на оплату
         await message.answer(
-            f"Сумма к оплате: {amount} руб (~{amount / 75:.2f} USDT)\n\n"
+            f"Сумма к оплате: {amount} руб ({invoice_amount} {INVOICE_ASSET})\n\n"
             f"Оплатите по ссылке: {invoice['pay_url']}\n\n"
             "После оплаты баланс будет пополнен автоматически.",
-            reply_markup=get_back_kb())
+            reply_markup=get_back_kb()
         )
         
-        # Запускаем проверку оплаты
-        asyncio.create_task(check_deposit_payment(invoice['invoice_id'], user_id, amount))
+        # Ставим счет на общую проверку оплаты
+        invoice_poller.register(invoice['invoice_id'], 'deposit', user_id, amount)
         
     except Exception as e:
         logger.error(f"CryptoBot deposit error: {e}")
         await message.answer(
             "Произошла ошибка при создании счета. Попробуйте позже или выберите другой способ оплаты.",
-            reply_markup=get_back_kb())
+            reply_markup=get_back_kb()
         )
 
-async def check_deposit_payment(invoice_id, user_id, amount):
-    headers = {
-        "Crypto-Pay-API-Token": CRYPTO_BOT_TOKEN
-    }
-    
-    for _ in range(30):  # Проверяем в течение 15 минут
-        await asyncio.sleep(30)
-        
-        try:
-            response = requests.get(f"{CRYPTO_BOT_API_URL}/getInvoices?invoice_ids={invoice_id}", headers=headers)
-            response.raise_for_status()
-            invoice = response.json()['result']['items'][0]
-            
-            if invoice['status'] == 'paid':
-                # Обновляем баланс пользователя
-                db = load_db()
-                db['users'][str(user_id)]['balance'] = db['users'][str(user_id)].get('balance', 0) + amount
-                save_db(db)
-                
-                # Уведомляем пользователя
-                await bot.send_message(
-                    user_id,
-                    f"✅ Баланс успешно пополнен на {amount} руб!",
-                    reply_markup=get_main_kb(user_id))
-                
-                return
-                
-        except Exception as e:
-            logger.error(f"Deposit check error: {e}")
-            continue
+async def complete_deposit(user_id, amount):
+    # Обновляем баланс пользователя
+    await accounts.change_balance(user_id, amount)
     
-    # Если оплата не прошла в течение 15 минут
-    await bot.send_message(
+    # Уведомляем пользователя
+    outbox.send_message(
         user_id,
-        "Время на оплату истекло. Если вы произвели оплату, обратитесь в поддержку.",
+        f"✅ Баланс успешно пополнен на {amount} руб!",
         reply_markup=get_main_kb(user_id))
 
-@dp.message(F.text == "🆘 Поддержка"))
+# Открытые счета пополнения хранятся в базе (invoice_id → пользователь и сумма в
+# рублях), а не только в памяти InvoicePoller: оплату после перезапуска или
+# повтор вебхука после ошибки зачисления есть чем зачислить
+DEPOSIT_INVOICE_PREFIX = 'deposit_invoice_'
+deposits_in_progress = set()
+
+def deposit_invoice_key(invoice_id):
+    return f"{DEPOSIT_INVOICE_PREFIX}{invoice_id}"
+
+async def settle_deposit(invoice_id, user_id, amount):
+    # Запись о счете удаляется только после зачисления. Вебхук и опрос одного счета
+    # приходят в один процесс (по пользователю), поэтому хватает множества в памяти
+    if invoice_id in deposits_in_progress:
+        return
+    deposits_in_progress.add(invoice_id)
+    try:
+        await complete_deposit(user_id, amount)
+        store.delete_setting(deposit_invoice_key(invoice_id))
+    finally:
+        deposits_in_progress.discard(invoice_id)
+
+async def on_invoice_paid(invoice):
+    if invoice.kind == 'deposit':
+        await settle_deposit(invoice.invoice_id, invoice.user_id, invoice.ref)
+    else:
+        await complete_order_payment(invoice.user_id, invoice.ref)
+
+async def on_invoice_expired(invoice):
+    await notify_payment_expired(invoice.user_id)
+
+# Общая проверка оплаты всех открытых счетов (15 минут на оплату)
+invoice_poller = InvoicePoller(
+    crypto_pay,
+    on_paid=on_invoice_paid,
+    on_expired=on_invoice_expired,
+    interval=float(os.getenv('INVOICE_POLL_INTERVAL', '30')),
+    ttl=15 * 60
+)
+
+# Текущие значения очередей для /metrics
+registry.gauge('bot_outbox_depth', "Уведомления в очереди на отправку", lambda: outbox.depth)
+registry.gauge('bot_pending_invoices', "Открытые счета CryptoBot на проверке", lambda: invoice_poller.pending_count)
+registry.gauge('bot_store_pending_writes', "Изменения базы, еще не сброшенные на диск", lambda: store.pending_writes)
+registry.gauge('bot_exchange_rates_age_seconds', "Возраст кэша курсов CryptoBot (-1 — курсов еще не было)",
+               lambda: -1 if exchange_rates.age is None else exchange_rates.age)
+registry.gauge('bot_store_load_seconds', "Время загрузки базы при старте (бывший load_db)", lambda: store.load_seconds)
+registry.gauge('bot_event_loop_lag_seconds', "Задержка цикла событий", health.current_loop_lag)
+
+# Те же очереди в /readyz. Счета при BOT_WORKERS > 1 проверяют процессы-обработчики,
+# во входном процессе их число неизвестно
+health.gauge('store_pending_writes', lambda: store.pending_writes)
+health.gauge('outbox_depth', lambda: outbox.depth)
+health.gauge('pending_invoices', lambda: invoice_poller.pending_count if worker_pool is None else None)
+if worker_pool is not None:
+    health.gauge('workers', lambda: worker_pool.count)
+    health.gauge('workers_alive', worker_pool.alive)
+
+@dp.message(F.text == "🆘 Поддержка")
 async def cmd_support(message: types.Message):
     support_msg = (
         "🆘 Поддержка\n\n"
@@ -571,90 +785,187 @@ async def cmd_support(message: types.Message):
         "⏳ Время ответа: обычно в течение 1 часа в рабочее время (10:00-20:00 МСК)"
     )
     
-    await message.answer_photo(
-        photo="https://example.com/support_image.jpg",
+    await menu_photos.answer_photo(
+        message,
+        'support',
         caption=support_msg,
-        reply_markup=get_back_kb())
+        reply_markup=get_back_kb()
     )
     # Часть 4: Реализация админ-панели
 
-@dp.message(F.text == "👑 Админ"))
+@dp.message(F.text == "👑 Админ")
 async def cmd_admin(message: types.Message):
-    db = load_db()
     user_id = message.from_user.id
     
-    if user_id not in db['admins']:
+    if not store.is_admin(user_id):
         await message.answer("У вас нет доступа к админ-панели.")
         return
     
-    kb = ReplyKeyboardBuilder()
-    kb.add(KeyboardButton(text="📊 Статистика бота"))
-    kb.add(KeyboardButton(text="📦 Управление заказами"))
-    kb.add(KeyboardButton(text="👥 Назначить админа"))
-    kb.add(KeyboardButton(text="👥 Снять админа"))
-    kb.add(KeyboardButton(text="💰 Изменить баланс"))
-    kb.add(KeyboardButton(text="🔙 Назад"))
-    kb.adjust(2)
-    
-    await message.answer_photo(
-        photo="https://example.com/admin_image.jpg",
+    await menu_photos.answer_photo(
+        message,
+        'admin',
         caption="👑 Админ-панель",
-        reply_markup=kb.as_markup(resize_keyboard=True))
+        reply_markup=get_admin_kb()
     )
 
-@dp.message(F.text == "📊 Статистика бота"))
+@dp.message(F.text == "📊 Статистика бота")
 async def cmd_bot_stats(message: types.Message):
-    db = load_db()
-    
-    total_users = len(db['users'])
-    total_orders = len(db['orders'])
-    paid_orders = sum(1 for order in db['orders'].values() if order['status'] == 'paid')
-    total_revenue = sum(order['amount'] for order in db['orders'].values() if order['status'] == 'paid')
+    week = stats.last_days(7)
+    today = stats.last_days(1)
+    by_status = ", ".join(f"{status}: {count}" for status, count in stats.by_status.items() if count)
+    by_service = "\n".join(
+        f"• {service}: {stats.revenue_by_service.get(service, 0)} руб" for service in SERVICE_PRICES)
+    by_platform = "\n".join(
+        f"• {platform}: {revenue} руб" for platform, revenue in sorted(stats.revenue_by_platform.items()) if platform)
     
     stats_msg = (
         "📊 Статистика бота:\n\n"
-        f"👥 Пользователей: {total_users}\n"
-        f"📦 Всего заказов: {total_orders}\n"
-        f"💰 Оплаченных заказов: {paid_orders}\n"
-        f"💵 Общая выручка: {total_revenue} руб\n\n"
+        f"👥 Пользователей: {stats.users}\n"
+        f"📦 Всего заказов: {stats.orders}\n"
+        f"💰 Оплаченных заказов: {stats.paid}\n"
+        f"💵 Общая выручка: {stats.revenue} руб\n\n"
+        f"📌 По статусам: {by_status}\n\n"
+        f"🛒 Выручка по услугам:\n{by_service}\n\n"
+        f"🖥 Выручка по платформам:\n{by_platform or '—'}\n\n"
+        f"📅 Сегодня: {today.users} польз., {today.orders} заказов, {today.paid} оплачено, {today.revenue} руб\n"
+        f"📅 За 7 дней: {week.users} польз., {week.orders} заказов, {week.paid} оплачено, {week.revenue} руб\n\n"
         f"🔄 Последнее обновление: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}"
     )
     
     await message.answer(stats_msg, reply_markup=get_back_kb())
 
-@dp.message(F.text == "📦 Управление заказами"))
+ORDER_STATUS_LABELS = {
+    "pending_payment": "Ждет оплаты",
+    "paid": "Оплачен",
+    "in_progress": "В работе",
+    "completed": "Выполнен",
+    "rejected": "Отклонен"
+}
+ORDER_PLATFORMS = ["Kick", "YouTube", "Twitch"]
+ORDER_PAGE_SIZE = 10
+
+# Страница списка заказов: фильтры хранятся в данных FSM, а в кнопках
+# навигации — только номер крайнего заказа (keyset-пагинация)
+def render_orders_page(filters, before=None, after=None):
+    orders, has_older, has_newer = store.page_orders(
+        **filters, before=before, after=after, limit=ORDER_PAGE_SIZE)
+    
+    kb = InlineKeyboardBuilder()
+    for order_id, order in orders:
+        kb.row(InlineKeyboardButton(
+            text=f"#{order_id} - {order['status']} - {order.get('platform')}",
+            callback_data=f"order_{order_id}"))
+    
+    nav = []
+    if has_newer:
+        nav.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=f"opage_after_{orders[0][0]}"))
+    if has_older:
+        nav.append(InlineKeyboardButton(text="Старее ➡️", callback_data=f"opage_before_{orders[-1][0]}"))
+    if nav:
+        kb.row(*nav)
+    
+    # Фильтры по статусу и платформе; текущий отмечен галочкой
+    mark = lambda active, text: f"✔️ {text}" if active else text
+    statuses = [("all", "Все")] + list(ORDER_STATUS_LABELS.items())
+    status_buttons = [
+        InlineKeyboardButton(
+            text=mark(filters.get('status') == (None if status == "all" else status), label),
+            callback_data=f"ofilter_status_{status}")
+        for status, label in statuses]
+    kb.row(*status_buttons[:3])
+    kb.row(*status_buttons[3:])
+    kb.row(*[
+        InlineKeyboardButton(
+            text=mark(filters.get('platform') == (None if platform == "all" else platform),
+                      "Все платформы" if platform == "all" else platform),
+            callback_data=f"ofilter_platform_{platform}")
+        for platform in ["all"] + ORDER_PLATFORMS])
+    if filters.get('user_id') is not None or filters.get('channel') is not None:
+        kb.row(InlineKeyboardButton(text="✖️ Сбросить поиск", callback_data="ofilter_reset"))
+    
+    text = "Выберите заказ для управления:"
+    if filters.get('user_id') is not None:
+        text += f"\n👤 Пользователь: {filters['user_id']}"
+    if filters.get('channel') is not None:
+        text += f"\n📺 Канал: {filters['channel']}"
+    if not orders:
+        text += "\n\nЗаказов не найдено."
+    text += "\n\nДля поиска отправьте номер заказа (#123), ID пользователя (id 123456) или название канала."
+    return text, kb.as_markup()
+
+async def show_orders_page(callback, state, before=None, after=None):
+    data = await state.get_data()
+    filters = data.get('order_filters', {})
+    await state.update_data(order_page={'before': before, 'after': after})
+    text, markup = render_orders_page(filters, before=before, after=after)
+    await callback.message.edit_text(text, reply_markup=markup)
+
+@dp.message(F.text == "📦 Управление заказами")
 async def cmd_manage_orders(message: types.Message, state: FSMContext):
-    db = load_db()
+    if not store.is_admin(message.from_user.id):
+        await message.answer("У вас нет доступа к админ-панели.")
+        return
     
-    if not db['orders']:
+    active = store.count_orders()
+    archived = archive.count() if not active else 0
+    if not active and not archived:
         await message.answer("Нет заказов для управления.")
         return
     
-    # Создаем клавиатуру с заказами
-    kb = InlineKeyboardBuilder()
-    for order_id, order in list(db['orders'].items())[-10:]:  # Последние 10 заказов
-        kb.add(InlineKeyboardButton(
-            text=f"#{order_id} - {order['status']}",
-            callback_data=f"order_{order_id}"))
-    
-    kb.adjust(1)
-    await message.answer(
-        "Выберите заказ для управления:",
-        reply_markup=kb.as_markup())
-    )
     await state.set_state(AdminStates.managing_orders)
+    await state.update_data(order_filters={}, order_page={})
+    if not active:
+        # Все заказы в архиве: списка нет, но поиск по номеру их находит
+        await message.answer(
+            f"Активных заказов нет, в архиве {archived}. "
+            f"Чтобы открыть архивный заказ, отправьте его номер: #123"
+        )
+        return
+    text, markup = render_orders_page({})
+    await message.answer(text, reply_markup=markup)
 
-@dp.callback_query(F.data.startswith("order_"), AdminStates.managing_orders)
-async def process_order_selection(callback: types.CallbackQuery, state: FSMContext):
-    order_id = callback.data.split("_")[1]
-    db = load_db()
-    order = db['orders'].get(order_id)
+@dp.callback_query(F.data.startswith("opage_"), AdminStates.managing_orders)
+async def process_orders_page(callback: types.CallbackQuery, state: FSMContext):
+    _, direction, order_id = callback.data.split("_", 2)
+    if direction == "after":
+        await show_orders_page(callback, state, after=int(order_id))
+    else:
+        await show_orders_page(callback, state, before=int(order_id))
+    await callback.answer()
+
+@dp.callback_query(F.data.startswith("ofilter_"), AdminStates.managing_orders)
+async def process_orders_filter(callback: types.CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    filters = dict(data.get('order_filters', {}))
     
+    if callback.data == "ofilter_reset":
+        filters.pop('user_id', None)
+        filters.pop('channel', None)
+    else:
+        _, field, value = callback.data.split("_", 2)
+        filters[field] = None if value == "all" else value
+    
+    await state.update_data(order_filters={key: value for key, value in filters.items() if value is not None})
+    await show_orders_page(callback, state)
+    await callback.answer()
+
+@dp.callback_query(F.data == "back_to_orders", AdminStates.managing_orders)
+async def process_back_to_orders(callback: types.CallbackQuery, state: FSMContext):
+    page = (await state.get_data()).get('order_page', {})
+    await show_orders_page(callback, state, before=page.get('before'), after=page.get('after'))
+    await callback.answer()
+
+async def render_order_card(order_id):
+    order = store.get_order(order_id)
+    archived = False
     if not order:
-        await callback.answer("Заказ не найден!")
-        return
+        # Архив читается с диска и распаковывается — не в цикле событий
+        order = await asyncio.to_thread(archive.get_order, order_id)
+        archived = True
+    if not order:
+        return None
     
-    user = db['users'].get(str(order['user_id']), {})
+    user = store.get_user(order['user_id']) or {}
     username = user.get('username', 'неизвестно')
     
     order_msg = (
@@ -670,26 +981,37 @@ async def process_order_selection(callback: types.CallbackQuery, state: FSMConte
         f"🕒 Создан: {order['created_at']}"
     )
     
-    # Кнопки для изменения статуса
     kb = InlineKeyboardBuilder()
+    if archived:
+        # Архивные заказы только для просмотра
+        order_msg += "\n🗄 В архиве"
+        kb.add(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_orders"))
+        return order_msg, kb.as_markup()
+    
+    # Кнопки для изменения статуса
     kb.add(InlineKeyboardButton(text="✅ Подтвердить", callback_data=f"confirm_{order_id}"))
     kb.add(InlineKeyboardButton(text="❌ Отклонить", callback_data=f"reject_{order_id}"))
     kb.add(InlineKeyboardButton(text="🔄 В процессе", callback_data=f"process_{order_id}"))
     kb.add(InlineKeyboardButton(text="🔙 Назад", callback_data="back_to_orders"))
     kb.adjust(2)
+    return order_msg, kb.as_markup()
+
+@dp.callback_query(F.data.startswith("order_"), AdminStates.managing_orders)
+async def process_order_selection(callback: types.CallbackQuery, state: FSMContext):
+    order_id = callback.data.split("_")[1]
+    card = await render_order_card(order_id)
+    
+    if not card:
+        await callback.answer("Заказ не найден!")
+        return
     
-    await callback.message.edit_text(order_msg, reply_markup=kb.as_markup())
+    order_msg, markup = card
+    await callback.message.edit_text(order_msg, reply_markup=markup)
     await callback.answer()
 
 @dp.callback_query(F.data.startswith(("confirm_", "reject_", "process_")), AdminStates.managing_orders)
-async def process_order_status_change(callback: types.CallbackQuery):
+async def process_order_status_change(callback: types.CallbackQuery, state: FSMContext):
     action, order_id = callback.data.split("_")
-    db = load_db()
-    order = db['orders'].get(order_id)
-    
-    if not order:
-        await callback.answer("Заказ не найден!")
-        return
     
     status_map = {
         "confirm": "completed",
@@ -697,59 +1019,56 @@ async def process_order_status_change(callback: types.CallbackQuery):
         "process": "in_progress"
     }
     
-    order['status'] = status_map[action]
-    save_db(db)
+    order = store.update_order(order_id, status=status_map[action])
+    
+    if not order:
+        await callback.answer("Заказ не найден!")
+        return
     
     # Уведомляем пользователя
-    try:
-        status_messages = {
-            "completed": "✅ Ваш заказ #{} выполнен!",
-            "rejected": "❌ Ваш заказ #{} отклонен. Для уточнений обратитесь в поддержку.",
-            "in_progress": "🔄 Ваш заказ #{} взят в работу."
-        }
-        await bot.send_message(
-            order['user_id'],
-            status_messages[status_map[action]].format(order_id))
-    except:
-        pass
+    status_messages = {
+        "completed": "✅ Ваш заказ #{} выполнен!",
+        "rejected": "❌ Ваш заказ #{} отклонен. Для уточнений обратитесь в поддержку.",
+        "in_progress": "🔄 Ваш заказ #{} взят в работу."
+    }
+    outbox.send_message(
+        order['user_id'],
+        status_messages[status_map[action]].format(order_id))
     
     await callback.answer(f"Статус заказа #{order_id} изменен на {order['status']}")
-    await cmd_manage_orders(callback.message, callback.message.from_user.id)
+    page = (await state.get_data()).get('order_page', {})
+    await show_orders_page(callback, state, before=page.get('before'), after=page.get('after'))
 
-@dp.message(F.text == "👥 Назначить админа"))
+@dp.message(F.text == "👥 Назначить админа")
 async def cmd_add_admin(message: types.Message, state: FSMContext):
     await message.answer(
         "Введите ID пользователя, которого хотите назначить админом:",
-        reply_markup=get_back_kb())
+        reply_markup=get_back_kb()
     )
     await state.set_state(AdminStates.adding_admin)
 
 @dp.message(AdminStates.adding_admin, F.text.regexp(r'^\d+$'))
 async def process_add_admin(message: types.Message, state: FSMContext):
-    db = load_db()
     new_admin_id = int(message.text)
     
-    if new_admin_id in db['admins']:
+    if not store.add_admin(new_admin_id):
         await message.answer("Этот пользователь уже является админом.")
         return
     
-    db['admins'].append(new_admin_id)
-    save_db(db)
-    
     await message.answer(f"Пользователь {new_admin_id} назначен админом.")
     await state.clear()
     await cmd_admin(message)
 
-@dp.message(F.text == "👥 Снять админа"))
+@dp.message(F.text == "👥 Снять админа")
 async def cmd_remove_admin(message: types.Message, state: FSMContext):
-    db = load_db()
+    admins = store.get_admins()
     
-    if len(db['admins']) <= 1:
+    if len(admins) <= 1:
         await message.answer("Нельзя снять последнего админа!")
         return
     
     kb = ReplyKeyboardBuilder()
-    for admin_id in db['admins']:
+    for admin_id in admins:
         if admin_id != message.from_user.id:  # Нельзя снять себя
             kb.add(KeyboardButton(text=str(admin_id)))
     kb.add(KeyboardButton(text="🔙 Назад"))
@@ -757,16 +1076,15 @@ async def cmd_remove_admin(message: types.Message, state: FSMContext):
     
     await message.answer(
         "Выберите ID админа, которого хотите снять:",
-        reply_markup=kb.as_markup(resize_keyboard=True))
+        reply_markup=kb.as_markup(resize_keyboard=True)
     )
     await state.set_state(AdminStates.removing_admin)
 
 @dp.message(AdminStates.removing_admin, F.text.regexp(r'^\d+$'))
 async def process_remove_admin(message: types.Message, state: FSMContext):
-    db = load_db()
     admin_id = int(message.text)
     
-    if admin_id not in db['admins']:
+    if not store.is_admin(admin_id):
         await message.answer("Этот пользователь не является админом.")
         return
     
@@ -774,18 +1092,17 @@ async def process_remove_admin(message: types.Message, state: FSMContext):
         await message.answer("Вы не можете снять себя. Обратитесь к другому админу.")
         return
     
-    db['admins'].remove(admin_id)
-    save_db(db)
+    store.remove_admin(admin_id)
     
     await message.answer(f"Пользователь {admin_id} больше не админ.")
     await state.clear()
     await cmd_admin(message)
 
-@dp.message(F.text == "💰 Изменить баланс"))
+@dp.message(F.text == "💰 Изменить баланс")
 async def cmd_change_balance(message: types.Message, state: FSMContext):
     await message.answer(
         "Введите ID пользователя и сумму через пробел (например, '123456 500' для пополнения или '123456 -500' для списания):",
-        reply_markup=get_back_kb())
+        reply_markup=get_back_kb()
     )
     await state.set_state(AdminStates.changing_balance)
 
@@ -795,69 +1112,362 @@ async def process_change_balance(message: types.Message, state: FSMContext):
     user_id = int(user_id)
     amount = int(amount)
     
-    db = load_db()
-    if str(user_id) not in db['users']:
+    try:
+        result = await accounts.change_balance(user_id, amount)
+    except ValueError:
+        await message.answer("Нельзя установить отрицательный баланс.")
+        return
+    
+    if result is None:
         await message.answer("Пользователь не найден.")
         return
     
-    current_balance = db['users'][str(user_id)].get('balance', 0)
-    new_balance = current_balance + amount
+    current_balance, new_balance = result
     
-    if new_balance < 0:
-        await message.answer("Нельзя установить отрицательный баланс.")
+    # Уведомляем пользователя
+    outbox.send_message(
+        user_id,
+        f"Ваш баланс был изменен администратором.\n"
+        f"Изменение: {'+' if amount >= 0 else ''}{amount} руб\n"
+        f"Новый баланс: {new_balance} руб")
+    
+    await message.answer(
+        f"Баланс пользователя {user_id} изменен.\n"
+        f"Старый баланс: {current_balance} руб\n"
+        f"Изменение: {'+' if amount >= 0 else ''}{amount} руб\n"
+        f"Новый баланс: {new_balance} руб")
+    
+    await state.clear()
+    await cmd_admin(message)
+
+# Массовое начисление: файл CSV/TXT со строками "user_id,сумма" проверяется
+# целиком и применяется одним пакетом; ответ — одна сводка
+BULK_BALANCE_MAX_BYTES = int(os.getenv('BULK_BALANCE_MAX_BYTES', str(1024 * 1024)))
+BULK_BALANCE_MAX_ERRORS = 20
+
+@dp.message(F.text == "📥 Массовое начисление")
+async def cmd_bulk_balance(message: types.Message, state: FSMContext):
+    if not store.is_admin(message.from_user.id):
         return
     
-    db['users'][str(user_id)]['balance'] = new_balance
-    save_db(db)
+    await message.answer(
+        "Отправьте файл CSV или TXT: в каждой строке ID пользователя и сумма через запятую, "
+        "точку с запятой или пробел (например, '123456,500' или '123456;-500').\n"
+        "Заголовок, пустые строки и строки с # пропускаются, суммы одного пользователя складываются.",
+        reply_markup=get_back_kb()
+    )
+    await state.set_state(AdminStates.bulk_balance)
+
+@dp.message(AdminStates.bulk_balance, F.document)
+async def process_bulk_balance(message: types.Message, state: FSMContext):
+    if not store.is_admin(message.from_user.id):
+        return
     
-    # Уведомляем пользователя
+    document = message.document
+    if document.file_size and document.file_size > BULK_BALANCE_MAX_BYTES:
+        await message.answer(f"Файл слишком большой (больше {BULK_BALANCE_MAX_BYTES // 1024} КБ).")
+        return
+    
+    buffer = await bot.download(document)
     try:
-        await bot.send_message(
+        text = buffer.getvalue().decode('utf-8-sig')
+    except UnicodeDecodeError:
+        await message.answer("Файл должен быть в кодировке UTF-8.")
+        return
+    
+    rows, errors = parse_balance_rows(text)
+    if not rows:
+        await message.answer("В файле нет ни одной строки с начислением.")
+        return
+    
+    lines = len(rows) + len(errors)
+    changes = {}
+    for _, user_id, amount in rows:
+        changes[user_id] = changes.get(user_id, 0) + amount
+    
+    applied, failed = await accounts.change_balances(changes)
+    
+    for user_id, (current_balance, new_balance) in applied.items():
+        amount = changes[user_id]
+        outbox.send_message(
             user_id,
             f"Ваш баланс был изменен администратором.\n"
             f"Изменение: {'+' if amount >= 0 else ''}{amount} руб\n"
             f"Новый баланс: {new_balance} руб")
-    except:
-        pass
     
-    await message.answer(
-        f"Баланс пользователя {user_id} изменен.\n"
-        f"Старый баланс: {current_balance} руб\n"
-        f"Изменение: {'+' if amount >= 0 else ''}{amount} руб\n"
-        f"Новый баланс: {new_balance} руб")
+    reasons = {'not_found': "пользователь не найден", 'negative': "баланс ушел бы в минус"}
+    errors += [(line_number, f"{user_id}: {reasons[failed[user_id]]}")
+               for line_number, user_id, _ in rows if user_id in failed]
+    errors.sort()
+    
+    summary = (
+        f"📥 Массовое начисление\n\n"
+        f"Строк в файле: {lines}\n"
+        f"Изменено балансов: {len(applied)}\n"
+        f"Итого: {sum(changes[user_id] for user_id in applied):+} руб\n"
+        f"Ошибок: {len(errors)}")
+    if errors:
+        summary += "\n\n" + "\n".join(
+            f"Строка {line_number}: {reason}" for line_number, reason in errors[:BULK_BALANCE_MAX_ERRORS])
+        if len(errors) > BULK_BALANCE_MAX_ERRORS:
+            summary += f"\n… и еще {len(errors) - BULK_BALANCE_MAX_ERRORS}"
+    await message.answer(summary)
     
     await state.clear()
     await cmd_admin(message)
-    # Обработка ошибок
-@dp.error()
-async def error_handler(event: types.Update, exception: Exception):
-    logger.error(f"Ошибка: {exception}", exc_info=True)
+
+# Рассылка: админ присылает любое сообщение (текст, фото, видео), бот
+# показывает его и после подтверждения копирует всем пользователям
+@dp.message(F.text == "📣 Рассылка")
+async def cmd_broadcast(message: types.Message, state: FSMContext):
+    if not store.is_admin(message.from_user.id):
+        return
     
-    # Перезагрузка бота при критических ошибках
-    if isinstance(exception, (KeyboardInterrupt, SystemExit)):
-        raise exception
+    current = broadcaster.state()
+    if current and current['status'] == 'running':
+        await message.answer(format_progress(current), reply_markup=stop_markup())
+        return
     
-    # Уведомление админов об ошибке
-    db = load_db()
-    for admin_id in db['admins']:
-        try:
-            await bot.send_message(
-                admin_id,
-                f"⚠️ Произошла ошибка в боте:\n\n{str(exception)[:3000]}")
-        except:
-            continue
-    
-    # Перезапуск бота через 5 секунд
-    await asyncio.sleep(5)
-    await dp.start_polling(bot, skip_updates=True)
-    # Запускаем поллинг с авто-рестартом
-    while True:
+    await message.answer(
+        f"Отправьте сообщение для рассылки — его получат все пользователи ({store.count_users()}). "
+        f"Можно текст, фото или видео с подписью.",
+        reply_markup=get_back_kb()
+    )
+    await state.set_state(AdminStates.broadcast_message)
+
+@dp.message(AdminStates.broadcast_message, ~F.text.in_(ADMIN_MENU_BUTTONS))
+async def process_broadcast_message(message: types.Message, state: FSMContext):
+    if not store.is_admin(message.from_user.id):
+        return
+    
+    await state.update_data(broadcast_message_id=message.message_id)
+    
+    kb = InlineKeyboardBuilder()
+    kb.add(InlineKeyboardButton(text="✅ Отправить", callback_data="broadcast_confirm"))
+    kb.add(InlineKeyboardButton(text="❌ Отмена", callback_data="broadcast_cancel"))
+    await message.answer(
+        f"Разослать это сообщение {store.count_users()} пользователям?",
+        reply_markup=kb.as_markup()
+    )
+
+@dp.callback_query(F.data == "broadcast_confirm", AdminStates.broadcast_message)
+async def process_broadcast_confirm(callback: types.CallbackQuery, state: FSMContext):
+    if not store.is_admin(callback.from_user.id):
+        await callback.answer()
+        return
+    
+    message_id = (await state.get_data()).get('broadcast_message_id')
+    progress = await callback.message.edit_text("📣 Рассылка запускается...")
+    if not broadcaster.begin(callback.from_user.id, callback.message.chat.id, message_id, progress.message_id):
+        await progress.edit_text("Рассылка уже идет. Дождитесь ее окончания или остановите.")
+    await callback.answer()
+    await state.clear()
+    await callback.message.answer("👑 Админ-панель", reply_markup=get_admin_kb())
+
+@dp.callback_query(F.data == "broadcast_cancel", AdminStates.broadcast_message)
+async def process_broadcast_cancel(callback: types.CallbackQuery, state: FSMContext):
+    await callback.message.edit_text("Рассылка отменена.")
+    await callback.answer()
+    await state.clear()
+    await callback.message.answer("👑 Админ-панель", reply_markup=get_admin_kb())
+
+@dp.callback_query(F.data == "broadcast_stop")
+async def process_broadcast_stop(callback: types.CallbackQuery):
+    if not store.is_admin(callback.from_user.id):
+        await callback.answer()
+        return
+    
+    stopped = broadcaster.cancel()
+    if stopped is None:
+        await callback.answer("Рассылка уже завершена.")
+        return
+    await callback.message.edit_text(format_progress(stopped))
+    await callback.answer("Рассылка остановлена")
+
+# Выгрузка заказов или пользователей файлом: строки пишутся потоком во
+# временный файл в отдельном потоке и отправляются документом.
+# Bot API принимает документы до 50 МБ (свой сервер Bot API — до 2 ГБ)
+EXPORT_MAX_BYTES = int(os.getenv('EXPORT_MAX_BYTES', str(50 * 1024 * 1024)))
+EXPORT_USAGE = (
+    "📤 Экспорт: /export orders|users [csv|jsonl] [статус] [с даты] [по дату]\n\n"
+    "Формат csv (по умолчанию) или jsonl — JSON Lines в gzip.\n"
+    f"Статусы заказов: {', '.join(ORDER_STATUS_LABELS)}.\n"
+    "Даты — 2024-06-15 или 15.06.2024, включительно; для пользователей — дата регистрации.\n\n"
+    "Например: /export orders csv paid 01.06.2024 30.06.2024"
+)
+# Выгрузки идут по одной, чтобы не читать базу несколько раз параллельно
+export_lock = asyncio.Lock()
+
+def parse_export_args(args):
+    # Параметры для export.export или None, если аргументы не разобраны
+    params = {'kind': None, 'fmt': 'csv', 'status': None, 'date_from': None, 'date_to': None}
+    for arg in args:
+        date = export.parse_date(arg)
+        if arg in ('orders', 'users') and params['kind'] is None:
+            params['kind'] = arg
+        elif arg in export.FORMATS:
+            params['fmt'] = arg
+        elif arg in ORDER_STATUS_LABELS and params['status'] is None:
+            params['status'] = arg
+        elif date and params['date_from'] is None:
+            params['date_from'] = date
+        elif date and params['date_to'] is None:
+            params['date_to'] = date
+        else:
+            return None
+    if params['kind'] is None or (params['kind'] == 'users' and params['status']):
+        return None
+    return params
+
+async def send_export(message: types.Message, params):
+    if export_lock.locked():
+        await message.answer("Другая выгрузка еще готовится, подождите.")
+        return
+    
+    async with export_lock:
+        progress = await message.answer("⏳ Готовлю выгрузку...")
+        file, count, filename = await asyncio.to_thread(export.export, store, archive=archive, **params)
         try:
-            await dp.start_polling(bot, skip_updates=True)
-        except Exception as e:
-            print(f"Ошибка: {e}\nПерезапуск через 5 секунд...")
-            await asyncio.sleep(5)
+            await asyncio.to_thread(file.seek, 0, os.SEEK_END)
+            size = file.tell()
+            if size > EXPORT_MAX_BYTES:
+                await progress.edit_text(
+                    f"Файл получился {size // 2 ** 20} МБ — больше лимита {EXPORT_MAX_BYTES // 2 ** 20} МБ. "
+                    f"Сузьте выгрузку фильтрами или выберите jsonl.")
+                return
+            await message.answer_document(
+                export.SpooledInputFile(file, filename),
+                caption=f"📤 {filename}\nСтрок: {count}"
+            )
+            await progress.delete()
+        finally:
+            file.close()
+
+@dp.message(F.text == "📤 Экспорт")
+async def cmd_export_menu(message: types.Message):
+    if not store.is_admin(message.from_user.id):
+        return
+    
+    kb = InlineKeyboardBuilder()
+    kb.add(InlineKeyboardButton(text="📦 Заказы CSV", callback_data="export_orders_csv"))
+    kb.add(InlineKeyboardButton(text="📦 Заказы JSONL", callback_data="export_orders_jsonl"))
+    kb.add(InlineKeyboardButton(text="👥 Пользователи CSV", callback_data="export_users_csv"))
+    kb.add(InlineKeyboardButton(text="👥 Пользователи JSONL", callback_data="export_users_jsonl"))
+    kb.adjust(2)
+    await message.answer(EXPORT_USAGE, reply_markup=kb.as_markup())
+
+@dp.message(Command("export"))
+async def cmd_export(message: types.Message, command: CommandObject):
+    if not store.is_admin(message.from_user.id):
+        return
+    
+    params = parse_export_args((command.args or "").lower().split())
+    if params is None:
+        await message.answer(EXPORT_USAGE)
+        return
+    await send_export(message, params)
+
+@dp.callback_query(F.data.startswith("export_"))
+async def process_export(callback: types.CallbackQuery):
+    if not store.is_admin(callback.from_user.id):
+        await callback.answer()
+        return
+    
+    _, kind, fmt = callback.data.split("_")
+    await callback.answer()
+    await send_export(callback.message, {'kind': kind, 'fmt': fmt})
+
+# Поиск в управлении заказами: #номер, id пользователя или название канала.
+# Регистрируется после кнопок админ-панели, чтобы не перехватывать их
+@dp.message(AdminStates.managing_orders, F.text)
+async def process_orders_search(message: types.Message, state: FSMContext):
+    query = message.text.strip()
+    
+    order_match = re.fullmatch(r'#(\d+)', query)
+    if order_match:
+        card = await render_order_card(order_match.group(1))
+        if not card:
+            await message.answer("Заказ не найден!")
+            return
+        order_msg, markup = card
+        await message.answer(order_msg, reply_markup=markup)
+        return
+    
+    data = await state.get_data()
+    filters = dict(data.get('order_filters', {}))
+    filters.pop('user_id', None)
+    filters.pop('channel', None)
+    user_match = re.fullmatch(r'id\s*(\d+)', query, re.IGNORECASE)
+    if user_match:
+        filters['user_id'] = int(user_match.group(1))
+    else:
+        filters['channel'] = query
+    
+    await state.update_data(order_filters=filters, order_page={})
+    text, markup = render_orders_page(filters)
+    await message.answer(text, reply_markup=markup)
+
+# Обработка ошибок хендлеров (и в процессах-обработчиках при BOT_WORKERS > 1).
+# Только лог и уведомление: обновления получает main() (или входной процесс),
+# а повторный start_polling отсюда конфликтовал бы с вебхуком и основным опросом
+@dp.error()
+async def error_handler(event: types.ErrorEvent):
+    exception = event.exception
+    logger.error(f"Ошибка: {exception}", exc_info=exception)
+
+    # Уведомление админов об ошибке
+    notify_admins(f"⚠️ Произошла ошибка в боте:\n\n{str(exception)[:3000]}")
+
+# Вебхук CryptoBot: счет оплачен
+async def on_cryptobot_invoice_paid(invoice):
+    pending = invoice_poller.resolve(invoice['invoice_id'])
+    if pending is not None:
+        await on_invoice_paid(pending)
+        return
+    
+    # Счета нет в реестре опроса (например, после перезапуска) — определяем по payload
+    payload = invoice.get('payload', '')
+    if payload.startswith('deposit_'):
+        deposit = store.get_setting(deposit_invoice_key(invoice['invoice_id']))
+        if deposit is not None:
+            await settle_deposit(invoice['invoice_id'], deposit['user_id'], deposit['amount'])
+            return
+        # Счет уже зачислен или создан до хранения счетов в базе — передаем админам
+        logger.warning(f"Unknown deposit invoice {invoice['invoice_id']} paid")
+        notify_admins(f"Оплачен неизвестный счет пополнения #{invoice['invoice_id']} ({payload}), проверьте вручную")
+    elif payload.isdigit():
+        user_id = int(payload)
+        for order_id, order in store.find_user_orders(user_id, status='pending_payment'):
+            if order.get('invoice_id') == invoice['invoice_id']:
+                await complete_order_payment(user_id, order_id)
+
+def create_web_app():
+    app = web.Application(middlewares=[health.webhook_middleware(TELEGRAM_WEBHOOK_PATH)])
+    health.setup(app)
+    if worker_pool is not None:
+        # Метрики хендлеров живут в процессах-обработчиках — /metrics собирает их со всех
+        app.router.add_get('/metrics', pooled_metrics_handler(worker_pool.metrics_ports))
+        # Оплату обрабатывает процесс, который создавал счет
+        app.router.add_post('/cryptobot/webhook', create_webhook_handler(CRYPTO_BOT_TOKEN, worker_pool.on_invoice_paid))
+        if BOT_RUN_MODE == 'webhook':
+            app.router.add_post(TELEGRAM_WEBHOOK_PATH, worker_pool.webhook_handler(WEBHOOK_SECRET))
+        return app
+    app.router.add_get('/metrics', metrics_handler)
+    app.router.add_post('/cryptobot/webhook', create_webhook_handler(CRYPTO_BOT_TOKEN, on_cryptobot_invoice_paid))
+    if BOT_RUN_MODE == 'webhook':
+        app.router.add_post(TELEGRAM_WEBHOOK_PATH, telegram_webhook.handle)
+    return app
 
 if __name__ == "__main__":
-    # Для Render: просто вызываем main()
-    asyncio.run(main())
+    # Для Render: веб-приложение принимает вебхуки и отвечает на проверки /healthz и /readyz
+    app = create_web_app()
+    runner = web.AppRunner(app)
+    
+    async def start():
+        await runner.setup()
+        site = web.TCPSite(runner, '0.0.0.0', WEB_PORT)
+        await site.start()
+        health.start()
+        await main()
+    
+    asyncio.run(start())
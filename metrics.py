@@ -0,0 +1,340 @@
+import time
+import bisect
+import asyncio
+import threading
+
+import aiohttp
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+
+from tracing import record_span
+
+# Границы корзин гистограмм задержки, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(names, values), *extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _with_label(labels, name, value):
+    pair = f'{name}="{_escape(value)}"'
+    return f'{labels[:-1]},{pair}}}' if labels else f'{{{pair}}}'
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, value=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labels, value in sorted(values.items()):
+            yield self.name, _labels(self.labels, labels), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Счетчики по корзинам (последняя — +Inf), сумма, количество
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total, count) for labels, (counts, total, count) in self._series.items()}
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                le = bound if bound == '+Inf' else _number(bound)
+                yield f"{self.name}_bucket", _labels(self.labels, labels, (('le', le),)), cumulative
+            yield f"{self.name}_sum", _labels(self.labels, labels), total
+            yield f"{self.name}_count", _labels(self.labels, labels), count
+
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'started')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+
+# Значение, которое снимается в момент запроса /metrics: глубина очереди и т.п.
+# read() может вернуть None (значения еще нет) — тогда метрика не выводится вовсе
+class Gauge:
+    kind = 'gauge'
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def samples(self):
+        value = self.read()
+        if value is not None:
+            yield self.name, '', value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, read):
+        return self._add(Gauge(name, help, read))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collect(self):
+        # Семейства [(имя, тип, описание, [(имя, метки, значение)])]. Семейство без
+        # значений или с недоступным источником (например, при остановке) пропускается
+        # целиком, чтобы HELP и TYPE не оставались без значений
+        families = []
+        for metric in self._metrics:
+            try:
+                samples = [(name, labels, float(value)) for name, labels, value in metric.samples()]
+            except Exception:
+                continue
+            if samples:
+                families.append((metric.name, metric.kind, metric.help, samples))
+        return families
+
+    def render(self):
+        return render_families(self.collect())
+
+
+def render_families(families):
+    # Текстовый формат Prometheus (version 0.0.4)
+    lines = []
+    for name, kind, help, samples in families:
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(f"{sample}{labels} {_number(value)}" for sample, labels, value in samples)
+    return '\n'.join(lines) + '\n'
+
+
+def merge_families(sources, label='process'):
+    # Семейства нескольких процессов [(процесс, семейства)] в одно: значения каждого
+    # процесса получают метку process, одноименные семейства выводятся один раз
+    merged = {}
+    for process, families in sources:
+        for name, kind, help, samples in families:
+            family = merged.setdefault(name, (name, kind, help, []))
+            family[3].extend((sample, _with_label(labels, label, process), value)
+                             for sample, labels, value in samples)
+    return list(merged.values())
+
+
+registry = MetricsRegistry()
+
+updates_total = registry.counter(
+    'bot_updates_total', "Обновления Telegram по типу и состоянию FSM", ('type', 'state'))
+update_seconds = registry.histogram(
+    'bot_update_seconds', "Время обработки обновления целиком", ('type',))
+handler_seconds = registry.histogram(
+    'bot_handler_seconds', "Время работы хендлера", ('handler',))
+handler_errors_total = registry.counter(
+    'bot_handler_errors_total', "Исключения в хендлерах", ('handler',))
+store_seconds = registry.histogram(
+    'bot_store_seconds', "Время операций хранилища", ('op',))
+store_flush_seconds = registry.histogram(
+    'bot_store_flush_seconds', "Время сброса базы на диск (бывший save_db)")
+cryptopay_seconds = registry.histogram(
+    'bot_cryptopay_request_seconds', "Запросы к Crypto Pay API", ('method', 'status'))
+telegram_seconds = registry.histogram(
+    'bot_telegram_request_seconds', "Запросы к Telegram Bot API", ('method', 'status'))
+
+
+# Внешний middleware на dp.update: считает обновления по типу и состоянию
+# FSM (raw_state кладет FSM-middleware диспетчера) и меряет время целиком
+class UpdateMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        update_type = event.event_type
+        updates_total.inc(update_type, data.get('raw_state') or 'none')
+        with update_seconds.time(update_type):
+            return await handler(event, data)
+
+
+# Внутренний middleware на dp.message / dp.callback_query: хендлер уже
+# выбран и лежит в data['handler']
+class HandlerMetricsMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        name = data['handler'].callback.__name__
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors_total.inc(name)
+            raise
+        finally:
+            handler_seconds.observe(time.perf_counter() - started, name)
+
+
+# Middleware сессии бота: каждый вызов Bot API (send_message, answer_photo,
+# edit_message_text...) с методом и исходом
+class TelegramRequestMetrics(BaseRequestMiddleware):
+    async def __call__(self, make_request, bot, method):
+        status = 'ok'
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            status = type(e).__name__
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            telegram_seconds.observe(seconds, method.__api_method__, status)
+            record_span(f"telegram.{method.__api_method__}", seconds, status=status)
+
+
+def observe_cryptopay(method, status, seconds):
+    cryptopay_seconds.observe(seconds, method, status)
+    record_span(f"cryptopay.{method}", seconds, status=status)
+
+
+def observe_store_event(event, **data):
+    if event == 'flushed':
+        store_flush_seconds.observe(data['seconds'])
+
+
+# Обертка хранилища: те же методы, но с замером времени каждой операции
+class InstrumentedStore:
+    def __init__(self, store):
+        self._store = store
+        store.subscribe(observe_store_event)
+
+    def __getattr__(self, name):
+        attribute = getattr(self._store, name)
+        if name.startswith(('_', 'iter_')) or name in ('subscribe', 'close') or not callable(attribute):
+            return attribute
+
+        span_name = f"store.{name}"
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - started
+                store_seconds.observe(seconds, name)
+                record_span(span_name, seconds)
+        # Кэшируем обертку, чтобы не создавать ее на каждый вызов
+        self.__dict__[name] = timed
+        return timed
+
+
+def setup_metrics(dispatcher, bot):
+    dispatcher.update.outer_middleware(UpdateMetricsMiddleware())
+    for observer in (dispatcher.message, dispatcher.callback_query):
+        observer.middleware(HandlerMetricsMiddleware())
+    bot.session.middleware(TelegramRequestMetrics())
+
+
+def _metrics_response(text):
+    return web.Response(body=text.encode(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+async def metrics_handler(request):
+    return _metrics_response(registry.render())
+
+
+async def families_handler(request):
+    return web.json_response(registry.collect())
+
+
+# Метрики процесса-обработчика при BOT_WORKERS > 1: /metrics (можно снимать
+# напрямую) и /metrics/families для входного процесса, только на localhost
+async def start_worker_metrics(port, host='127.0.0.1'):
+    app = web.Application()
+    app.router.add_get('/metrics', metrics_handler)
+    app.router.add_get('/metrics/families', families_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError:
+        await runner.cleanup()
+        raise
+    return runner
+
+
+# /metrics входного процесса при BOT_WORKERS > 1: свои метрики плюс метрики
+# всех процессов-обработчиков (хендлеры, хранилище, очереди) с меткой process.
+# Недоступный процесс не ломает ответ: bot_worker_metrics_up{process} = 0
+def pooled_metrics_handler(worker_ports, host='127.0.0.1', timeout=2.0):
+    async def fetch(session, port):
+        async with session.get(f"http://{host}:{port}/metrics/families") as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def handle(request):
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
+            results = await asyncio.gather(*(fetch(session, port) for port in worker_ports),
+                                           return_exceptions=True)
+        sources = [('ingress', registry.collect())]
+        up = []
+        for index, result in enumerate(results):
+            process = f"worker-{index}"
+            failed = isinstance(result, BaseException)
+            up.append(('bot_worker_metrics_up', _labels(('process',), (process,)), 0 if failed else 1))
+            if not failed:
+                sources.append((process, result))
+        families = merge_families(sources)
+        families.append(('bot_worker_metrics_up', 'gauge', "Метрики процесса-обработчика получены", up))
+        return _metrics_response(render_families(families))
+    return handle
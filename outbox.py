@@ -0,0 +1,201 @@
+import time
+import asyncio
+import logging
+
+from aiogram.exceptions import TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest
+
+logger = logging.getLogger(__name__)
+
+
+# Ведро токенов с резервированием: reserve() сразу списывает токен и
+# возвращает, сколько секунд подождать до отправки
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self):
+        self._refill()
+        self._tokens -= 1
+        return max(0.0, -self._tokens / self.rate)
+
+    def pause(self, seconds):
+        # После RetryAfter следующий токен появится не раньше чем через seconds
+        self._refill()
+        self._tokens = min(self._tokens, -seconds * self.rate)
+
+    @property
+    def idle(self):
+        self._refill()
+        return self._tokens >= self.capacity
+
+
+# Ошибка для callback сообщений, которые не успели уйти до остановки очереди
+class OutboxStopped(Exception):
+    pass
+
+
+class OutgoingMessage:
+    __slots__ = ('method', 'chat_id', 'kwargs', 'callback', 'attempt', 'reserved')
+
+    def __init__(self, method, chat_id, kwargs, callback):
+        self.method = method
+        self.chat_id = chat_id
+        self.kwargs = kwargs
+        self.callback = callback
+        self.attempt = 0
+        self.reserved = False
+
+
+# Очередь исходящих сообщений: общий лимит на бота (около 30 сообщений в
+# секунду), лимит на чат (1 в секунду), ограниченное число воркеров и
+# повторная отправка после RetryAfter. Хендлеры ставят сообщение в очередь
+# и сразу продолжают работу.
+#
+# Каждое принятое сообщение заканчивается ровно одним _finish (доставлено,
+# окончательная ошибка или остановка очереди): callback вызывается всегда, а
+# stop() ждет и сообщения, отложенные до повтора (call_later), а не только очередь.
+class MessageQueue:
+    def __init__(self, bot, global_rate=25.0, per_chat_rate=1.0, workers=8, max_retries=5):
+        self.bot = bot
+        self.per_chat_rate = per_chat_rate
+        self.workers = workers
+        self.max_retries = max_retries
+        self._global = TokenBucket(global_rate, capacity=global_rate)
+        self._chats = {}
+        self._queue = asyncio.Queue()
+        self._tasks = []
+        # Отложенные до повтора: сообщение → таймер call_later
+        self._delayed = {}
+        # Принятые, но еще не завершенные сообщения
+        self._pending = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+    def set_global_rate(self, rate):
+        self._global = TokenBucket(rate, capacity=rate)
+
+    @property
+    def depth(self):
+        return self._queue.qsize() + len(self._delayed)
+
+    def send_message(self, chat_id, text, callback=None, **kwargs):
+        self.send('send_message', chat_id, callback=callback, text=text, **kwargs)
+
+    def send(self, method, chat_id, callback=None, **kwargs):
+        # callback(chat_id, error) вызывается после доставки (error=None) или окончательной ошибки
+        self._pending += 1
+        self._drained.clear()
+        self._queue.put_nowait(OutgoingMessage(method, chat_id, kwargs, callback))
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=10.0):
+        # Даем досылаться всему принятому, включая отложенное до повтора, затем
+        # останавливаем воркеров. Что не успело уйти, завершается с OutboxStopped
+        try:
+            await asyncio.wait_for(self._drained.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Outbox stopped with {self._pending} undelivered messages")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            message = self._queue.get_nowait()
+            self._queue.task_done()
+            self._finish(message, OutboxStopped())
+        for message, handle in list(self._delayed.items()):
+            handle.cancel()
+            del self._delayed[message]
+            self._finish(message, OutboxStopped())
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) > 10000:
+                self._chats = {key: value for key, value in self._chats.items() if not value.idle}
+            bucket = self._chats[chat_id] = TokenBucket(self.per_chat_rate)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            message = await self._queue.get()
+            # handed_off — сообщение отложено или дошло до _deliver, который сам
+            # вызовет _finish; иначе (ошибка, отмена при остановке) завершаем здесь
+            handed_off = False
+            error = None
+            try:
+                if not message.reserved:
+                    # Слот чата занят — откладываем сообщение, не занимая воркер,
+                    # чтобы один чат не задерживал остальные
+                    message.reserved = True
+                    delay = self._chat_bucket(message.chat_id).reserve()
+                    if delay:
+                        self._put_later(delay, message)
+                        handed_off = True
+                        continue
+                delay = self._global.reserve()
+                if delay:
+                    await asyncio.sleep(delay)
+                message.reserved = False
+                await self._deliver(message)
+                handed_off = True
+            except Exception as e:
+                logger.error(f"Outbox error for chat {message.chat_id}: {e}")
+                error = e
+            finally:
+                if not handed_off:
+                    self._finish(message, error or OutboxStopped())
+                self._queue.task_done()
+
+    async def _deliver(self, message):
+        message.attempt += 1
+        try:
+            await getattr(self.bot, message.method)(message.chat_id, **message.kwargs)
+        except TelegramRetryAfter as e:
+            self._chat_bucket(message.chat_id).pause(e.retry_after)
+            self._requeue(message, e.retry_after, e)
+            return
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Пользователь заблокировал бота или чат недоступен — повтор не поможет
+            self._finish(message, e)
+            return
+        except Exception as e:
+            self._requeue(message, 2 ** message.attempt, e)
+            return
+        self._finish(message, None)
+
+    def _requeue(self, message, delay, error):
+        if message.attempt > self.max_retries:
+            logger.error(f"Giving up on message to {message.chat_id}: {error}")
+            self._finish(message, error)
+            return
+        self._put_later(delay, message)
+
+    def _put_later(self, delay, message):
+        self._delayed[message] = asyncio.get_running_loop().call_later(delay, self._release, message)
+
+    def _release(self, message):
+        if self._delayed.pop(message, None) is not None:
+            self._queue.put_nowait(message)
+
+    def _finish(self, message, error):
+        try:
+            if message.callback is not None:
+                message.callback(message.chat_id, error)
+        except Exception as e:
+            logger.error(f"Outbox callback error: {e}")
+        finally:
+            self._pending -= 1
+            if not self._pending:
+                self._drained.set()
@@ -0,0 +1,101 @@
+import time
+import asyncio
+import logging
+from decimal import Decimal, ROUND_UP
+
+logger = logging.getLogger(__name__)
+
+# Знаков после запятой в сумме счета по активу
+ASSET_DECIMALS = {'USDT': 2, 'USDC': 2, 'TRX': 2, 'TON': 4, 'LTC': 6, 'ETH': 6, 'BNB': 6, 'BTC': 8}
+
+
+# Курсы Crypto Pay (getExchangeRates) с кэшем: чтение всегда мгновенное и
+# отдает последнее удачное значение, а обновление идет в фоне — раз в ttl
+# секунд и дополнительно при чтении устаревшего курса. Пока курса нет
+# (API недоступен с самого старта), используется fallback из настроек.
+class ExchangeRates:
+    def __init__(self, client, fiat='RUB', ttl=300.0, fallback=None, timeout=5.0, retry_interval=30.0):
+        self.client = client
+        self.fiat = fiat
+        self.ttl = ttl
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.fallback = {asset: Decimal(str(rate)) for asset, rate in (fallback or {}).items()}
+        self._rates = {}
+        self._updated = None
+        self._attempted = None
+        self._refreshing = None
+        self._task = None
+
+    @property
+    def age(self):
+        # Секунды с последнего удачного обновления (None — курсов еще не было)
+        return None if self._updated is None else time.monotonic() - self._updated
+
+    def rate(self, asset='USDT'):
+        # Сколько единиц fiat стоит 1 asset
+        age = self.age
+        if age is None or age > self.ttl:
+            self._refresh_soon()
+        rate = self._rates.get(asset)
+        if rate is None:
+            rate = self.fallback.get(asset)
+        if rate is None:
+            raise LookupError(f"No {asset}/{self.fiat} rate")
+        return rate
+
+    def convert(self, amount, asset='USDT'):
+        # Сумма в fiat → сумма счета в asset, с округлением вверх до точности актива
+        step = Decimal(1).scaleb(-ASSET_DECIMALS.get(asset, 8))
+        return (Decimal(str(amount)) / self.rate(asset)).quantize(step, rounding=ROUND_UP)
+
+    async def refresh(self):
+        items = await self.client.get_exchange_rates(timeout=self.timeout)
+        rates = {
+            item['source']: Decimal(item['rate'])
+            for item in items
+            if item.get('target') == self.fiat and item.get('is_valid', True) and Decimal(item['rate']) > 0
+        }
+        if not rates:
+            raise ValueError(f"No {self.fiat} rates in getExchangeRates response")
+        self._rates.update(rates)
+        self._updated = time.monotonic()
+
+    def _refresh_soon(self, force=False):
+        # Не больше одного обновления одновременно и не чаще retry_interval
+        # после неудачи; вне цикла событий — пропускаем
+        if self._refreshing is not None and not self._refreshing.done():
+            return
+        now = time.monotonic()
+        if not force and self._attempted is not None and now - self._attempted < self.retry_interval:
+            return
+        self._attempted = now
+        try:
+            self._refreshing = asyncio.get_running_loop().create_task(self._safe_refresh())
+        except RuntimeError:
+            pass
+
+    async def _safe_refresh(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.warning(f"Exchange rates refresh failed, using {'cached' if self._rates else 'fallback'} rates: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        for task in (self._task, self._refreshing):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._task = self._refreshing = None
+
+    async def _run(self):
+        while True:
+            self._refresh_soon(force=True)
+            await asyncio.sleep(self.ttl)
@@ -0,0 +1,163 @@
+from datetime import datetime, timedelta
+from collections import Counter, defaultdict
+
+
+def is_paid(order):
+    # Как и прежний подсчет в cmd_bot_stats: оплаченный — заказ в статусе paid.
+    # paid_at есть не у всех старых заказов, поэтому по нему не считаем
+    return order.get('status') == 'paid'
+
+
+class _Bucket:
+    __slots__ = ('users', 'orders', 'paid', 'revenue')
+
+    def __init__(self):
+        self.users = 0
+        self.orders = 0
+        self.paid = 0
+        self.revenue = 0
+
+
+# Статистика, которая обновляется на каждом событии хранилища, а не
+# пересчитывается проходом по всем заказам: пользователи, заказы по статусам,
+# выручка (в том числе по услугам и платформам) и ряды по часам и дням.
+# Выручка считается по заказам в статусе paid, как и раньше: заказ, который
+# админ перевел в работу или выполнил, из нее выходит.
+class StatsAggregator:
+    def __init__(self, hourly_retention=48, daily_retention=90):
+        self.hourly_retention = hourly_retention
+        self.daily_retention = daily_retention
+        self.reset()
+
+    def reset(self):
+        self.users = 0
+        self.orders = 0
+        self.by_status = Counter()
+        self.paid = 0
+        self.revenue = 0
+        self.revenue_by_service = defaultdict(int)
+        self.revenue_by_platform = defaultdict(int)
+        self.hourly = {}
+        self.daily = {}
+
+    # Полный пересчет один раз при старте
+    def rebuild(self, store, archive=None):
+        self.reset()
+        self.users = store.count_users()
+        for _, order in store.iter_orders():
+            self._add_order(order)
+        # Заказы, перенесенные в холодный архив, тоже входят в статистику — по
+        # сводкам кусков из его индекса, без распаковки самих заказов
+        if archive is not None:
+            for summary in archive.summaries():
+                self._add_summary(summary)
+        for _, user in store.iter_users():
+            self._count(user.get('registration_date'), 'users', 1)
+
+    # Сводка по набору заказов в виде, пригодном для JSON: ее хранит индекс архива
+    # для каждого куска (storage/archive.py). Ряды обрезаются тем же хранением,
+    # что и у агрегатора по умолчанию
+    @classmethod
+    def summarize(cls, orders):
+        stats = cls()
+        for order in orders:
+            stats._add_order(order)
+        return {
+            'orders': stats.orders,
+            'by_status': dict(stats.by_status),
+            'paid': stats.paid,
+            'revenue': stats.revenue,
+            # Парами, а не словарем: ключ None в JSON стал бы строкой "null"
+            'revenue_by_service': list(stats.revenue_by_service.items()),
+            'revenue_by_platform': list(stats.revenue_by_platform.items()),
+            'hourly': {key: [bucket.orders, bucket.paid, bucket.revenue] for key, bucket in stats.hourly.items()},
+            'daily': {key: [bucket.orders, bucket.paid, bucket.revenue] for key, bucket in stats.daily.items()}
+        }
+
+    def _add_summary(self, summary):
+        self.orders += summary['orders']
+        self.by_status.update(summary['by_status'])
+        self.paid += summary['paid']
+        self.revenue += summary['revenue']
+        for service, amount in summary['revenue_by_service']:
+            self.revenue_by_service[service] += amount
+        for platform, amount in summary['revenue_by_platform']:
+            self.revenue_by_platform[platform] += amount
+        for series, name, retention in ((self.hourly, 'hourly', self.hourly_retention),
+                                        (self.daily, 'daily', self.daily_retention)):
+            for key, (orders, paid, revenue) in summary[name].items():
+                bucket = self._bucket(series, key, retention)
+                bucket.orders += orders
+                bucket.paid += paid
+                bucket.revenue += revenue
+
+    def replace_with(self, other):
+        # Подменяет счетчики пересчитанными в другом потоке (см. workers.py)
+        self.users, self.orders, self.by_status = other.users, other.orders, other.by_status
+        self.paid, self.revenue = other.paid, other.revenue
+        self.revenue_by_service, self.revenue_by_platform = other.revenue_by_service, other.revenue_by_platform
+        self.hourly, self.daily = other.hourly, other.daily
+
+    def handle(self, event, **data):
+        if event == 'user_created':
+            self.users += 1
+            self._count(data['user'].get('registration_date'), 'users', 1)
+        elif event == 'order_created':
+            self._add_order(data['order'])
+        elif event == 'order_updated':
+            self._update_order(data['before'], data['order'])
+
+    def _add_order(self, order):
+        self.orders += 1
+        self.by_status[order['status']] += 1
+        self._count(order.get('created_at'), 'orders', 1)
+        if is_paid(order):
+            self._add_payment(order, 1)
+
+    def _update_order(self, before, order):
+        if before['status'] != order['status']:
+            self.by_status[before['status']] -= 1
+            self.by_status[order['status']] += 1
+        if is_paid(order) != is_paid(before):
+            self._add_payment(order if is_paid(order) else before, 1 if is_paid(order) else -1)
+
+    def _add_payment(self, order, sign):
+        amount = order.get('amount', 0) * sign
+        self.paid += sign
+        self.revenue += amount
+        self.revenue_by_service[order.get('service')] += amount
+        self.revenue_by_platform[order.get('platform')] += amount
+        moment = order.get('paid_at') or order.get('created_at')
+        self._count(moment, 'paid', sign)
+        self._count(moment, 'revenue', amount)
+
+    # Ряды по времени: ключи — префиксы строки "YYYY-MM-DD HH:MM:SS"
+
+    def _count(self, moment, field, value):
+        if not moment:
+            return
+        for series, key, retention in ((self.hourly, moment[:13], self.hourly_retention),
+                                        (self.daily, moment[:10], self.daily_retention)):
+            bucket = self._bucket(series, key, retention)
+            setattr(bucket, field, getattr(bucket, field) + value)
+
+    @staticmethod
+    def _bucket(series, key, retention):
+        bucket = series.get(key)
+        if bucket is None:
+            bucket = series[key] = _Bucket()
+            if len(series) > retention:
+                for old_key in sorted(series)[:len(series) - retention]:
+                    del series[old_key]
+        return bucket
+
+    def last_days(self, days, now=None):
+        since = ((now or datetime.now()) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        total = _Bucket()
+        for key, bucket in self.daily.items():
+            if key >= since:
+                total.users += bucket.users
+                total.orders += bucket.orders
+                total.paid += bucket.paid
+                total.revenue += bucket.revenue
+        return total
@@ -0,0 +1,29 @@
+import os
+
+from storage.json_store import JsonStore, default_db, now_str
+from storage.journal_store import JournalStore
+from storage.binary_store import BinaryStore
+from storage.sqlite_store import SqliteStore, migrate_json_to_sqlite
+from storage.archive import OrderArchive, ArchiveJob
+
+
+# Выбор хранилища по имени бэкенда (переменная окружения DB_BACKEND)
+def create_store(backend, json_path, sqlite_path, admins=(), flush_interval=2.0, flush_threshold=100,
+                 journal_path=None, max_journal_bytes=4 * 1024 * 1024, binary_path=None,
+                 sqlite_busy_timeout=2.0):
+    if backend == 'json':
+        return JsonStore(json_path, admins=admins, flush_interval=flush_interval, flush_threshold=flush_threshold)
+    if backend == 'journal':
+        return JournalStore(json_path, journal_path or json_path + '.journal', admins=admins,
+                            flush_interval=flush_interval, flush_threshold=flush_threshold,
+                            max_journal_bytes=max_journal_bytes)
+    if backend == 'binary':
+        # Существующий database.json переносится в двоичный файл при первом старте
+        return BinaryStore(binary_path or os.path.splitext(json_path)[0] + '.bin', admins=admins,
+                           flush_interval=flush_interval, flush_threshold=flush_threshold, import_path=json_path)
+    if backend == 'sqlite':
+        return SqliteStore(sqlite_path, admins=admins, busy_timeout=sqlite_busy_timeout)
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+__all__ = ['ArchiveJob', 'BinaryStore', 'JournalStore', 'JsonStore', 'SqliteStore', 'create_store', 'default_db', 'migrate_json_to_sqlite', 'now_str', 'OrderArchive']
@@ -0,0 +1,313 @@
+import os
+import sys
+import gzip
+import json
+import asyncio
+import logging
+import tempfile
+import threading
+from bisect import bisect_right
+from itertools import accumulate
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Заказы, которые больше не меняются и могут уехать в архив
+FINISHED_STATUSES = ('completed', 'rejected')
+INDEX_NAME = 'index.json'
+BATCH_SIZE = 5000
+
+
+def _empty_index():
+    return {'version': 1, 'members': [], 'users': {}}
+
+
+# Холодный архив заказов: сжатые сегменты по месяцам создания заказа
+# (orders-2024-06.jsonl.gz), в которые только дописываются куски gzip —
+# не больше batch_size заказов каждый. Маленький индекс index.json хранит
+# для каждого куска сегмент, смещение, длину и диапазон номеров заказов,
+# а также число архивных заказов каждого пользователя. Заказ по номеру
+# ищется только в кусках, чей диапазон его покрывает, и читается лениво.
+#
+# Перенос устроен так, чтобы падение на любом шаге не теряло и не
+# дублировало заказы: кусок дописывается и fsync-ается, затем попадает в
+# индекс с done=False, затем заказы удаляются из базы. В конце прохода база
+# один раз сбрасывается на диск, и только потом куски помечаются done.
+# Незавершенные куски доделываются при следующем запуске, а недописанный
+# хвост сегмента обрезается по индексу перед следующей записью.
+#
+# summarize(orders) строит сводку куска (для статистики, см.
+# StatsAggregator.summarize), которая хранится в индексе рядом с куском:
+# пересчет статистики складывает сводки и не распаковывает сегменты.
+class OrderArchive:
+    def __init__(self, directory, batch_size=BATCH_SIZE, summarize=None):
+        self.directory = directory
+        self.batch_size = batch_size
+        self.summarize = summarize
+        self._lock = threading.Lock()
+        self._index = _empty_index()
+        self._index_mtime = None
+        self._by_id = None
+        self._cache = {}
+        self._cache_lock = threading.Lock()
+        self._summaries = {}
+
+    @property
+    def index_path(self):
+        return os.path.join(self.directory, INDEX_NAME)
+
+    def _load_index(self):
+        # Индекс перечитывается, только если его изменил другой процесс
+        try:
+            mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+            return self._index
+        if mtime != self._index_mtime:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self._index = json.load(f)
+            self._index_mtime = mtime
+        return self._index
+
+    def _save_index(self, index):
+        fd, tmp_path = tempfile.mkstemp(prefix='.index-', suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f, separators=(',', ':'))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.index_path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._index = index
+        self._index_mtime = os.stat(self.index_path).st_mtime_ns
+
+    # Чтение
+
+    def count(self):
+        return sum(member['count'] for member in self._load_index()['members'] if member['done'])
+
+    def user_order_count(self, user_id):
+        return self._load_index()['users'].get(str(user_id), 0)
+
+    def _decode(self, member):
+        with open(os.path.join(self.directory, member['segment']), 'rb') as f:
+            f.seek(member['offset'])
+            data = gzip.decompress(f.read(member['length']))
+        return {record['id']: record['order'] for record in map(json.loads, data.splitlines())}
+
+    def _members_by_id(self):
+        # Перенесенные куски по возрастанию min_id и для каждого — наибольший max_id
+        # среди него и предыдущих (диапазоны кусков разных месяцев и проходов могут
+        # перекрываться). Пересчитывается, только когда индекс перечитан
+        index = self._load_index()
+        if self._by_id is None or self._by_id[0] is not index:
+            members = sorted((member for member in index['members'] if member['done']),
+                             key=lambda member: member['min_id'])
+            reach = list(accumulate((member['max_id'] for member in members), max))
+            self._by_id = (index, [member['min_id'] for member in members], members, reach)
+        return self._by_id[1:]
+
+    def get_order(self, order_id):
+        # Читает с диска и распаковывает: из цикла событий вызывайте через
+        # asyncio.to_thread. Кусок ищется двоичным поиском по min_id, затем
+        # назад, пока более ранние куски еще могут покрывать номер. Несколько
+        # последних прочитанных кусков держим в памяти: админ обычно листает соседние заказы
+        order_id = int(order_id)
+        min_ids, members, reach = self._members_by_id()
+        position = bisect_right(min_ids, order_id) - 1
+        while position >= 0 and reach[position] >= order_id:
+            member = members[position]
+            position -= 1
+            if member['max_id'] < order_id:
+                continue
+            key = (member['segment'], member['offset'])
+            with self._cache_lock:
+                orders = self._cache.get(key)
+            if orders is None:
+                orders = self._decode(member)
+                with self._cache_lock:
+                    if len(self._cache) >= 4:
+                        self._cache.pop(next(iter(self._cache)))
+                    self._cache[key] = orders
+            if order_id in orders:
+                return orders[order_id]
+        return None
+
+    def iter_orders(self):
+        for member in list(self._load_index()['members']):
+            if member['done']:
+                for order_id, order in self._decode(member).items():
+                    yield str(order_id), order
+
+    def summaries(self):
+        # Сводки перенесенных кусков. Кусок из архива без сводок (до их появления)
+        # распаковывается один раз на процесс, пока archive() не допишет сводку в индекс
+        result = []
+        for member in list(self._load_index()['members']):
+            if not member['done']:
+                continue
+            summary = member.get('summary')
+            if summary is None:
+                key = (member['segment'], member['offset'])
+                summary = self._summaries.get(key)
+                if summary is None:
+                    summary = self._summaries[key] = self.summarize(self._decode(member).values())
+            result.append(summary)
+        return result
+
+    # Перенос
+
+    def archive(self, store, before, statuses=FINISHED_STATUSES, remove_orders=None):
+        # Переносит из store заказы со статусом из statuses, созданные раньше
+        # before ('%Y-%m-%d %H:%M:%S'). remove_orders(ids) по умолчанию —
+        # store.remove_orders. Возвращает число перенесенных заказов
+        remove_orders = remove_orders or store.remove_orders
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            self._recover(store, remove_orders)
+            batches = {}
+            moved = 0
+            for order_id, order in store.iter_orders():
+                created_at = order.get('created_at')
+                if order.get('status') not in statuses or not created_at or created_at >= before:
+                    continue
+                month = created_at[:7]
+                batch = batches.setdefault(month, [])
+                batch.append((int(order_id), order))
+                if len(batch) >= self.batch_size:
+                    moved += self._move(store, remove_orders, month, batches.pop(month))
+            for month, batch in batches.items():
+                moved += self._move(store, remove_orders, month, batch)
+            self._complete(store)
+            return moved
+
+    def _move(self, store, remove_orders, month, batch):
+        index = json.loads(json.dumps(self._load_index()))
+        segment = f"orders-{month}.jsonl.gz"
+        payload = gzip.compress(b''.join(
+            json.dumps({'id': order_id, 'order': order}, ensure_ascii=False).encode('utf-8') + b'\n'
+            for order_id, order in batch))
+        # Конец последнего куска сегмента из индекса: все, что дальше, — недописанный хвост
+        offset = max((member['offset'] + member['length'] for member in index['members']
+                      if member['segment'] == segment), default=0)
+        with open(os.path.join(self.directory, segment), 'ab') as f:
+            f.truncate(offset)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+
+        order_ids = [order_id for order_id, _ in batch]
+        member = {'segment': segment, 'offset': offset, 'length': len(payload), 'count': len(batch),
+                  'min_id': min(order_ids), 'max_id': max(order_ids), 'done': False}
+        if self.summarize is not None:
+            member['summary'] = self.summarize(order for _, order in batch)
+        index['members'].append(member)
+        for _, order in batch:
+            user_id = str(order['user_id'])
+            index['users'][user_id] = index['users'].get(user_id, 0) + 1
+        self._save_index(index)
+
+        remove_orders(order_ids)
+        return len(batch)
+
+    def _complete(self, store):
+        # Удаление из базы долетело до диска — куски можно считать перенесенными
+        index = json.loads(json.dumps(self._load_index()))
+        pending = [member for member in index['members'] if not member['done']]
+        if not pending:
+            return
+        store.flush()
+        for member in pending:
+            member['done'] = True
+        self._save_index(index)
+
+    def _recover(self, store, remove_orders):
+        for member in self._load_index()['members']:
+            if not member['done']:
+                logger.info(f"Finishing interrupted archive batch {member['segment']}@{member['offset']}")
+                remove_orders(list(self._decode(member)))
+        self._complete(store)
+        self._add_summaries()
+
+    def _add_summaries(self):
+        # Индекс пишет только процесс, который переносит заказы, поэтому сводки
+        # для кусков старого архива дописываются здесь, под _lock
+        if self.summarize is None:
+            return
+        index = json.loads(json.dumps(self._load_index()))
+        missing = [member for member in index['members'] if member['done'] and 'summary' not in member]
+        if not missing:
+            return
+        logger.info(f"Adding stats summaries to {len(missing)} archive batches")
+        for member in missing:
+            member['summary'] = self.summarize(self._decode(member).values())
+        self._save_index(index)
+
+
+# Периодический перенос в архив заказов старше after_days дней. Чтение и
+# сжатие идут в отдельном потоке, а удаление из базы — в цикле событий,
+# где с ней работают хендлеры
+class ArchiveJob:
+    def __init__(self, archive, store, after_days=30, interval=6 * 3600):
+        self.archive = archive
+        self.store = store
+        self.after_days = after_days
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if self._task is None and self.after_days > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Order archiving failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        loop = asyncio.get_running_loop()
+        before = (datetime.now() - timedelta(days=self.after_days)).strftime("%Y-%m-%d %H:%M:%S")
+
+        def remove_orders(order_ids):
+            async def remove():
+                return self.store.remove_orders(order_ids)
+            return asyncio.run_coroutine_threadsafe(remove(), loop).result()
+
+        moved = await asyncio.to_thread(self.archive.archive, self.store, before, remove_orders=remove_orders)
+        if moved:
+            logger.info(f"Archived {moved} orders created before {before}")
+        return moved
+
+
+if __name__ == "__main__":
+    # Разовый перенос при остановленном боте:
+    # python -m storage.archive json database.json archive 30
+    from storage import create_store
+    from stats import StatsAggregator
+
+    if len(sys.argv) != 5:
+        print("Использование: python -m storage.archive <json|journal|binary|sqlite> <база> <каталог архива> <дней>")
+        sys.exit(1)
+    backend, db_path, directory, days = sys.argv[1:]
+    store = create_store(backend, db_path, db_path, journal_path=os.getenv('DB_JOURNAL_FILE', 'database.journal'),
+                         binary_path=db_path)
+    before = (datetime.now() - timedelta(days=int(days))).strftime("%Y-%m-%d %H:%M:%S")
+    moved = OrderArchive(directory, summarize=StatsAggregator.summarize).archive(store, before)
+    store.close()
+    print(f"Перенесено в архив заказов: {moved}")
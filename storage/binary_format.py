@@ -0,0 +1,462 @@
+import sys
+import json
+import struct
+from array import array
+from itertools import accumulate, chain
+from operator import add, itemgetter
+from datetime import date
+from functools import lru_cache
+
+# Компактный двоичный формат базы (database.bin). Данные хранятся по
+# колонкам: числа — массивами array (читаются и пишутся целиком, на скорости
+# C), значения-перечисления (платформа, услуга, статус, дата, время) — номерами
+# в общей таблице строк, время создания и оплаты — целыми секундами, номера
+# пользователей — числами, а не строковыми ключами. Свободный текст (канал,
+# username) лежит одним блоком UTF-8 с массивом длин.
+#
+# Формат без потерь: отсутствующие поля отмечаются битовой маской строки,
+# а все, что не укладывается в схему (лишние ключи, значения другого типа,
+# время в другом формате), сохраняется как есть в JSON-поправках к строке.
+#
+# Файл: MAGIC, версия и длина заголовка ('<HI'), заголовок JSON со списком
+# колонок [имя, typecode, байт], затем сами колонки подряд (little-endian).
+MAGIC = b'KFCB'
+VERSION = 1
+_HEADER = struct.Struct('<HI')
+
+USER_FIELDS = ('balance', 'orders', 'registration_date', 'username')
+ORDER_FIELDS = ('user_id', 'platform', 'service', 'channel', 'date', 'time',
+                'amount', 'status', 'created_at', 'paid_at', 'invoice_id')
+ENUM_FIELDS = ('platform', 'service', 'date', 'time', 'status')
+TIME_FIELDS = ('created_at', 'paid_at')
+INT_FIELDS = ('user_id', 'amount', 'invoice_id')
+_INT_MIN, _INT_MAX = -2 ** 63, 2 ** 63 - 1
+
+
+class FormatError(ValueError):
+    pass
+
+
+def is_binary(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+# Время "2024-06-15 14:00:00" ↔ секунды от 1970-01-01 (без часового пояса —
+# как строка и записана). Дни кэшируются по мере надобности, секунды суток
+# (" 14:00:00" вместе с пробелом-разделителем) — таблицей на все 86400 значений.
+# В таблицы разбора попадает только каноническая запись, на остальное — ValueError
+@lru_cache(maxsize=1)
+def _second_table():
+    texts = [f" {hours:02d}:{minutes:02d}:{seconds:02d}"
+             for hours in range(24) for minutes in range(60) for seconds in range(60)]
+    return texts, {text: second for second, text in enumerate(texts)}
+
+
+class _DayToText(dict):
+    def __missing__(self, day):
+        text = self[day] = date.fromordinal(day + 719163).isoformat()
+        return text
+
+
+class _TextToDay(dict):
+    def __missing__(self, text):
+        day = date.fromisoformat(text)
+        if day.isoformat() != text:
+            raise ValueError(text)
+        day = self[text] = day.toordinal() - 719163
+        return day
+
+
+class _Clock:
+    def __init__(self):
+        self.day_text = _DayToText()
+        self.text_day = _TextToDay()
+        self.second_text, self.text_second = _second_table()
+
+    def texts(self, timestamps):
+        # Вся колонка сразу: map по методам словарей и int идет без вызовов Python-функций
+        days = map(self.day_text.__getitem__, map((86400).__rfloordiv__, timestamps))
+        seconds = map(self.second_text.__getitem__, map((86400).__rmod__, timestamps))
+        return list(map(add, days, seconds))
+
+    def timestamps(self, texts):
+        # ValueError/KeyError, если хоть одна строка не вида 2024-06-15 14:00:00
+        days = map(self.text_day.__getitem__, map(itemgetter(slice(0, 10)), texts))
+        seconds = map(self.text_second.__getitem__, map(itemgetter(slice(10, 19)), texts))
+        return array('q', map(add, map((86400).__mul__, days), seconds))
+
+    def to_int(self, text):
+        # None, если строка не вида 2024-06-15 14:00:00
+        if type(text) is not str or len(text) != 19:
+            return None
+        try:
+            return self.text_day[text[:10]] * 86400 + self.text_second[text[10:]]
+        except (KeyError, ValueError):
+            return None
+
+
+class _Writer:
+    def __init__(self):
+        self.columns = []
+        self.strings = {}
+        self.fixups = {}
+
+    def ints(self, name, values):
+        self.add(name, array('q', values))
+
+    def add(self, name, column):
+        self.columns.append((name, column))
+
+    def text(self, name, values):
+        # Длина -1 — None
+        if None in values:
+            lengths = array('i', (-1 if value is None else len(value) for value in values))
+            values = [value for value in values if value is not None]
+        else:
+            lengths = array('i', map(len, values))
+        self.add(name + '.len', lengths)
+        self.add(name + '.utf8', ''.join(values).encode('utf-8'))
+
+    def fix(self, table, row, key, value):
+        self.fixups.setdefault(table, {}).setdefault(row, {})[key] = value
+
+    def payload(self):
+        self.add('strings', json.dumps(list(self.strings), ensure_ascii=False).encode('utf-8'))
+        self.add('fixups', json.dumps(self.fixups, ensure_ascii=False).encode('utf-8'))
+        directory, blobs = [], []
+        for name, column in self.columns:
+            if isinstance(column, array):
+                if sys.byteorder == 'big':
+                    column = array(column.typecode, column)
+                    column.byteswap()
+                directory.append([name, column.typecode, len(column) * column.itemsize])
+                blobs.append(column.tobytes())
+            else:
+                directory.append([name, '', len(column)])
+                blobs.append(column)
+        header = json.dumps({'version': VERSION, 'columns': directory}).encode('utf-8')
+        return b''.join((MAGIC, _HEADER.pack(VERSION, len(header)), header, *blobs))
+
+
+_MISSING = object()
+
+
+def _is_int64(value):
+    # Только настоящие int в пределах int64 (bool тоже int, но его сохраняем поправкой)
+    return type(value) is int and _INT_MIN <= value <= _INT_MAX
+
+
+# Колонки одной таблицы (users или orders). Каждое поле сначала
+# проверяется целиком (типы всей колонки за один проход на C), и только
+# если в колонке есть что-то необычное, она разбирается построчно
+class _Table:
+    def __init__(self, writer, name, records):
+        self.writer = writer
+        self.name = name
+        self.records = records
+        # Биты отсутствующих полей; маска строки — биты присутствующих
+        self.absent = array('H', [0]) * len(records)
+
+    def values(self, field, bit, default):
+        # Значения поля; отсутствующее заменяется default, а бит поля в маске строки остается 0
+        try:
+            values = list(map(itemgetter(field), self.records))
+        except KeyError:
+            values = [record.get(field, _MISSING) for record in self.records]
+        if _MISSING in values:
+            absent = self.absent
+            for row, value in enumerate(values):
+                if value is _MISSING:
+                    absent[row] |= bit
+            return [default if value is _MISSING else value for value in values], True
+        return values, False
+
+    def masks(self, typecode, full):
+        if self.absent.count(0) == len(self.absent):
+            return array(typecode, [full]) * len(self.absent)
+        return array(typecode, [full ^ bits for bits in self.absent])
+
+    def fix(self, row, field, value):
+        self.writer.fix(self.name, row, field, value)
+
+    def irregular(self, field, values, good, default, has_missing):
+        # Значения, для которых good() ложно, уходят в поправки, в колонку — default
+        missing_rows = {row for row, record in enumerate(self.records) if field not in record} if has_missing else ()
+        cleaned = []
+        for row, value in enumerate(values):
+            if row not in missing_rows and not good(value):
+                self.fix(row, field, value)
+                value = default
+            cleaned.append(value)
+        return cleaned
+
+    def ints(self, field, bit):
+        values, has_missing = self.values(field, bit, 0)
+        if set(map(type, values)) <= {int}:
+            try:
+                return array('q', values)
+            except OverflowError:
+                pass
+        return array('q', self.irregular(field, values, _is_int64, 0, has_missing))
+
+    def int_lists(self, field, bit):
+        # Списки чисел: длины ('I') и все элементы подряд ('q')
+        lists, _ = self.values(field, bit, [])
+        if set(map(type, lists)) <= {list}:
+            flat = list(chain.from_iterable(lists))
+            if set(map(type, flat)) <= {int}:
+                try:
+                    return array('I', map(len, lists)), array('q', flat)
+                except OverflowError:
+                    pass
+        counts, flat = array('I'), array('q')
+        for row, value in enumerate(lists):
+            if type(value) is list and all(map(_is_int64, value)):
+                counts.append(len(value))
+                flat.extend(value)
+            else:
+                self.fix(row, field, value)
+                counts.append(0)
+        return counts, flat
+
+    def texts(self, field, bit):
+        values, has_missing = self.values(field, bit, None)
+        if not set(map(type, values)) <= {str, type(None)}:
+            values = self.irregular(field, values, lambda value: value is None or type(value) is str,
+                                    None, has_missing)
+        return values
+
+    def enums(self, field, bit):
+        values, has_missing = self.values(field, bit, '')
+        if not set(map(type, values)) <= {str}:
+            values = self.irregular(field, values, lambda value: type(value) is str, '', has_missing)
+        strings = self.writer.strings
+        for value in dict.fromkeys(values):
+            strings.setdefault(value, len(strings))
+        return list(map(strings.__getitem__, values))
+
+    def times(self, field, bit, clock):
+        epoch = '1970-01-01 00:00:00'
+        values, has_missing = self.values(field, bit, epoch)
+        try:
+            if set(map(type, values)) <= {str} and set(map(len, values)) <= {19}:
+                return clock.timestamps(values)
+        except (KeyError, ValueError):
+            pass
+        values = self.irregular(field, values, lambda value: clock.to_int(value) is not None, epoch, has_missing)
+        return array('q', map(clock.to_int, values))
+
+    def keys(self, keys):
+        keys = list(keys)
+        try:
+            ids = array('q', map(int, keys))
+            if list(map(str, ids)) == keys:
+                return ids
+        except (ValueError, OverflowError):
+            pass
+        ids = []
+        for row, key in enumerate(keys):
+            if key.isdigit() and str(int(key)) == key and _is_int64(int(key)):
+                ids.append(int(key))
+            else:
+                self.fix(row, '$key', key)
+                ids.append(0)
+        return array('q', ids)
+
+    def extras(self, fields):
+        known = set(fields)
+        if known.issuperset(set().union(*self.records)):
+            return
+        for row, record in enumerate(self.records):
+            if len(record) > len(known) or not record.keys() <= known:
+                for extra in record.keys() - known:
+                    self.fix(row, extra, record[extra])
+
+
+def dumps(data):
+    clock = _Clock()
+    writer = _Writer()
+
+    # Пользователи
+    users = data.get('users', {})
+    table = _Table(writer, 'users', list(users.values()))
+    writer.add('users.id', table.keys(users))
+    writer.add('users.balance', table.ints('balance', 1))
+    writer.add('users.registration_date', table.times('registration_date', 2, clock))
+    writer.text('users.username', table.texts('username', 4))
+    order_counts, order_ids = table.int_lists('orders', 8)
+    writer.add('users.order_count', order_counts)
+    writer.add('users.orders', order_ids)
+    writer.add('users.mask', table.masks('B', 15))
+    table.extras(USER_FIELDS)
+
+    # Заказы
+    orders = data.get('orders', {})
+    table = _Table(writer, 'orders', list(orders.values()))
+    writer.add('orders.id', table.keys(orders))
+    columns = {}
+    for bit, field in enumerate(ORDER_FIELDS):
+        if field in ENUM_FIELDS:
+            columns[field] = table.enums(field, 1 << bit)
+        elif field in TIME_FIELDS:
+            columns[field] = table.times(field, 1 << bit, clock)
+        elif field in INT_FIELDS:
+            columns[field] = table.ints(field, 1 << bit)
+        else:
+            columns[field] = table.texts(field, 1 << bit)
+    enum_type = 'H' if len(writer.strings) < 2 ** 16 else 'I'
+    for field in ENUM_FIELDS:
+        writer.add(f'orders.{field}', array(enum_type, columns[field]))
+    writer.text('orders.channel', columns['channel'])
+    for field in (*TIME_FIELDS, *INT_FIELDS):
+        writer.add(f'orders.{field}', columns[field])
+    writer.add('orders.mask', table.masks('H', (1 << len(ORDER_FIELDS)) - 1))
+    table.extras(ORDER_FIELDS)
+
+    # Остальное небольшое — как JSON
+    rest = {key: value for key, value in data.items() if key not in ('users', 'orders')}
+    writer.add('rest', json.dumps(rest, ensure_ascii=False).encode('utf-8'))
+    return writer.payload()
+
+
+def _read_columns(payload):
+    if payload[:len(MAGIC)] != MAGIC:
+        raise FormatError("Not a binary database file")
+    version, header_length = _HEADER.unpack_from(payload, len(MAGIC))
+    if version > VERSION:
+        raise FormatError(f"Binary database version {version} is newer than supported {VERSION}")
+    offset = len(MAGIC) + _HEADER.size
+    header = json.loads(payload[offset:offset + header_length])
+    offset += header_length
+    columns = {}
+    for name, typecode, length in header['columns']:
+        chunk = payload[offset:offset + length]
+        if len(chunk) != length:
+            raise FormatError(f"Binary database is truncated at column {name}")
+        offset += length
+        if typecode:
+            column = array(typecode)
+            column.frombytes(chunk)
+            if sys.byteorder == 'big':
+                column.byteswap()
+            columns[name] = column
+        else:
+            columns[name] = chunk
+    return columns
+
+
+def _texts(columns, name):
+    text = columns[name + '.utf8'].decode('utf-8')
+    lengths = columns[name + '.len']
+    if min(lengths, default=0) >= 0:
+        ends = list(accumulate(lengths))
+        return list(map(text.__getitem__, map(slice, [0] + ends[:-1], ends)))
+    values, position = [], 0
+    for length in columns[name + '.len']:
+        if length < 0:
+            values.append(None)
+        else:
+            values.append(text[position:position + length])
+            position += length
+    return values
+
+
+def _apply_fixups(records, keys, fixups):
+    # Поправки: значения вне схемы, лишние ключи и нечисловые ключи ('$key')
+    for row, fields in fixups.items():
+        row = int(row)
+        record = records[row]
+        for field, value in fields.items():
+            if field == '$key':
+                keys[row] = value
+            else:
+                record[field] = value
+
+
+def loads(payload):
+    columns = _read_columns(payload)
+    clock = _Clock()
+    fixups = json.loads(columns['fixups'])
+    strings = json.loads(columns['strings'])
+    data = json.loads(columns['rest'])
+
+    # Пользователи
+    order_ids = columns['users.orders'].tolist()
+    ends = list(accumulate(columns['users.order_count']))
+    user_orders = list(map(order_ids.__getitem__, map(slice, [0] + ends[:-1], ends)))
+    users = [
+        {'balance': balance, 'orders': orders, 'registration_date': registered, 'username': username}
+        for balance, orders, registered, username in zip(
+            columns['users.balance'], user_orders, clock.texts(columns['users.registration_date']),
+            _texts(columns, 'users.username'))
+    ]
+    masks = columns['users.mask']
+    for user, mask in zip(users, masks) if masks.count(15) != len(masks) else ():
+        if mask != 15:
+            for bit, field in enumerate(('balance', 'registration_date', 'username', 'orders')):
+                if not mask & (1 << bit):
+                    del user[field]
+    keys = list(map(str, columns['users.id']))
+    _apply_fixups(users, keys, fixups.get('users', {}))
+    data['users'] = dict(zip(keys, users))
+
+    # Заказы
+    enum = {field: list(map(strings.__getitem__, columns[f'orders.{field}'])) for field in ENUM_FIELDS}
+    orders = [
+        {'user_id': user_id, 'platform': platform, 'service': service, 'channel': channel, 'date': day,
+         'time': time_text, 'amount': amount, 'status': status, 'created_at': created_at,
+         'paid_at': paid_at, 'invoice_id': invoice_id}
+        for user_id, platform, service, channel, day, time_text, amount, status, created_at, paid_at, invoice_id
+        in zip(columns['orders.user_id'], enum['platform'], enum['service'], _texts(columns, 'orders.channel'),
+               enum['date'], enum['time'], columns['orders.amount'], enum['status'],
+               clock.texts(columns['orders.created_at']), clock.texts(columns['orders.paid_at']),
+               columns['orders.invoice_id'])
+    ]
+    full = (1 << len(ORDER_FIELDS)) - 1
+    masks = columns['orders.mask']
+    for order, mask in zip(orders, masks) if masks.count(full) != len(masks) else ():
+        if mask != full:
+            for bit, field in enumerate(ORDER_FIELDS):
+                if not mask & (1 << bit):
+                    del order[field]
+    keys = list(map(str, columns['orders.id']))
+    _apply_fixups(orders, keys, fixups.get('orders', {}))
+    data['orders'] = dict(zip(keys, orders))
+    return data
+
+
+def load(path):
+    with open(path, 'rb') as f:
+        return loads(f.read())
+
+
+def convert(source, target):
+    # JSON → двоичный формат или обратно, в зависимости от исходного файла.
+    # Результат сверяется с исходными данными
+    if is_binary(source):
+        data = load(source)
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        restored = json.loads(payload)
+    else:
+        with open(source, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        payload = dumps(data)
+        restored = loads(payload)
+    if restored != data:
+        raise FormatError("Round trip check failed, target not written")
+    with open(target, 'wb') as f:
+        f.write(payload)
+    return len(data.get('users', {})), len(data.get('orders', {}))
+
+
+if __name__ == "__main__":
+    # python -m storage.binary_format database.json database.bin  (и обратно)
+    if len(sys.argv) != 3:
+        print("Использование: python -m storage.binary_format <исходный файл> <новый файл>")
+        sys.exit(1)
+    users, orders = convert(sys.argv[1], sys.argv[2])
+    print(f"Перенесено пользователей: {users}, заказов: {orders}")
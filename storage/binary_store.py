@@ -0,0 +1,54 @@
+import os
+import json
+import logging
+import tempfile
+
+from storage.json_store import JsonStore, default_db
+from storage.binary_format import dumps, load
+
+logger = logging.getLogger(__name__)
+
+
+# То же хранилище в памяти, что JsonStore, но снимок на диске — в
+# компактном двоичном формате (storage/binary_format.py). Если двоичного
+# файла еще нет, при первом старте читается прежний database.json
+# (import_path), и со следующим сбросом база переезжает в новый формат
+class BinaryStore(JsonStore):
+    def __init__(self, path, admins=(), flush_interval=2.0, flush_threshold=100, import_path=None):
+        self.import_path = import_path
+        super().__init__(path, admins=admins, flush_interval=flush_interval, flush_threshold=flush_threshold)
+
+    def _load(self, admins):
+        # Испорченный файл (FormatError) не подменяется пустой базой: старт падает,
+        # чтобы первый же сброс не затер данные
+        try:
+            data = load(self.path)
+        except FileNotFoundError:
+            if not self.import_path or not os.path.exists(self.import_path):
+                return default_db(admins)
+            logger.info(f"Importing {self.import_path} into binary database {self.path}")
+            with open(self.import_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._dirty += 1
+        for key, value in default_db(admins).items():
+            data.setdefault(key, value)
+        return data
+
+    def _serialize(self):
+        return dumps(self._data)
+
+    def _write_atomic(self, payload):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.db-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
@@ -0,0 +1,21 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+# Подписка на изменения хранилища: callback(event, **data).
+# События: user_created(user_id, user), order_created(order_id, order),
+# order_updated(order_id, order, before), flushed(seconds, records) — после
+# сброса изменений на диск (для json и journal)
+class StoreEvents:
+    _listeners = ()
+
+    def subscribe(self, callback):
+        self._listeners = (*self._listeners, callback)
+
+    def _emit(self, event, **data):
+        for callback in self._listeners:
+            try:
+                callback(event, **data)
+            except Exception as e:
+                logger.error(f"Store listener error on {event}: {e}")
@@ -0,0 +1,104 @@
+import os
+import json
+import time
+import logging
+
+from storage.json_store import JsonStore
+
+logger = logging.getLogger(__name__)
+
+
+# Журнальный режим: каждое изменение дописывается в журнал одной компактной
+# строкой JSON, а database.json служит снимком. Когда журнал вырастает больше
+# max_journal_bytes, он сворачивается в новый снимок. При старте читается
+# снимок и воспроизводится хвост журнала.
+class JournalStore(JsonStore):
+    def __init__(self, path, journal_path, admins=(), flush_interval=2.0, flush_threshold=100,
+                 max_journal_bytes=4 * 1024 * 1024):
+        self.journal_path = journal_path
+        self.max_journal_bytes = max_journal_bytes
+        self._pending = []
+        self._seq = 0
+        super().__init__(path, admins=admins, flush_interval=flush_interval, flush_threshold=flush_threshold)
+
+    def _load(self, admins):
+        data = super()._load(admins)
+        # Записи с номером не больше journal_seq уже вошли в снимок
+        self._seq = data['settings'].get('journal_seq', 0)
+        self._data = data
+        replayed = 0
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # Недописанная строка после аварийной остановки
+                        logger.warning(f"Skipping damaged journal line in {self.journal_path}")
+                        continue
+                    if record['s'] <= self._seq:
+                        continue
+                    self._apply(record)
+                    self._seq = record['s']
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        if replayed:
+            logger.info(f"Replayed {replayed} journal records")
+        return data
+
+    def _record(self, record):
+        self._seq += 1
+        record['s'] = self._seq
+        self._pending.append(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        self._touch()
+
+    @property
+    def journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def flush(self):
+        started = time.perf_counter()
+        with self._write_lock:
+            with self._lock:
+                lines, self._pending = self._pending, []
+                self._dirty = 0
+            if lines:
+                try:
+                    with open(self.journal_path, 'a', encoding='utf-8') as f:
+                        f.write('\n'.join(lines) + '\n')
+                        f.flush()
+                        os.fsync(f.fileno())
+                except Exception:
+                    with self._lock:
+                        self._pending[:0] = lines
+                        self._dirty += len(lines)
+                    raise
+            if self.journal_size > self.max_journal_bytes:
+                self._compact()
+        if lines:
+            self._emit('flushed', seconds=time.perf_counter() - started, records=len(lines))
+        return bool(lines)
+
+    def _compact(self):
+        # Снимок пишется атомарно и помнит номер последней записи, поэтому
+        # падение между записью снимка и очисткой журнала ничего не удвоит
+        with self._lock:
+            self._data['settings']['journal_seq'] = self._seq
+            payload = self._serialize()
+            lines, self._pending = self._pending, []
+            self._dirty = 0
+        try:
+            self._write_atomic(payload)
+        except Exception:
+            with self._lock:
+                self._pending[:0] = lines
+                self._dirty += len(lines)
+            raise
+        with open(self.journal_path, 'w', encoding='utf-8') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        logger.info(f"Journal compacted into {self.path}")
@@ -0,0 +1,395 @@
+import os
+import json
+import time
+import tempfile
+import threading
+import logging
+from bisect import bisect_right, insort
+from datetime import datetime
+
+from storage.events import StoreEvents
+from storage.order_index import OrderIndex, filter_key, matches
+
+logger = logging.getLogger(__name__)
+
+
+def now_str():
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def default_db(admins=()):
+    # База данных по умолчанию
+    return {
+        'users': {},
+        'orders': {},
+        'admins': list(admins),
+        'settings': {}
+    }
+
+
+# Хранилище в памяти процесса: database.json читается один раз при старте,
+# чтения обслуживаются из памяти, а изменения копятся и сбрасываются на диск
+# фоновым потоком (атомарно: временный файл + rename).
+class JsonStore(StoreEvents):
+    def __init__(self, path, admins=(), flush_interval=2.0, flush_threshold=100):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+
+        # _lock защищает данные от сериализации во время изменения,
+        # _write_lock сохраняет порядок записей на диск
+        self._lock = threading.RLock()
+        self._write_lock = threading.Lock()
+        self._dirty = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+
+        self._index = OrderIndex()
+        self._user_ids = []
+        started = time.perf_counter()
+        self._data = self._load(admins)
+        self.load_seconds = time.perf_counter() - started
+        self._index = OrderIndex.build(self._data['orders'])
+        # Номера пользователей по возрастанию для iter_user_ids; новые вставляет _apply
+        self._user_ids = sorted(map(int, self._data['users']))
+        # order_seq — последний выданный номер: заказы, ушедшие в архив, номеров не освобождают
+        self._next_order_id = max(max((int(order_id) for order_id in self._data['orders']), default=0),
+                                  self._data['settings'].get('order_seq', 0)) + 1
+
+        self._thread = threading.Thread(target=self._flush_loop, name='store-flush', daemon=True)
+        self._thread.start()
+
+    def _load(self, admins):
+        # Испорченный файл (JSONDecodeError) не подменяется пустой базой: старт падает,
+        # иначе первый же сброс атомарно заменил бы его пустой базой
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return default_db(admins)
+        for key, value in default_db(admins).items():
+            data.setdefault(key, value)
+        return data
+
+    # Фоновый сброс изменений
+
+    @property
+    def pending_writes(self):
+        return self._dirty
+
+    def _touch(self):
+        self._dirty += 1
+        if self._dirty >= self.flush_threshold:
+            self._wakeup.set()
+
+    # Все изменения описываются компактными записями и проходят через _apply,
+    # чтобы журнальный режим мог писать их в журнал и воспроизводить при старте
+    def _commit(self, record):
+        self._apply(record)
+        self._record(record)
+
+    def _record(self, record):
+        self._touch()
+
+    def _apply(self, record):
+        op = record['op']
+        if op == 'user':
+            if str(record['u']) not in self._data['users']:
+                insort(self._user_ids, int(record['u']))
+            self._data['users'][str(record['u'])] = {
+                'balance': 0,
+                'orders': [],
+                'registration_date': record['at'],
+                'username': record['name']
+            }
+        elif op == 'order':
+            self._data['orders'][str(record['id'])] = record['order']
+            self._index.add(int(record['id']), record['order'])
+            user = self._data['users'].get(str(record['order']['user_id']))
+            if user is not None:
+                user['orders'].append(record['id'])
+        elif op == 'order_update':
+            order = self._data['orders'][str(record['id'])]
+            before = dict(order)
+            order.update(record['fields'])
+            self._index.update(int(record['id']), before, order)
+        elif op == 'orders_removed':
+            removed = {}
+            for order_id in record['ids']:
+                order = self._data['orders'].pop(str(order_id), None)
+                if order is not None:
+                    self._index.remove(int(order_id), order)
+                    removed.setdefault(str(order['user_id']), set()).add(int(order_id))
+            for user_id, order_ids in removed.items():
+                user = self._data['users'].get(user_id)
+                if user is not None:
+                    user['orders'] = [order_id for order_id in user['orders'] if int(order_id) not in order_ids]
+            settings = self._data['settings']
+            settings['order_seq'] = max(settings.get('order_seq', 0), record['seq'])
+        elif op == 'balance':
+            user = self._data['users'][str(record['u'])]
+            user['balance'] = user.get('balance', 0) + record['d']
+        elif op == 'admin_add':
+            self._data['admins'].append(record['u'])
+        elif op == 'admin_remove':
+            self._data['admins'].remove(record['u'])
+        elif op == 'setting':
+            self._data['settings'][record['k']] = record['v']
+        elif op == 'setting_removed':
+            self._data['settings'].pop(record['k'], None)
+        else:
+            raise ValueError(f"Unknown store record: {op}")
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Store flush error: {e}")
+
+    def _serialize(self):
+        return json.dumps(self._data, ensure_ascii=False, separators=(',', ':'))
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                if not self._dirty:
+                    return False
+                started = time.perf_counter()
+                payload = self._serialize()
+                dirty, self._dirty = self._dirty, 0
+            try:
+                self._write_atomic(payload)
+            except Exception:
+                with self._lock:
+                    self._dirty += dirty
+                raise
+        self._emit('flushed', seconds=time.perf_counter() - started, records=dirty)
+        return True
+
+    def _write_atomic(self, payload):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(prefix='.db-', suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def close(self):
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    # Пользователи
+
+    def get_user(self, user_id):
+        return self._data['users'].get(str(user_id))
+
+    def create_user(self, user_id, username):
+        with self._lock:
+            if str(user_id) in self._data['users']:
+                return False
+            self._commit({'op': 'user', 'u': user_id, 'name': username, 'at': now_str()})
+        self._emit('user_created', user_id=user_id, user=self._data['users'][str(user_id)])
+        return True
+
+    def add_balance(self, user_id, amount):
+        # Возвращает (старый баланс, новый баланс) или None, если пользователя нет
+        with self._lock:
+            user = self._data['users'].get(str(user_id))
+            if user is None:
+                return None
+            current_balance = user.get('balance', 0)
+            new_balance = current_balance + amount
+            if new_balance < 0:
+                raise ValueError("negative balance")
+            self._commit({'op': 'balance', 'u': user_id, 'd': amount})
+        return current_balance, new_balance
+
+    def get_balance(self, user_id):
+        user = self._data['users'].get(str(user_id))
+        return None if user is None else user.get('balance', 0)
+
+    def compare_and_set_balance(self, user_id, expected, new_balance):
+        # Меняет баланс, только если он все еще равен expected
+        with self._lock:
+            user = self._data['users'].get(str(user_id))
+            if user is None or user.get('balance', 0) != expected:
+                return False
+            self._commit({'op': 'balance', 'u': user_id, 'd': new_balance - expected})
+        return True
+
+    def add_balances(self, changes):
+        # Пакет изменений {user_id: сумма} под одной блокировкой и одним сбросом на диск.
+        # Возвращает ({user_id: (старый, новый)}, {user_id: 'not_found' | 'negative'})
+        applied, failed = {}, {}
+        with self._lock:
+            for user_id, amount in changes.items():
+                user = self._data['users'].get(str(user_id))
+                if user is None:
+                    failed[user_id] = 'not_found'
+                    continue
+                current_balance = user.get('balance', 0)
+                if current_balance + amount < 0:
+                    failed[user_id] = 'negative'
+                    continue
+                self._commit({'op': 'balance', 'u': user_id, 'd': amount})
+                applied[user_id] = (current_balance, current_balance + amount)
+        if applied:
+            self._wakeup.set()
+        return applied, failed
+
+    def iter_users(self):
+        return iter(list(self._data['users'].items()))
+
+    def iter_user_ids(self, after=0):
+        # Номера пользователей по возрастанию, начиная после after: двоичный поиск
+        # по _user_ids без копии и сортировки. Позиция ищется заново от последнего
+        # отданного номера, так что добавленные по ходу обхода пользователи его не сбивают
+        user_ids = self._user_ids
+        position = bisect_right(user_ids, after)
+        while position < len(user_ids):
+            user_id = user_ids[position]
+            yield user_id
+            position = bisect_right(user_ids, user_id)
+
+    def count_users(self):
+        return len(self._data['users'])
+
+    # Заказы
+
+    def get_order(self, order_id):
+        return self._data['orders'].get(str(order_id))
+
+    def create_order(self, user_id, order):
+        with self._lock:
+            order_id = self._next_order_id
+            self._next_order_id += 1
+            self._commit({'op': 'order', 'id': order_id, 'order': dict(order, user_id=user_id)})
+        self._emit('order_created', order_id=str(order_id), order=self._data['orders'][str(order_id)])
+        return str(order_id)
+
+    def update_order(self, order_id, **fields):
+        with self._lock:
+            order = self._data['orders'].get(str(order_id))
+            if order is None:
+                return None
+            before = dict(order)
+            self._commit({'op': 'order_update', 'id': order_id, 'fields': fields})
+        self._emit('order_updated', order_id=str(order_id), order=order, before=before)
+        return order
+
+    def remove_orders(self, order_ids):
+        # Убирает заказы из базы (после переноса в архив), событий не шлет
+        with self._lock:
+            present = [int(order_id) for order_id in order_ids if str(order_id) in self._data['orders']]
+            if present:
+                self._commit({'op': 'orders_removed', 'ids': present, 'seq': self._next_order_id - 1})
+        return len(present)
+
+    def find_user_orders(self, user_id, status=None):
+        # Идем по списку заказов пользователя, а не по всем заказам
+        user = self._data['users'].get(str(user_id))
+        if user is None:
+            return []
+        orders = []
+        for order_id in user['orders']:
+            order = self._data['orders'].get(str(order_id))
+            if order is not None and (status is None or order['status'] == status):
+                orders.append((str(order_id), order))
+        return orders
+
+    def recent_orders(self, limit):
+        order_ids, _, _ = self._index.page(('all',), limit=limit)
+        return [(str(order_id), self._data['orders'][str(order_id)]) for order_id in reversed(order_ids)]
+
+    def page_orders(self, status=None, platform=None, user_id=None, channel=None, before=None, after=None, limit=10):
+        # Страница заказов от новых к старым по индексу: (заказы, есть_старее, есть_новее)
+        key, check = filter_key(status, platform, user_id, channel)
+        accept = None
+        if check:
+            orders = self._data['orders']
+            accept = lambda order_id: matches(orders[str(order_id)], status, platform, user_id, channel)
+        order_ids, has_older, has_newer = self._index.page(
+            key, before=before, after=after, limit=limit, accept=accept)
+        return [(str(order_id), self._data['orders'][str(order_id)]) for order_id in order_ids], has_older, has_newer
+
+    def iter_orders(self):
+        return iter(list(self._data['orders'].items()))
+
+    def count_orders(self):
+        return len(self._data['orders'])
+
+    def paid_totals(self):
+        paid = [order['amount'] for order in self._data['orders'].values() if order['status'] == 'paid']
+        return len(paid), sum(paid)
+
+    # Админы
+
+    def get_admins(self):
+        return list(self._data['admins'])
+
+    def is_admin(self, user_id):
+        return user_id in self._data['admins']
+
+    def add_admin(self, admin_id):
+        with self._lock:
+            if admin_id in self._data['admins']:
+                return False
+            self._commit({'op': 'admin_add', 'u': admin_id})
+        return True
+
+    def remove_admin(self, admin_id):
+        with self._lock:
+            if admin_id not in self._data['admins']:
+                return False
+            self._commit({'op': 'admin_remove', 'u': admin_id})
+        return True
+
+    # Настройки
+
+    def get_setting(self, key, default=None):
+        return self._data['settings'].get(key, default)
+
+    def set_setting(self, key, value):
+        with self._lock:
+            self._commit({'op': 'setting', 'k': key, 'v': value})
+
+    def delete_setting(self, key):
+        with self._lock:
+            if key not in self._data['settings']:
+                return False
+            self._commit({'op': 'setting_removed', 'k': key})
+        return True
+
+    def compare_and_set_setting(self, key, expected, value):
+        # Записывает value, только если в базе все еще expected (None — ключа нет)
+        with self._lock:
+            if self._data['settings'].get(key) != expected:
+                return False
+            self._commit({'op': 'setting', 'k': key, 'v': value})
+        return True
+
+    def iter_settings(self, prefix):
+        return iter([(key, value) for key, value in list(self._data['settings'].items()) if key.startswith(prefix)])
+
+    def update_setting_set(self, key, add=(), remove=()):
+        # Настройка-список как множество: изменение поверх текущего значения под
+        # блокировкой, а не перезапись прочитанной ранее копией. Возвращает новое множество
+        with self._lock:
+            values = set(self._data['settings'].get(key, []))
+            updated = (values | set(add)) - set(remove)
+            if updated != values:
+                self._commit({'op': 'setting', 'k': key, 'v': sorted(updated)})
+        return updated
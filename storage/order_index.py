@@ -0,0 +1,109 @@
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+
+
+# Ключи индекса, под которыми заказ попадает в отсортированные списки номеров
+def index_keys(order):
+    status = order.get('status')
+    platform = order.get('platform')
+    yield ('all',)
+    yield ('status', status)
+    yield ('platform', platform)
+    yield ('status_platform', status, platform)
+    yield ('user', order.get('user_id'))
+    if order.get('channel'):
+        yield ('channel', order['channel'].lower())
+
+
+def filter_key(status=None, platform=None, user_id=None, channel=None):
+    # Возвращает ключ индекса и признак, что остальные условия надо проверять по заказу
+    if user_id is not None:
+        return ('user', user_id), any(value is not None for value in (status, platform, channel))
+    if channel is not None:
+        return ('channel', channel.lower()), status is not None or platform is not None
+    if status is not None and platform is not None:
+        return ('status_platform', status, platform), False
+    if status is not None:
+        return ('status', status), False
+    if platform is not None:
+        return ('platform', platform), False
+    return ('all',), False
+
+
+def matches(order, status=None, platform=None, user_id=None, channel=None):
+    return ((status is None or order.get('status') == status)
+            and (platform is None or order.get('platform') == platform)
+            and (user_id is None or order.get('user_id') == user_id)
+            and (channel is None or (order.get('channel') or '').lower() == channel.lower()))
+
+
+# Отсортированные списки номеров заказов по статусу, платформе, пользователю
+# и каналу. Обновляются вместе с записью заказов, поэтому страница списка
+# стоит O(log n + размер страницы), а не проход по всей истории.
+class OrderIndex:
+    def __init__(self):
+        self._lists = defaultdict(list)
+
+    @classmethod
+    def build(cls, orders):
+        index = cls()
+        for order_id in sorted(orders, key=int):
+            index.add(int(order_id), orders[order_id])
+        return index
+
+    def add(self, order_id, order):
+        for key in index_keys(order):
+            ids = self._lists[key]
+            if not ids or ids[-1] < order_id:
+                ids.append(order_id)
+            else:
+                insort(ids, order_id)
+
+    def remove(self, order_id, order):
+        for key in index_keys(order):
+            ids = self._lists.get(key)
+            if not ids:
+                continue
+            position = bisect_left(ids, order_id)
+            if position < len(ids) and ids[position] == order_id:
+                del ids[position]
+            if not ids:
+                del self._lists[key]
+
+    def update(self, order_id, before, after):
+        if set(index_keys(before)) != set(index_keys(after)):
+            self.remove(order_id, before)
+            self.add(order_id, after)
+
+    def page(self, key, before=None, after=None, limit=10, accept=None):
+        # Номера от новых к старым: before — следующая страница (старее),
+        # after — предыдущая (новее). accept(order_id) отсеивает номера по
+        # условиям, которых нет в ключе. Возвращает (номера, есть_старее, есть_новее)
+        ids = self._lists.get(key, [])
+        if accept is None:
+            if after is not None:
+                start = bisect_right(ids, after)
+                end = min(start + limit, len(ids))
+            else:
+                end = bisect_left(ids, before) if before is not None else len(ids)
+                start = max(0, end - limit)
+            return ids[start:end][::-1], start > 0, end < len(ids)
+
+        if after is not None:
+            position = bisect_right(ids, after)
+            newer = _walk(ids, position, 1, accept, limit + 1)
+            older = _walk(ids, position - 1, -1, accept, 1)
+            return newer[:limit][::-1], bool(older), len(newer) > limit
+        position = bisect_left(ids, before) if before is not None else len(ids)
+        older = _walk(ids, position - 1, -1, accept, limit + 1)
+        newer = _walk(ids, position, 1, accept, 1)
+        return older[:limit], len(older) > limit, bool(newer)
+
+
+def _walk(ids, position, step, accept, count):
+    found = []
+    while 0 <= position < len(ids) and len(found) < count:
+        if accept(ids[position]):
+            found.append(ids[position])
+        position += step
+    return found
@@ -0,0 +1,457 @@
+import sys
+import json
+import sqlite3
+import threading
+import logging
+
+from storage.events import StoreEvents
+from storage.json_store import now_str
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY,
+    balance INTEGER NOT NULL DEFAULT 0,
+    registration_date TEXT,
+    username TEXT
+);
+CREATE TABLE IF NOT EXISTS orders (
+    order_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL,
+    platform TEXT,
+    service TEXT,
+    channel TEXT,
+    date TEXT,
+    time TEXT,
+    amount INTEGER,
+    status TEXT NOT NULL,
+    created_at TEXT,
+    paid_at TEXT,
+    invoice_id INTEGER,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS orders_user_status ON orders (user_id, status, order_id);
+CREATE INDEX IF NOT EXISTS orders_status ON orders (status);
+CREATE INDEX IF NOT EXISTS orders_platform_status ON orders (platform, status);
+CREATE INDEX IF NOT EXISTS orders_channel ON orders (channel COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS admins (
+    position INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+# Поля заказа, у которых есть свои колонки; остальное хранится в extra (JSON)
+ORDER_COLUMNS = ('user_id', 'platform', 'service', 'channel', 'date', 'time',
+                 'amount', 'status', 'created_at', 'paid_at', 'invoice_id')
+
+ITER_CHUNK = 1000
+
+
+def _split_order(order):
+    columns = {key: order.get(key) for key in ORDER_COLUMNS}
+    extra = {key: value for key, value in order.items() if key not in ORDER_COLUMNS}
+    columns['extra'] = json.dumps(extra, ensure_ascii=False) if extra else None
+    return columns
+
+
+def _order_from_row(row):
+    order = {key: row[key] for key in ORDER_COLUMNS if row[key] is not None or key == 'user_id'}
+    if row['extra']:
+        order.update(json.loads(row['extra']))
+    return order
+
+
+# Тот же набор методов, что и у JsonStore, но данные лежат в SQLite (WAL),
+# а выборки заказов по пользователю и статусу идут по индексам.
+#
+# Методы синхронные и вызываются прямо из хендлеров, поэтому ожидание чужой
+# записи (busy_timeout секунд) останавливает цикл событий — таймаут короткий.
+# Транзакции записи короткие, и дольше блокировку держит только зависший
+# процесс: тогда операция падает с "database is locked", а не вешает бота
+class SqliteStore(StoreEvents):
+    def __init__(self, path, admins=(), busy_timeout=2.0):
+        self.path = path
+        self.load_seconds = 0.0
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=busy_timeout)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+
+        with self._lock:
+            if admins and not self._conn.execute("SELECT 1 FROM admins LIMIT 1").fetchone():
+                self._conn.executemany("INSERT OR IGNORE INTO admins (user_id) VALUES (?)",
+                                       [(admin_id,) for admin_id in admins])
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _query_one(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchone()
+
+    # Транзакция BEGIN IMMEDIATE: запись сразу берет блокировку базы,
+    # поэтому несколько процессов не теряют изменения друг друга
+    def _transaction(self):
+        return _Transaction(self)
+
+    # Совместимость с JsonStore: SQLite пишет сразу, очереди на сброс нет
+
+    @property
+    def pending_writes(self):
+        return 0
+
+    def flush(self):
+        return False
+
+    def close(self):
+        with self._lock:
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.close()
+
+    # Пользователи
+
+    def get_user(self, user_id):
+        row = self._query_one("SELECT * FROM users WHERE user_id = ?", (int(user_id),))
+        if row is None:
+            return None
+        orders = self._query("SELECT order_id FROM orders WHERE user_id = ? ORDER BY order_id", (int(user_id),))
+        return {
+            'balance': row['balance'],
+            'orders': [order['order_id'] for order in orders],
+            'registration_date': row['registration_date'],
+            'username': row['username']
+        }
+
+    def create_user(self, user_id, username):
+        registration_date = now_str()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "INSERT OR IGNORE INTO users (user_id, balance, registration_date, username) VALUES (?, 0, ?, ?)",
+                (int(user_id), registration_date, username))
+        if cursor.rowcount <= 0:
+            return False
+        self._emit('user_created', user_id=user_id, user={
+            'balance': 0, 'orders': [], 'registration_date': registration_date, 'username': username})
+        return True
+
+    def add_balance(self, user_id, amount):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT balance FROM users WHERE user_id = ?", (int(user_id),)).fetchone()
+            if row is None:
+                return None
+            current_balance = row['balance']
+            new_balance = current_balance + amount
+            if new_balance < 0:
+                raise ValueError("negative balance")
+            conn.execute("UPDATE users SET balance = ? WHERE user_id = ?", (new_balance, int(user_id)))
+        return current_balance, new_balance
+
+    def get_balance(self, user_id):
+        row = self._query_one("SELECT balance FROM users WHERE user_id = ?", (int(user_id),))
+        return None if row is None else row['balance']
+
+    def compare_and_set_balance(self, user_id, expected, new_balance):
+        # Условный UPDATE: не меняет баланс, если его успел изменить другой процесс
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE users SET balance = ? WHERE user_id = ? AND balance = ?",
+                                  (new_balance, int(user_id), expected))
+        return cursor.rowcount == 1
+
+    def add_balances(self, changes):
+        # Пакет изменений {user_id: сумма} одной транзакцией
+        applied, failed = {}, {}
+        user_ids = [int(user_id) for user_id in changes]
+        with self._transaction() as conn:
+            balances = {}
+            for start in range(0, len(user_ids), 500):
+                chunk = user_ids[start:start + 500]
+                placeholders = ', '.join('?' for _ in chunk)
+                balances.update(conn.execute(
+                    f"SELECT user_id, balance FROM users WHERE user_id IN ({placeholders})", chunk).fetchall())
+            updates = []
+            for user_id, amount in changes.items():
+                current_balance = balances.get(int(user_id))
+                if current_balance is None:
+                    failed[user_id] = 'not_found'
+                elif current_balance + amount < 0:
+                    failed[user_id] = 'negative'
+                else:
+                    applied[user_id] = (current_balance, current_balance + amount)
+                    updates.append((current_balance + amount, int(user_id)))
+            conn.executemany("UPDATE users SET balance = ? WHERE user_id = ?", updates)
+        return applied, failed
+
+    def iter_users(self):
+        # Без списка заказов: его пришлось бы собирать отдельным запросом на каждого
+        last_id = None
+        while True:
+            if last_id is None:
+                rows = self._query("SELECT * FROM users ORDER BY user_id LIMIT ?", (ITER_CHUNK,))
+            else:
+                rows = self._query("SELECT * FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                                   (last_id, ITER_CHUNK))
+            if not rows:
+                return
+            for row in rows:
+                yield str(row['user_id']), {
+                    'balance': row['balance'],
+                    'registration_date': row['registration_date'],
+                    'username': row['username']
+                }
+            last_id = rows[-1]['user_id']
+
+    def iter_user_ids(self, after=0):
+        # Номера пользователей по возрастанию, начиная после after, пачками по ITER_CHUNK
+        while True:
+            rows = self._query("SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                               (after, ITER_CHUNK))
+            if not rows:
+                return
+            for row in rows:
+                yield row['user_id']
+            after = rows[-1]['user_id']
+
+    def count_users(self):
+        return self._query_one("SELECT COUNT(*) FROM users")[0]
+
+    # Заказы
+
+    def get_order(self, order_id):
+        row = self._query_one("SELECT * FROM orders WHERE order_id = ?", (int(order_id),))
+        return _order_from_row(row) if row is not None else None
+
+    def create_order(self, user_id, order):
+        columns = _split_order(dict(order, user_id=user_id))
+        names = ', '.join(columns)
+        placeholders = ', '.join('?' for _ in columns)
+        with self._transaction() as conn:
+            cursor = conn.execute(f"INSERT INTO orders ({names}) VALUES ({placeholders})", tuple(columns.values()))
+        order_id = str(cursor.lastrowid)
+        self._emit('order_created', order_id=order_id, order=dict(order, user_id=user_id))
+        return order_id
+
+    def update_order(self, order_id, **fields):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT * FROM orders WHERE order_id = ?", (int(order_id),)).fetchone()
+            if row is None:
+                return None
+            before = _order_from_row(row)
+            order = dict(before, **fields)
+            columns = _split_order(order)
+            assignments = ', '.join(f"{name} = ?" for name in columns)
+            conn.execute(f"UPDATE orders SET {assignments} WHERE order_id = ?",
+                         (*columns.values(), int(order_id)))
+        self._emit('order_updated', order_id=str(order_id), order=order, before=before)
+        return order
+
+    def remove_orders(self, order_ids):
+        # Убирает заказы из базы (после переноса в архив); AUTOINCREMENT не выдаст их номера снова
+        order_ids = [int(order_id) for order_id in order_ids]
+        removed = 0
+        with self._transaction() as conn:
+            for start in range(0, len(order_ids), 500):
+                chunk = order_ids[start:start + 500]
+                placeholders = ', '.join('?' for _ in chunk)
+                removed += conn.execute(f"DELETE FROM orders WHERE order_id IN ({placeholders})", chunk).rowcount
+        return removed
+
+    def find_user_orders(self, user_id, status=None):
+        if status is None:
+            rows = self._query("SELECT * FROM orders WHERE user_id = ? ORDER BY order_id", (int(user_id),))
+        else:
+            rows = self._query("SELECT * FROM orders WHERE user_id = ? AND status = ? ORDER BY order_id",
+                               (int(user_id), status))
+        return [(str(row['order_id']), _order_from_row(row)) for row in rows]
+
+    def recent_orders(self, limit):
+        rows = self._query("SELECT * FROM orders ORDER BY order_id DESC LIMIT ?", (limit,))
+        return [(str(row['order_id']), _order_from_row(row)) for row in reversed(rows)]
+
+    def page_orders(self, status=None, platform=None, user_id=None, channel=None, before=None, after=None, limit=10):
+        # Keyset-пагинация по order_id: каждая страница — один проход по индексу
+        conditions, params = [], []
+        for column, value in (('status', status), ('platform', platform), ('user_id', user_id)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if channel is not None:
+            conditions.append("channel = ? COLLATE NOCASE")
+            params.append(channel)
+
+        def select(extra, extra_params, order, count):
+            where = ' AND '.join(conditions + extra) or '1'
+            return self._query(f"SELECT * FROM orders WHERE {where} ORDER BY order_id {order} LIMIT ?",
+                               (*params, *extra_params, count))
+
+        if after is not None:
+            rows = select(["order_id > ?"], [int(after)], 'ASC', limit + 1)
+            has_newer = len(rows) > limit
+            rows = rows[:limit][::-1]
+            has_older = bool(select(["order_id <= ?"], [int(after)], 'DESC', 1))
+        else:
+            extra, extra_params = (["order_id < ?"], [int(before)]) if before is not None else ([], [])
+            rows = select(extra, extra_params, 'DESC', limit + 1)
+            has_older = len(rows) > limit
+            rows = rows[:limit]
+            has_newer = before is not None and bool(select(["order_id >= ?"], [int(before)], 'ASC', 1))
+        return [(str(row['order_id']), _order_from_row(row)) for row in rows], has_older, has_newer
+
+    def iter_orders(self):
+        # Читаем порциями по первичному ключу, не держа блокировку между порциями
+        last_id = 0
+        while True:
+            rows = self._query("SELECT * FROM orders WHERE order_id > ? ORDER BY order_id LIMIT ?",
+                               (last_id, ITER_CHUNK))
+            if not rows:
+                return
+            for row in rows:
+                yield str(row['order_id']), _order_from_row(row)
+            last_id = rows[-1]['order_id']
+
+    def count_orders(self):
+        return self._query_one("SELECT COUNT(*) FROM orders")[0]
+
+    def paid_totals(self):
+        row = self._query_one("SELECT COUNT(*), COALESCE(SUM(amount), 0) FROM orders WHERE status = 'paid'")
+        return row[0], row[1]
+
+    # Админы
+
+    def get_admins(self):
+        return [row['user_id'] for row in self._query("SELECT user_id FROM admins ORDER BY position")]
+
+    def is_admin(self, user_id):
+        return self._query_one("SELECT 1 FROM admins WHERE user_id = ?", (user_id,)) is not None
+
+    def add_admin(self, admin_id):
+        with self._transaction() as conn:
+            cursor = conn.execute("INSERT OR IGNORE INTO admins (user_id) VALUES (?)", (admin_id,))
+            return cursor.rowcount > 0
+
+    def remove_admin(self, admin_id):
+        with self._transaction() as conn:
+            cursor = conn.execute("DELETE FROM admins WHERE user_id = ?", (admin_id,))
+            return cursor.rowcount > 0
+
+    # Настройки
+
+    def get_setting(self, key, default=None):
+        row = self._query_one("SELECT value FROM settings WHERE key = ?", (key,))
+        return json.loads(row['value']) if row is not None else default
+
+    def set_setting(self, key, value):
+        with self._transaction() as conn:
+            conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                         (key, json.dumps(value, ensure_ascii=False)))
+
+    def delete_setting(self, key):
+        with self._transaction() as conn:
+            return conn.execute("DELETE FROM settings WHERE key = ?", (key,)).rowcount > 0
+
+    def compare_and_set_setting(self, key, expected, value):
+        # Записывает value, только если в базе все еще expected (None — ключа нет).
+        # Сравниваются разобранные значения, а не текст JSON; чтение и запись —
+        # одной транзакцией, как в update_setting_set
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+            if (json.loads(row['value']) if row is not None else None) != expected:
+                return False
+            conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                         (key, json.dumps(value, ensure_ascii=False)))
+        return True
+
+    def iter_settings(self, prefix):
+        # Ключи с префиксом: диапазон по первичному ключу, без LIKE и его экранирования
+        rows = self._query("SELECT key, value FROM settings WHERE key >= ? AND key < ? ORDER BY key",
+                               (prefix, prefix + '\uffff'))
+        return iter([(row['key'], json.loads(row['value'])) for row in rows])
+
+    def update_setting_set(self, key, add=(), remove=()):
+        # Настройка-список как множество: чтение и запись одной транзакцией, чтобы
+        # процессы не затирали изменения друг друга. Возвращает новое множество
+        with self._transaction() as conn:
+            row = conn.execute("SELECT value FROM settings WHERE key = ?", (key,)).fetchone()
+            values = set(json.loads(row['value'])) if row is not None else set()
+            updated = (values | set(add)) - set(remove)
+            if updated != values:
+                conn.execute("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                             (key, json.dumps(sorted(updated))))
+        return updated
+
+
+class _Transaction:
+    def __init__(self, store):
+        self.store = store
+
+    def __enter__(self):
+        self.store._lock.acquire()
+        # Если BEGIN не прошел (например, "database is locked"), __exit__ не вызовется —
+        # замок отпускаем здесь, иначе на нем встанут все остальные потоки
+        try:
+            self.store._conn.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.store._lock.release()
+            raise
+        return self.store._conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.store._conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        finally:
+            self.store._lock.release()
+        return False
+
+
+# Разовый перенос database.json в SQLite
+def migrate_json_to_sqlite(json_path, sqlite_path):
+    with open(json_path, 'r') as f:
+        data = json.load(f)
+
+    store = SqliteStore(sqlite_path)
+    with store._transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO users (user_id, balance, registration_date, username) VALUES (?, ?, ?, ?)",
+            [(int(user_id), user.get('balance', 0), user.get('registration_date'), user.get('username'))
+             for user_id, user in data.get('users', {}).items()])
+
+        rows = []
+        for order_id, order in sorted(data.get('orders', {}).items(), key=lambda item: int(item[0])):
+            columns = _split_order(order)
+            rows.append((int(order_id), *columns.values()))
+        if rows:
+            names = ', '.join(('order_id', *ORDER_COLUMNS, 'extra'))
+            placeholders = ', '.join('?' for _ in rows[0])
+            conn.executemany(f"INSERT OR REPLACE INTO orders ({names}) VALUES ({placeholders})", rows)
+
+        conn.executemany("INSERT OR IGNORE INTO admins (user_id) VALUES (?)",
+                         [(admin_id,) for admin_id in data.get('admins', [])])
+        conn.executemany("INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)",
+                         [(key, json.dumps(value, ensure_ascii=False))
+                          for key, value in data.get('settings', {}).items()])
+
+        # order_seq — последний выданный номер, в том числе заказов, ушедших в архив:
+        # AUTOINCREMENT продолжает с него, а не с наибольшего номера в базе
+        order_seq = data.get('settings', {}).get('order_seq', 0)
+        if order_seq and not conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'orders'",
+                                          (order_seq,)).rowcount:
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('orders', ?)", (order_seq,))
+    counts = store.count_users(), store.count_orders()
+    store.close()
+    return counts
+
+
+if __name__ == "__main__":
+    # python -m storage.sqlite_store database.json database.sqlite3
+    if len(sys.argv) != 3:
+        print("Использование: python -m storage.sqlite_store <database.json> <database.sqlite3>")
+        sys.exit(1)
+    users, orders = migrate_json_to_sqlite(sys.argv[1], sys.argv[2])
+    print(f"Перенесено пользователей: {users}, заказов: {orders}")
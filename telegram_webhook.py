@@ -0,0 +1,55 @@
+import hmac
+import asyncio
+import logging
+
+from aiogram import types
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+# Прием обновлений Telegram через вебхук на том же aiohttp-приложении.
+# Каждое обновление обрабатывается отдельной задачей, но одновременно
+# не больше max_in_flight: когда лимит исчерпан, ответ Telegram задерживается,
+# и он сам притормаживает доставку.
+class TelegramWebhook:
+    def __init__(self, dispatcher, bot, secret_token, max_in_flight=100):
+        self.dispatcher = dispatcher
+        self.bot = bot
+        self.secret_token = secret_token
+        self.max_in_flight = max_in_flight
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._tasks = set()
+
+    @property
+    def in_flight(self):
+        return len(self._tasks)
+
+    async def handle(self, request):
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not self.secret_token or not hmac.compare_digest(token, self.secret_token):
+            return web.Response(status=401)
+
+        try:
+            update = types.Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.error(f"Bad Telegram update: {e}")
+            return web.Response(status=400)
+
+        await self._semaphore.acquire()
+        task = asyncio.create_task(self._process(update))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return web.Response()
+
+    async def _process(self, update):
+        try:
+            await self.dispatcher.feed_update(self.bot, update)
+        except Exception as e:
+            logger.error(f"Update {update.update_id} failed: {e}")
+        finally:
+            self._semaphore.release()
+
+    async def drain(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,58 @@
+import os
+import sys
+import asyncio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from accounts import Accounts  # noqa: E402
+from storage import create_store  # noqa: E402
+
+USER = 42
+
+
+def open_accounts(tmp_path, backend, balance):
+    store = create_store(backend, str(tmp_path / 'database.json'), str(tmp_path / 'database.sqlite3'))
+    store.create_user(USER, 'user')
+    store.add_balance(USER, balance)
+    return Accounts(store)
+
+
+def test_concurrent_changes_are_not_lost(tmp_path):
+    # Без замка задачи читают один и тот же баланс; compare-and-set повторяет запись
+    for backend in ('json', 'sqlite'):
+        (tmp_path / backend).mkdir()
+        accounts = open_accounts(tmp_path / backend, backend, 0)
+
+        async def main():
+            await asyncio.gather(*(accounts.change_balance(USER, 10) for _ in range(50)))
+
+        asyncio.run(main())
+        assert accounts.store.get_balance(USER) == 500
+        assert accounts.cas_conflicts > 0
+        accounts.store.close()
+
+
+def test_transaction_orders_read_check_write(tmp_path):
+    # Двойное нажатие "оплатить": оба хендлера проверяют статус заказа, ждут
+    # хранилище и списывают. Заказ должен оплатиться один раз
+    accounts = open_accounts(tmp_path, 'sqlite', 100)
+    store = accounts.store
+    order_id = store.create_order(USER, {'amount': 30, 'status': 'pending_payment'})
+
+    async def pay():
+        async with accounts.transaction(USER):
+            order = await asyncio.to_thread(store.get_order, order_id)
+            if order['status'] != 'pending_payment':
+                return False
+            await accounts.change_balance(USER, -order['amount'])
+            await asyncio.to_thread(store.update_order, order_id, status='paid')
+            return True
+
+    async def main():
+        return await asyncio.gather(pay(), pay())
+
+    assert sorted(asyncio.run(main())) == [False, True]
+    assert store.get_balance(USER) == 70
+    assert accounts.cas_conflicts == 0
+    store.close()
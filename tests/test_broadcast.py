@@ -0,0 +1,130 @@
+import os
+import sys
+import time
+import asyncio
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from broadcast import STATE_KEY, Broadcaster  # noqa: E402
+from storage import create_store  # noqa: E402
+
+USERS = 250
+
+
+class FakeOutbox:
+    # Доставляет сразу и запоминает, кому
+    def __init__(self):
+        self.sent = []
+
+    def send(self, method, chat_id, callback=None, **kwargs):
+        self.sent.append(chat_id)
+        asyncio.get_running_loop().call_soon(callback, chat_id, None)
+
+
+class FakeBot:
+    async def edit_message_text(self, *args, **kwargs):
+        pass
+
+
+def open_store(tmp_path, backend='sqlite'):
+    return create_store(backend, str(tmp_path / 'database.json'), str(tmp_path / 'database.sqlite3'))
+
+
+def make_broadcaster(store, outbox):
+    return Broadcaster(FakeBot(), store, outbox, rate=100000, chunk_size=50, lease=60)
+
+
+def abandoned_state(cursor):
+    return {
+        'status': 'running', 'admin_id': 1, 'from_chat_id': 1, 'message_id': 1, 'progress_message_id': 2,
+        'cursor': cursor, 'total': USERS, 'sent': cursor, 'blocked': 0, 'failed': 0, 'skipped': 0,
+        'started_at': time.time() - 600, 'owner': 'dead', 'heartbeat': time.time() - 600
+    }
+
+
+def test_compare_and_set_setting(tmp_path):
+    for backend in ('json', 'sqlite'):
+        (tmp_path / backend).mkdir()
+        store = open_store(tmp_path / backend, backend)
+        assert store.compare_and_set_setting('k', None, {'v': 1})
+        assert not store.compare_and_set_setting('k', None, {'v': 2})
+        assert not store.compare_and_set_setting('k', {'v': 3}, {'v': 2})
+        assert store.compare_and_set_setting('k', {'v': 1}, {'v': 2})
+        assert store.get_setting('k') == {'v': 2}
+        store.close()
+
+
+def test_abandoned_broadcast_is_resumed_by_one_process(tmp_path):
+    # Два процесса над одной базой одновременно замечают брошенную рассылку
+    stores = [open_store(tmp_path) for _ in range(2)]
+    for user_id in range(1, USERS + 1):
+        stores[0].create_user(user_id, f"user{user_id}")
+    stores[0].set_setting(STATE_KEY, abandoned_state(cursor=100))
+    outbox = FakeOutbox()
+    broadcasters = [make_broadcaster(store, outbox) for store in stores]
+
+    async def main():
+        await asyncio.gather(*(broadcaster._resume_abandoned() for broadcaster in broadcasters))
+        assert sum(broadcaster.running for broadcaster in broadcasters) == 1
+        await asyncio.gather(*(broadcaster._task for broadcaster in broadcasters if broadcaster._task))
+
+    asyncio.run(main())
+    assert sorted(outbox.sent) == list(range(101, USERS + 1))
+    state = stores[0].get_setting(STATE_KEY)
+    assert state['status'] == 'done' and state['sent'] == USERS
+    for store in stores:
+        store.close()
+
+
+def test_cancel_is_not_overwritten_by_owner(tmp_path):
+    store = open_store(tmp_path)
+    for user_id in range(1, USERS + 1):
+        store.create_user(user_id, f"user{user_id}")
+    outbox = FakeOutbox()
+    broadcaster = make_broadcaster(store, outbox)
+
+    async def main():
+        assert broadcaster.begin(1, 1, 1, 2)
+        assert not broadcaster.begin(1, 1, 1, 2)
+        await asyncio.sleep(0)
+        assert broadcaster.cancel()['status'] == 'cancelled'
+        await broadcaster.stop()
+
+    asyncio.run(main())
+    assert store.get_setting(STATE_KEY)['status'] == 'cancelled'
+    assert len(outbox.sent) < USERS
+    store.close()
+
+
+def test_failed_broadcast_can_be_resumed_at_once(tmp_path):
+    store = open_store(tmp_path)
+    for user_id in range(1, USERS + 1):
+        store.create_user(user_id, f"user{user_id}")
+    outbox = FakeOutbox()
+    broadcaster = make_broadcaster(store, outbox)
+    calls = 0
+    send_chunk = broadcaster._send_chunk
+
+    async def flaky_send_chunk(chunk, state):
+        nonlocal calls
+        calls += 1
+        if calls == 2:
+            raise RuntimeError("network down")
+        return await send_chunk(chunk, state)
+
+    broadcaster._send_chunk = flaky_send_chunk
+
+    async def main():
+        assert broadcaster.begin(1, 1, 1, 2)
+        await broadcaster._task
+        state = store.get_setting(STATE_KEY)
+        assert state['status'] == 'running' and state['heartbeat'] == 0 and state['cursor'] == 50
+        # Не дожидаясь lease
+        await broadcaster._resume_abandoned()
+        await broadcaster._task
+
+    asyncio.run(main())
+    assert store.get_setting(STATE_KEY)['status'] == 'done'
+    assert sorted(outbox.sent) == list(range(1, USERS + 1))
+    store.close()
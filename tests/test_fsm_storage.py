@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import asyncio
+
+import pytest
+from aiogram.fsm.storage.base import StorageKey
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from fake_redis import FakeRedis  # noqa: E402
+from fsm_storage import RedisStorage, RespError, SQLiteStorage  # noqa: E402
+
+KEY = StorageKey(bot_id=1, chat_id=42, user_id=42)
+OTHER = StorageKey(bot_id=1, chat_id=43, user_id=43)
+
+
+def run(scenario, **kwargs):
+    # Каждый сценарий получает свой сервер-заглушку и свое хранилище
+    async def main():
+        server = FakeRedis(password=kwargs.pop('password', None))
+        url = await server.start()
+        storage = RedisStorage(url, **kwargs)
+        try:
+            await scenario(storage, server)
+        finally:
+            await storage.close()
+            await server.stop()
+    asyncio.run(main())
+
+
+def test_redis_state_and_data_roundtrip():
+    async def scenario(storage, server):
+        assert await storage.get_state(KEY) is None
+        assert await storage.get_data(KEY) == {}
+
+        await storage.set_state(KEY, 'OrderStates:amount')
+        await storage.set_data(KEY, {'amount': 150, 'platform': 'Телеграм'})
+        assert await storage.get_state(KEY) == 'OrderStates:amount'
+        assert await storage.get_data(KEY) == {'amount': 150, 'platform': 'Телеграм'}
+        assert await storage.get_state(OTHER) is None
+
+        await storage.set_state(KEY, None)
+        await storage.set_data(KEY, {})
+        assert await storage.get_state(KEY) is None
+        assert await storage.get_data(KEY) == {}
+        assert not server.data
+    run(scenario)
+
+
+def test_redis_set_state_is_one_pipeline():
+    async def scenario(storage, server):
+        await storage.set_state(KEY, 'OrderStates:link')
+        await storage.set_data(KEY, {'link': 'https://t.me/x'})
+        server.calls.clear()
+        # Состояние и срок данных — одним конвейером, данные не перечитываются
+        await storage.set_state(KEY, 'OrderStates:confirmation')
+        assert dict(server.calls) == {'SET': 1, 'PERSIST': 1}
+        assert await storage.get_data(KEY) == {'link': 'https://t.me/x'}
+    run(scenario)
+
+
+def test_redis_ttl_per_state():
+    async def scenario(storage, server):
+        await storage.set_state(KEY, 'OrderStates:confirmation')
+        await storage.set_data(KEY, {'amount': 1})
+        state_key, data_key = (name.encode() for name in storage._keys(KEY))
+        assert 0 < server._pttl(state_key) <= 60000
+        assert 0 < server._pttl(data_key) <= 60000
+
+        # Состояние без своего срока: ключи живут бессрочно, срок данных снимается
+        await storage.set_state(KEY, 'OrderStates:amount')
+        assert server._pttl(state_key) == -1
+        assert server._pttl(data_key) == -1
+    run(scenario, state_ttls={'OrderStates:confirmation': 60})
+
+
+def test_redis_subsecond_ttl_expires_instead_of_failing():
+    async def scenario(storage, server):
+        # Срок меньше секунды: раньше превращался в EX 0 (ошибка SET) или EXPIRE 0
+        await storage.set_state(KEY, 'OrderStates:confirmation')
+        await storage.set_data(KEY, {'amount': 1})
+        assert await storage.get_state(KEY) == 'OrderStates:confirmation'
+
+        await storage.set_data(KEY, {'amount': 2})
+        await storage.set_state(KEY, 'OrderStates:confirmation')
+        assert await storage.get_data(KEY) == {'amount': 2}
+
+        await asyncio.sleep(0.4)
+        assert await storage.get_state(KEY) is None
+        assert await storage.get_data(KEY) == {}
+    run(scenario, state_ttls={'OrderStates:confirmation': 0.2})
+
+
+def test_redis_auth_and_errors():
+    async def scenario(storage, server):
+        await storage.set_state(KEY, 'OrderStates:amount')
+        assert server.calls['AUTH'] == 1
+        with pytest.raises(RespError):
+            await storage.client.execute("SET", "key", "value", "EX", 0)
+        # Соединение остается рабочим после ответа-ошибки
+        assert await storage.get_state(KEY) == 'OrderStates:amount'
+    run(scenario, password='secret')
+
+
+def test_redis_reconnects_after_server_restart():
+    async def main():
+        server = FakeRedis()
+        url = await server.start()
+        storage = RedisStorage(url)
+        try:
+            await storage.set_state(KEY, 'OrderStates:amount')
+            data = server.data
+            port = int(url.rsplit(':', 1)[1].split('/')[0])
+            await server.stop()
+            server = FakeRedis()
+            server.data = data
+            await server.start(port=port)
+            assert await storage.get_state(KEY) == 'OrderStates:amount'
+        finally:
+            await storage.close()
+            await server.stop()
+    asyncio.run(main())
+
+
+def test_sqlite_state_data_and_ttl(tmp_path):
+    async def main():
+        storage = SQLiteStorage(str(tmp_path / 'fsm.sqlite3'), state_ttls={'OrderStates:confirmation': 0.2})
+        try:
+            await storage.set_state(KEY, 'OrderStates:amount')
+            await storage.set_data(KEY, {'amount': 150})
+            assert await storage.get_state(KEY) == 'OrderStates:amount'
+            assert await storage.get_data(KEY) == {'amount': 150}
+
+            await storage.set_state(KEY, 'OrderStates:confirmation')
+            assert await storage.get_data(KEY) == {'amount': 150}
+            await asyncio.sleep(0.3)
+            assert await storage.get_state(KEY) is None
+            assert await storage.get_data(KEY) == {}
+        finally:
+            await storage.close()
+    asyncio.run(main())
+
+
+def test_sqlite_does_not_block_event_loop(tmp_path):
+    # Пока другой процесс держит запись, хранилище ждет в потоке, а цикл событий свободен
+    import sqlite3
+
+    path = str(tmp_path / 'fsm.sqlite3')
+
+    async def main():
+        storage = SQLiteStorage(path)
+        blocker = sqlite3.connect(path, isolation_level=None)
+        blocker.execute("BEGIN IMMEDIATE")
+        try:
+            write = asyncio.create_task(storage.set_state(KEY, 'OrderStates:amount'))
+            ticks = 0
+            started = time.monotonic()
+            while time.monotonic() - started < 0.3:
+                await asyncio.sleep(0.01)
+                ticks += 1
+            assert ticks > 10
+            assert not write.done()
+            blocker.execute("COMMIT")
+            await write
+            assert await storage.get_state(KEY) == 'OrderStates:amount'
+        finally:
+            blocker.close()
+            await storage.close()
+    asyncio.run(main())
+
+
+def test_memory_storage_warns_about_ttls(caplog):
+    from fsm_storage import create_fsm_storage
+
+    create_fsm_storage('memory', state_ttls={'OrderStates:confirmation': 1800})
+    assert 'ignores FSM state TTLs' in caplog.text
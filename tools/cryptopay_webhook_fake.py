@@ -0,0 +1,51 @@
+# Локальная замена Crypto Pay: отправляет подписанный вебхук invoice_paid
+#
+#   python tools/cryptopay_webhook_fake.py <invoice_id> <payload> [amount]
+#
+# payload — "<user_id>" для заказа или "deposit_<user_id>" для пополнения.
+# Адрес и токен берутся из WEBHOOK_URL и CRYPTO_BOT_TOKEN.
+import os
+import sys
+import json
+import asyncio
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptopay import sign_webhook_body
+
+
+def build_invoice_paid(invoice_id, payload, amount="1"):
+    return {
+        "update_id": invoice_id,
+        "update_type": "invoice_paid",
+        "request_date": "2024-01-01T00:00:00.000Z",
+        "payload": {
+            "invoice_id": invoice_id,
+            "status": "paid",
+            "asset": "USDT",
+            "amount": amount,
+            "payload": payload
+        }
+    }
+
+
+async def post_signed(url, token, update, signature=None):
+    body = json.dumps(update).encode()
+    headers = {
+        "Content-Type": "application/json",
+        "crypto-pay-api-signature": signature or sign_webhook_body(token, body)
+    }
+    async with aiohttp.ClientSession() as session:
+        async with session.post(url, data=body, headers=headers) as response:
+            return response.status, await response.text()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) not in (3, 4):
+        print("Использование: python tools/cryptopay_webhook_fake.py <invoice_id> <payload> [amount]")
+        sys.exit(1)
+    url = os.getenv('WEBHOOK_URL', 'http://localhost:8080/cryptobot/webhook')
+    update = build_invoice_paid(int(sys.argv[1]), sys.argv[2], *sys.argv[3:])
+    print(*asyncio.run(post_signed(url, os.getenv('CRYPTO_BOT_TOKEN', ''), update)))
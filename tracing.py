@@ -0,0 +1,152 @@
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from datetime import datetime
+
+from aiogram import BaseMiddleware
+
+logger = logging.getLogger(__name__)
+
+# Текущий открытый отрезок (span) трассировки в задаче обновления.
+# Вне трассируемого обновления — None, и запись отрезков ничего не стоит
+_current_span = contextvars.ContextVar('trace_span', default=None)
+_current_trace = contextvars.ContextVar('trace', default=None)
+
+
+class Span:
+    __slots__ = ('name', 'start', 'duration', 'attrs', 'children')
+
+    def __init__(self, name, start, attrs):
+        self.name = name
+        self.start = start
+        self.duration = None
+        self.attrs = attrs
+        self.children = []
+
+    def to_dict(self, origin):
+        data = {'name': self.name, 'start_ms': round((self.start - origin) * 1000, 2),
+                'duration_ms': round((self.duration or 0) * 1000, 2)}
+        data.update(self.attrs)
+        if self.children:
+            data['spans'] = [child.to_dict(origin) for child in self.children]
+        return data
+
+
+class _Trace:
+    __slots__ = ('root', 'handler')
+
+    def __init__(self, root):
+        self.root = root
+        self.handler = None
+
+
+class _SpanScope:
+    __slots__ = ('span', 'token')
+
+    def __init__(self, name, attrs):
+        self.span = Span(name, 0.0, attrs)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        if parent is not None:
+            self.span.start = time.perf_counter()
+            parent.children.append(self.span)
+            self.token = _current_span.set(self.span)
+        else:
+            self.token = None
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.token is not None:
+            self.span.duration = time.perf_counter() - self.span.start
+            if exc_type is not None:
+                self.span.attrs['error'] = exc_type.__name__
+            _current_span.reset(self.token)
+        return False
+
+
+def span(name, **attrs):
+    # with span('render_orders_page'): ... — вложенный отрезок текущей трассировки
+    return _SpanScope(name, attrs)
+
+
+def record_span(name, seconds, **attrs):
+    # Уже завершенная операция (запрос к хранилищу, HTTP-вызов) длительностью seconds
+    parent = _current_span.get()
+    if parent is None:
+        return
+    child = Span(name, time.perf_counter() - seconds, attrs)
+    child.duration = seconds
+    parent.children.append(child)
+
+
+# Трассировка медленных обновлений: доля sample_rate обновлений получает
+# дерево отрезков (хендлер, хранилище, Crypto Pay, Bot API), и те, что
+# дольше slow_seconds, дописываются строкой JSON в path
+class Tracer:
+    def __init__(self, path, slow_seconds=1.0, sample_rate=0.0):
+        self.path = path
+        self.slow_seconds = slow_seconds
+        self.sample_rate = sample_rate
+        self._write_lock = threading.Lock()
+
+    def setup(self, dispatcher):
+        if self.sample_rate <= 0:
+            return
+        dispatcher.update.outer_middleware(_UpdateTracingMiddleware(self))
+        for observer in (dispatcher.message, dispatcher.callback_query):
+            observer.middleware(_HandlerTracingMiddleware())
+
+    def write(self, event, data, trace):
+        user = data.get('event_from_user')
+        record = {
+            'at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'update_id': event.update_id,
+            'type': event.event_type,
+            'handler': trace.handler,
+            'user_id': user.id if user else None,
+            'state': data.get('raw_state'),
+            'duration_ms': round(trace.root.duration * 1000, 2),
+            'spans': [child.to_dict(trace.root.start) for child in trace.root.children]
+        }
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':'))
+        try:
+            with self._write_lock, open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+        except OSError as e:
+            logger.error(f"Can't write trace to {self.path}: {e}")
+
+
+class _UpdateTracingMiddleware(BaseMiddleware):
+    def __init__(self, tracer):
+        self.tracer = tracer
+
+    async def __call__(self, handler, event, data):
+        if random.random() >= self.tracer.sample_rate:
+            return await handler(event, data)
+
+        root = Span('update', time.perf_counter(), {})
+        trace = _Trace(root)
+        span_token = _current_span.set(root)
+        trace_token = _current_trace.set(trace)
+        try:
+            return await handler(event, data)
+        finally:
+            root.duration = time.perf_counter() - root.start
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+            if root.duration >= self.tracer.slow_seconds:
+                self.tracer.write(event, data, trace)
+
+
+class _HandlerTracingMiddleware(BaseMiddleware):
+    async def __call__(self, handler, event, data):
+        trace = _current_trace.get()
+        if trace is None:
+            return await handler(event, data)
+        trace.handler = data['handler'].callback.__name__
+        with span(f"handler.{trace.handler}"):
+            return await handler(event, data)
@@ -0,0 +1,231 @@
+import os
+import sys
+import hmac
+import asyncio
+import logging
+import importlib
+import multiprocessing
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+
+# Номер пользователя из сырого обновления Telegram: message.from,
+# callback_query.from, my_chat_member.from и т.д. Если пользователя нет
+# (например, пост в канале), берем чат.
+def update_user_id(update):
+    for value in update.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get('from') or value.get('user')
+        if isinstance(user, dict) and 'id' in user:
+            return user['id']
+        chat = value.get('chat') or (value.get('message') or {}).get('chat')
+        if isinstance(chat, dict) and 'id' in chat:
+            return chat['id']
+    return 0
+
+
+def invoice_user_id(invoice):
+    # Payload счета: "<user_id>" для заказа или "deposit_<user_id>"
+    payload = str(invoice.get('payload') or '')
+    for part in payload.split('_'):
+        if part.isdigit():
+            return int(part)
+    return 0
+
+
+# Входной процесс: принимает обновления (long polling или вебхук) и
+# раскладывает их по процессам-обработчикам по номеру пользователя. Все
+# обновления одного пользователя попадают в один процесс и обрабатываются
+# по порядку, разные пользователи обрабатываются параллельно на всех ядрах.
+# Общие данные процессы видят через хранилище с конкурентной записью (SQLite).
+# С metrics_port процесс номер i отдает свои метрики на 127.0.0.1:metrics_port + i.
+class WorkerPool:
+    def __init__(self, app_module, count, max_in_flight=100, global_rate=None, done_queue=None,
+                 metrics_port=None):
+        self.app_module = app_module
+        self.count = count
+        self.max_in_flight = max_in_flight
+        self.global_rate = global_rate
+        self.done_queue = done_queue
+        self.metrics_port = metrics_port
+        self._context = multiprocessing.get_context('spawn')
+        self._queues = []
+        self._processes = []
+
+    def start(self):
+        # Общий лимит исходящих сообщений делится между процессами
+        rate = self.global_rate / self.count if self.global_rate else None
+        ports = self.metrics_ports or [None] * self.count
+        for index in range(self.count):
+            queue = self._context.Queue()
+            process = self._context.Process(
+                target=worker_main, name=f"bot-worker-{index}", daemon=True,
+                args=(self.app_module, index, queue, self.max_in_flight, rate, self.done_queue, ports[index]))
+            process.start()
+            self._queues.append(queue)
+            self._processes.append(process)
+        logger.info(f"Started {self.count} update workers")
+
+    def stop(self, timeout=30.0):
+        for queue in self._queues:
+            queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                logger.warning(f"{process.name} did not stop, terminating")
+                process.terminate()
+        self._queues = []
+        self._processes = []
+
+    @property
+    def metrics_ports(self):
+        return [self.metrics_port + index for index in range(self.count)] if self.metrics_port else []
+
+    def alive(self):
+        return sum(process.is_alive() for process in self._processes)
+
+    def worker_for(self, user_id):
+        return user_id % self.count
+
+    def route(self, update):
+        self._queues[self.worker_for(update_user_id(update))].put(('update', update))
+
+    def route_invoice_paid(self, invoice):
+        self._queues[self.worker_for(invoice_user_id(invoice))].put(('invoice_paid', invoice))
+
+    async def on_invoice_paid(self, invoice):
+        # Обработчик для create_webhook_handler: оплата уходит в процесс,
+        # который создавал счет и держит его в своем InvoicePoller
+        self.route_invoice_paid(invoice)
+
+    def webhook_handler(self, secret_token):
+        async def handle(request):
+            token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if not secret_token or not hmac.compare_digest(token, secret_token):
+                return web.Response(status=401)
+            try:
+                update = await request.json()
+            except (ValueError, UnicodeDecodeError) as e:
+                logger.error(f"Bad Telegram update: {e}")
+                return web.Response(status=400)
+            self.route(update)
+            return web.Response()
+        return handle
+
+    async def run_polling(self, bot, allowed_updates=None, timeout=30):
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Polling error: {e}")
+                await asyncio.sleep(5)
+                continue
+            for update in updates:
+                self.route(update.model_dump(mode='json', by_alias=True, exclude_none=True))
+                offset = update.update_id + 1
+
+
+def _load_app(app_module):
+    # При spawn дочерний процесс уже выполнил скрипт запуска как __mp_main__ —
+    # берем его, а не импортируем main.py второй раз (второй бот, второе хранилище)
+    main_module = sys.modules.get('__mp_main__')
+    path = getattr(main_module, '__file__', None) or ''
+    if os.path.splitext(os.path.basename(path))[0] == app_module:
+        return main_module
+    return importlib.import_module(app_module)
+
+
+# Процесс-обработчик: импортирует модуль бота (хендлеры, хранилище, очередь
+# уведомлений) и скармливает диспетчеру обновления из своей очереди
+def worker_main(app_module, index, queue, max_in_flight, global_rate=None, done_queue=None, metrics_port=None):
+    logging.basicConfig(level=logging.INFO)
+    app = _load_app(app_module)
+    if global_rate:
+        app.outbox.set_global_rate(global_rate)
+    asyncio.run(_worker_loop(app, index, queue, max_in_flight, done_queue, metrics_port))
+
+
+async def _worker_loop(app, index, queue, max_in_flight, done_queue, metrics_port=None):
+    from aiogram import types
+    from metrics import start_worker_metrics
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_in_flight)
+    # Замок пользователя и число его обновлений в работе: замок удаляется,
+    # только когда очередь пользователя опустела
+    user_locks = {}
+    tasks = set()
+
+    async def process(user_id, item):
+        kind, payload = item
+        entry = user_locks[user_id]
+        try:
+            # Замки честные (FIFO), поэтому обновления пользователя идут в порядке поступления
+            async with entry[0]:
+                if kind == 'update':
+                    update = types.Update.model_validate(payload, context={"bot": app.bot})
+                    await app.dp.feed_update(app.bot, update)
+                elif kind == 'invoice_paid':
+                    await app.on_cryptobot_invoice_paid(payload)
+        except Exception as e:
+            logger.error(f"Worker {index} failed on {kind}: {e}")
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del user_locks[user_id]
+            semaphore.release()
+            if done_queue is not None:
+                done_queue.put(index)
+
+    def rebuild_stats():
+        fresh = type(app.stats)(app.stats.hourly_retention, app.stats.daily_retention)
+        fresh.rebuild(app.store, app.archive)
+        return fresh
+
+    async def refresh_stats():
+        # Остальные процессы тоже пишут в базу — счетчики периодически сверяются с ней
+        while True:
+            await asyncio.sleep(app.STATS_REFRESH_INTERVAL)
+            try:
+                app.stats.replace_with(await asyncio.to_thread(rebuild_stats))
+            except Exception as e:
+                logger.error(f"Stats refresh failed: {e}")
+
+    # Метрики хендлеров и хранилища копятся здесь — входной процесс собирает их отсюда
+    metrics_runner = None
+    if metrics_port:
+        try:
+            metrics_runner = await start_worker_metrics(metrics_port)
+        except OSError as e:
+            logger.error(f"Worker {index} cannot listen on 127.0.0.1:{metrics_port} for metrics ({e}); "
+                         f"its metrics will be reported as down. Set WORKER_METRICS_PORT to a free port range")
+
+    await app.dp.emit_startup(bot=app.bot)
+    refresher = asyncio.create_task(refresh_stats())
+    try:
+        while True:
+            item = await loop.run_in_executor(None, queue.get)
+            if item is None:
+                break
+            kind, payload = item
+            user_id = update_user_id(payload) if kind == 'update' else invoice_user_id(payload)
+            await semaphore.acquire()
+            entry = user_locks.setdefault(user_id, [asyncio.Lock(), 0])
+            entry[1] += 1
+            task = asyncio.create_task(process(user_id, item))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    finally:
+        refresher.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        await app.dp.emit_shutdown(bot=app.bot)
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        logger.info(f"Worker {index} stopped")